@@ -20,11 +20,14 @@ from typing import Any, Dict, Iterator, List, Optional, Tuple, Union
 # --- this application's modules ---
 from bacpypes3.basetypes import ServicesSupported
 from bacpypes3.errors import NoResponse
+from bacpypes3.primitivedata import ObjectIdentifier
 
 # from ...bokeh.BokehRenderer import BokehPlot
 from ...db.sql import SQLMixin
+from ...tasks.COVAcquisition import COVAcquisition
 from ...tasks.DoOnce import DoOnce
 from ...tasks.Poll import DeviceOneShotPoll
+from ...tasks.PollGroups import PollGroup, PollGroups
 from ..io.IOExceptions import (
     BadDeviceDefinition,
     DeviceNotConnected,
@@ -64,6 +67,8 @@ class DeviceProperties(object):
         self.fast_polling: bool = False
         self.vendor_id: int = 0
         self.ping_failures: int = 0
+        self.rpm_window: int = 2
+        self.db_layout: str = "wide"
 
     @property
     def asdict(self) -> Dict:
@@ -84,11 +89,13 @@ class Device(SQLMixin):
     device_id (int, optional): The BACnet device ID (boid). Defaults to None.
     network (BAC0.scripts.ReadWriteScript.ReadWriteScript, optional): Defined by BAC0.connect(). Defaults to None.
     poll (int, optional): If greater than 0, the device will poll every point each x seconds. Defaults to None.
-    from_backup (str, optional): SQLite backup file. Defaults to None.
+    from_backup (str, optional): SQLite backup file, or folder of the device in a Parquet / Arrow export. Defaults to None.
     segmentation_supported (bool, optional): When set to False, BAC0 will not use read property multiple to poll the device. Defaults to None.
     object_list (list, optional): User can provide a custom object list for the creation of the device. The object list must be built using the same pattern returned by bacpypes when polling the objectList property. Defaults to None.
     auto_save (bool or int, optional): If False or 0, auto_save is disabled. To activate, pass an integer representing the number of polls before auto_save is called. Will write the histories to SQLite db locally. Defaults to None.
     clear_history_on_save (bool, optional): If set to True, will clear device history. Defaults to None.
+    rpm_window (int, optional): Maximum number of ReadPropertyMultiple requests sent to the device at the same time while polling. Defaults to 2.
+    db_layout (str, optional): SQLite layout used by save(). "wide" (one column per point) or "tall" (one indexed row per sample). Defaults to "wide".
 
     """
 
@@ -107,6 +114,9 @@ class Device(SQLMixin):
         clear_history_on_save: bool = False,
         history_size: Optional[int] = None,
         reconnect_on_failure: bool = True,
+        rpm_window: int = 2,
+        db_layout: str = "wide",
+        acquisition: str = "poll",
     ):
         self.properties = DeviceProperties()
         # self.initialized = False
@@ -124,6 +134,13 @@ class Device(SQLMixin):
         self.properties.save_resampling = save_resampling
         self.properties.clear_history_on_save = clear_history_on_save
         self.properties.history_size = history_size
+        self.properties.rpm_window = rpm_window
+        if db_layout not in ("wide", "tall"):
+            raise WrongParameter(f"Unknown db_layout : {db_layout}")
+        self.properties.db_layout = db_layout
+        if acquisition not in ("poll", "cov"):
+            raise WrongParameter(f"Unknown acquisition : {acquisition}")
+        self.properties.acquisition = acquisition
         self._reconnect_on_failure = reconnect_on_failure
 
         self.segmentation_supported = segmentation_supported
@@ -132,13 +149,25 @@ class Device(SQLMixin):
         # self.db = None
         # Todo : find a way to normalize the name of the db
         self.properties.db_name = None
+        self._sql_last_saved = {}
+        self._offline_history = None
 
+        self._points_by_name = {}
+        self._points_by_address = {}
+        self._points_by_object_identifier = {}
         self.points = []
         self._list_of_trendlogs = {}
+        self._rpm_plan = None
+        self._rpm_plans = {}
+        self._rpm_batch_sizer = None
+        self._rpm_errors = {}
+        self._rpm_excluded = set()
 
         self._polling_task = namedtuple("_polling_task", ["task", "running"])
         self._polling_task.task = None
         self._polling_task.running = False
+        self._poll_groups = PollGroups()
+        self._cov_acquisition = None
 
         self._find_overrides_progress = 0.0
         self._find_overrides_running = False
@@ -156,7 +185,9 @@ class Device(SQLMixin):
             self.properties.network = None
             if os.path.isfile(filename):
                 self.properties.db_name = db_name
-
+            elif os.path.isdir(filename):
+                # folder of a device in a Parquet / Arrow export
+                self.properties.db_name = filename
             else:
                 raise FileNotFoundError(f"Can't find {filename} on drive")
         else:
@@ -315,6 +346,53 @@ class Device(SQLMixin):
         for point in self.points:
             point.properties.history_size = size
 
+    @property
+    def poll_groups(self) -> PollGroups:
+        return self._poll_groups
+
+    def add_poll_group(
+        self,
+        name: str,
+        delay: float,
+        *,
+        types: Optional[List[str]] = None,
+        names: Optional[str] = None,
+        tags: Optional[List[Any]] = None,
+    ) -> PollGroup:
+        """
+        Poll some points at their own rate. Groups due at the same time are
+        read with the same requests.
+
+        :param name: (str) name of the group
+        :param delay: (float) seconds between reads of the points
+        :param types: (list) object types of the points (ex. ["analogInput"])
+        :param names: (str) regular expression searched in the point names
+        :param tags: (list) tag ids or (tag id, value) the points must have
+
+        :Example:
+
+        device.add_poll_group("temperatures", 5, names="ZN-T")
+        device.add_poll_group("setpoints", 3600, types=["analogValue"])
+        """
+        group = PollGroup(name, delay, types=types, names=names, tags=tags)
+        self._poll_groups.add(group)
+        self._restart_polling()
+        return group
+
+    def remove_poll_group(self, name: str) -> PollGroup:
+        """
+        Points of the group are read at the device polling delay again
+        """
+        group = self._poll_groups.remove(name)
+        self._restart_polling()
+        return group
+
+    def _restart_polling(self) -> None:
+        # the delay of the polling task depends on the poll groups
+        task = self._polling_task.task
+        if self._polling_task.running and task is not None and task.delay > 0:
+            self.poll(delay=task.period)
+
     @property
     def analog_units(self) -> Dict[str, str]:
         raise NotImplementedError()
@@ -346,17 +424,77 @@ class Device(SQLMixin):
         """
         raise NotImplementedError()
 
+    @property
+    def points(self) -> List[Point]:
+        """
+        List of the points of the device. Assigning a new list rebuilds the
+        lookup indexes (by name, by type and address, by object identifier).
+        """
+        return self._points
+
+    @points.setter
+    def points(self, points: List[Point]) -> None:
+        self._points = points
+        self._index_points()
+
+    def _index_points(self) -> None:
+        """
+        Build the dictionaries used to find a point without scanning
+        self.points.
+        """
+        by_name, by_address, by_object_identifier = {}, {}, {}
+        for point in self._points:
+            by_name.setdefault(point.properties.name, point)
+            try:
+                key = (str(point.properties.type), int(point.properties.address))
+            except (TypeError, ValueError):
+                continue
+            by_address.setdefault(key, point)
+            try:
+                by_object_identifier.setdefault(ObjectIdentifier(key), point)
+            except (TypeError, ValueError):
+                continue
+        self._points_by_name = by_name
+        self._points_by_address = by_address
+        self._points_by_object_identifier = by_object_identifier
+
+    def remove_point(self, point_name: str) -> Point:
+        """
+        Remove a point from the device (it won't be polled anymore)
+
+        :param point_name: (str) name of the point
+        :returns: the removed point
+        """
+        point = self._points_by_name.get(point_name)
+        if point is None:
+            raise ValueError(f"{point_name} doesn't exist in controller")
+        self.points = [each for each in self.points if each is not point]
+        return point
+
+    def _lookup_point(self, objectType: Any, objectAddress: Any = None) -> Point:
+        """
+        Find a point using the indexes. objectType can be an ObjectIdentifier
+        (or a "type:instance" string) when objectAddress is not given.
+        """
+        try:
+            if objectAddress is None:
+                return self._points_by_object_identifier[ObjectIdentifier(objectType)]
+            key = (str(objectType), int(float(objectAddress)))
+            try:
+                return self._points_by_address[key]
+            except KeyError:
+                # type given using another spelling (ex. analog-value)
+                return self._points_by_object_identifier[ObjectIdentifier(key)]
+        except (KeyError, TypeError, ValueError):
+            raise ValueError(
+                f"{objectType} {objectAddress} doesn't exist in controller"
+            ) from None
+
     def find_point(self, objectType: str, objectAddress: float) -> Point:
         """
         Find point based on type and address
         """
-        for point in self.points:
-            if (
-                point.properties.type == objectType
-                and float(point.properties.address) == objectAddress
-            ):
-                return point
-        raise ValueError(f"{objectType} {objectAddress} doesn't exist in controller")
+        return self._lookup_point(objectType, objectAddress)
 
     def find_overrides(self, force: bool = False) -> None:
         if self._find_overrides_running and not force:
@@ -457,12 +595,18 @@ class DeviceConnected(Device):
         if self.properties.pollDelay == 0:
             _poll = DeviceOneShotPoll(self)
             _poll.start()
+        if self.properties.acquisition == "cov" and self.points:
+            self.acquire_by_cov()
         # self.initialized = True
 
     async def _disconnect(self, save_on_disconnect=True, unregister=True):
         self.log(
             f"Wait while stopping polling for {self.properties.name}", level="info"
         )
+        if self._cov_acquisition is not None:
+            # acquisition mode kept for the next connection
+            self._cov_acquisition.stop()
+            self._cov_acquisition = None
         self.poll(command="stop")
         if unregister:
             self.properties.network.unregister_device(self)
@@ -578,11 +722,7 @@ class DeviceConnected(Device):
                 return self.df(point_name, force_read=False)
             elif isinstance(point_name, tuple):
                 _type, _address = point_name
-                for point in self.points:
-                    if point.properties.type == _type and str(
-                        point.properties.address
-                    ) == str(_address):
-                        return point
+                return self._lookup_point(_type, _address)
             else:
                 try:
                     return self._findPoint(point_name, force_read=False)
@@ -611,15 +751,59 @@ class DeviceConnected(Device):
         Allows the syntax:
             if "point_name" in device:
         """
-        return value in self.points_name
+        return value in self._points_by_name
 
     @property
     def pollable_points_name(self):
+        # points read by COV are not polled
+        covered = self._cov_acquisition.covered if self._cov_acquisition else ()
         for each in self.points:
-            if not isinstance(each, VirtualPoint):
-                yield each.properties.name
-            else:
+            if isinstance(each, VirtualPoint) or each.properties.name in covered:
                 continue
+            yield each.properties.name
+
+    def acquire_by_cov(
+        self,
+        *,
+        lifetime: int = 300,
+        confirmed: bool = False,
+        silence: Optional[float] = None,
+    ) -> COVAcquisition:
+        """
+        Read the points by COV when the device supports it. Subscribed points
+        are removed from the polling, and polled again if their subscription
+        fails or if they stop notifying.
+
+        :param lifetime: (int) seconds, lifetime of the subscriptions
+        :param confirmed: (bool) ask for confirmed notifications
+        :param silence: (float) seconds without notification before a point
+            is polled again (defaults to lifetime + 30)
+
+        :Example:
+
+        device.acquire_by_cov(lifetime=300)
+        device.cov_acquisition.metrics
+        """
+        self.stop_cov_acquisition()
+        self.properties.acquisition = "cov"
+        self._cov_acquisition = COVAcquisition(
+            self, lifetime=lifetime, confirmed=confirmed, silence=silence
+        )
+        self._cov_acquisition.start()
+        return self._cov_acquisition
+
+    def stop_cov_acquisition(self) -> None:
+        """
+        Cancel the COV subscriptions, every point is polled again
+        """
+        if self._cov_acquisition is not None:
+            self._cov_acquisition.stop()
+            self._cov_acquisition = None
+            self.properties.acquisition = "poll"
+
+    @property
+    def cov_acquisition(self) -> Optional[COVAcquisition]:
+        return self._cov_acquisition
 
     @property
     def points_name(self):
@@ -699,12 +883,13 @@ class DeviceConnected(Device):
         """
         Used by getter and setter functions
         """
-        for point in self.points:
-            if point.properties.name == name:
-                if force_read:
-                    point.value
-                return point
-        raise ValueError(f"{name} doesn't exist in controller")
+        try:
+            point = self._points_by_name[name]
+        except (KeyError, TypeError):
+            raise ValueError(f"{name} doesn't exist in controller") from None
+        if force_read:
+            point.value
+        return point
 
     def _trendlogs(self):
         for k, v in self._list_of_trendlogs.items():
@@ -937,7 +1122,7 @@ class DeviceDisconnected(Device):
 
     # This should be a "read" function and rpm defined in state rpm
     def read_multiple(
-        self, points_list, *, points_per_request=25, discover_request=(None, 6)
+        self, points_list, *, points_per_request=None, discover_request=(None, 6)
     ):
         raise DeviceNotConnected("Must connect to BACnet or database")
 
@@ -1056,7 +1241,9 @@ class DeviceFromDB(DeviceConnected):
 
         else:
             self.log("Not connected, open DB", level="debug")
-            if from_backup:
+            if from_backup and os.path.isdir(from_backup):
+                self.properties.db_name = from_backup
+            elif from_backup:
                 self.properties.db_name = from_backup.split(".")[0]
             await self._init_state()
 
@@ -1078,12 +1265,17 @@ class DeviceFromDB(DeviceConnected):
         # network = self.properties.network
         pss = self.properties.pss
 
-        self.points = []
-        for point in await self.points_from_sql(self.properties.db_name):
+        # histories are read once, Series are built when a point needs it
+        self._offline_history = await self.offline_history_from_sql(
+            self.properties.db_name
+        )
+        points = []
+        for point in self._offline_history.names:
             try:
-                self.points.append(OfflinePoint(self, point))
+                points.append(OfflinePoint(self, point))
             except RemovedPointException:
                 continue
+        self.points = points
 
         self.properties = DeviceProperties()
         self.properties.db_name = dbname
@@ -1100,6 +1292,7 @@ class DeviceFromDB(DeviceConnected):
         self.properties.auto_save = self._props["auto_save"]
         self.properties.save_resampling = self._props["save_resampling"]
         self.properties.clear_history_on_save = self._props["clear_history_on_save"]
+        self.properties.db_layout = self._props.get("db_layout", "wide")
         self.properties.default_history_size = self._props["history_size"]
         self.log(f"{self.properties.name} restored from db", level="info")
         self.log(
@@ -1116,7 +1309,7 @@ class DeviceFromDB(DeviceConnected):
 
     # This should be a "read" function and rpm defined in state rpm
     def read_multiple(
-        self, points_list, *, points_per_request=25, discover_request=(None, 6)
+        self, points_list, *, points_per_request=None, discover_request=(None, 6)
     ):
         raise DeviceNotConnected("Must connect to BACnet or database")
 
@@ -0,0 +1,349 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+#
+# Copyright (C) 2015 by Christian Tremblay, P.Eng <christian.tremblay@servisys.com>
+# Licensed under LGPLv3, see file LICENSE in this source tree.
+#
+"""
+History.py - Storage of the values read on a point.
+"""
+
+import math
+import time
+import typing as t
+from array import array
+
+# --- standard Python modules ---
+from datetime import datetime, timedelta
+
+# --- this application's modules ---
+from ..utils.lookfordependency import pandas_if_available
+
+_PANDAS, pd, _, _ = pandas_if_available()
+if _PANDAS:
+    import numpy as np
+# ------------------------------------------------------------------------------
+
+_NS_PER_SECOND = 1_000_000_000
+
+
+def local_timezone():
+    return datetime.now().astimezone().tzinfo
+
+
+def ns_to_datetime(timestamp: int, tz=None) -> datetime:
+    """
+    Convert an epoch timestamp in nanoseconds to a timezone aware datetime
+    (local timezone by default)
+    """
+    seconds, ns = divmod(timestamp, _NS_PER_SECOND)
+    return datetime.fromtimestamp(seconds, tz or local_timezone()) + timedelta(
+        microseconds=ns // 1000
+    )
+
+
+class HistoryBuffer(object):
+    """
+    Circular buffer holding the history of a point.
+
+    Timestamps are stored as int64 (nanoseconds since epoch) and values in a
+    typed column : "float" (float64), "int" (int64, used for binary and
+    multistate points) or "object". A missing value (None) is NaN in a float
+    column and is masked in an int column. If a value doesn't fit the column,
+    the buffer falls back to "object".
+
+    With size=None the buffer grows without limit, otherwise the oldest
+    sample is overwritten once size samples are stored.
+
+    appended counts the samples added since the last clear() and generation
+    changes on every clear(); together they tell a reader which samples are
+    new since it last looked at the buffer.
+    """
+
+    _typecodes = {"float": "d", "int": "q"}
+
+    def __init__(self, kind: str = "object", size: t.Optional[int] = None):
+        if kind not in ("float", "int", "object"):
+            raise ValueError(f"Unknown history kind : {kind}")
+        self.kind = kind
+        self.size: t.Optional[int] = None
+        self.generation = 0
+        self.clear()
+        self.resize(size)
+
+    def clear(self) -> None:
+        self._timestamps = array("q")
+        self._values = (
+            array(self._typecodes[self.kind]) if self.kind in self._typecodes else []
+        )
+        self._mask = bytearray() if self.kind == "int" else None
+        self._head = 0
+        self.appended = 0
+        self.generation += 1
+        self._last_valid: t.Tuple[int, int, t.Any] = (-1, 0, None)
+
+    def __len__(self) -> int:
+        return len(self._timestamps)
+
+    def _ordered(self, column):
+        if self._head == 0:
+            return column[:]
+        return column[self._head :] + column[: self._head]  # noqa E203
+
+    def resize(self, size: t.Optional[int]) -> None:
+        """
+        Change the capacity of the buffer, keeping the most recent samples.
+        """
+        if size is not None:
+            size = max(1, int(size))
+        self._timestamps = self._ordered(self._timestamps)
+        self._values = self._ordered(self._values)
+        if self._mask is not None:
+            self._mask = self._ordered(self._mask)
+        self._head = 0
+        if size is not None and len(self._timestamps) > size:
+            del self._timestamps[:-size]
+            del self._values[:-size]
+            if self._mask is not None:
+                del self._mask[:-size]
+        self.size = size
+
+    def _promote(self) -> None:
+        """
+        Store values as Python objects from now on.
+        """
+        values = self._values.tolist()
+        if self.kind == "float":
+            values = [None if math.isnan(v) else v for v in values]
+        elif self.kind == "int":
+            values = [v if valid else None for v, valid in zip(values, self._mask)]
+        self.kind = "object"
+        self._values = values
+        self._mask = None
+
+    def _store(self, value) -> t.Tuple[t.Any, int]:
+        if self.kind == "object":
+            return (value, 1)
+        if value is None:
+            return (math.nan, 0) if self.kind == "float" else (0, 0)
+        try:
+            if self.kind == "float":
+                value = float(value)
+                return (value, 0 if math.isnan(value) else 1)
+            return (int(value), 1)
+        except (TypeError, ValueError, OverflowError):
+            self._promote()
+            return (value, 1)
+
+    def append(self, value, timestamp: t.Optional[int] = None) -> None:
+        """
+        Add a sample. O(1)
+
+        :param value: value read (None if no value)
+        :param timestamp: (int) nanoseconds since epoch, now if not provided
+        """
+        if timestamp is None:
+            timestamp = time.time_ns()
+        stored, valid = self._store(value)
+        if valid:
+            self._last_valid = (self.appended, timestamp, stored)
+        self.appended += 1
+        value = stored
+        if self.size is None or len(self._timestamps) < self.size:
+            self._timestamps.append(timestamp)
+            self._values.append(value)
+            if self._mask is not None:
+                self._mask.append(valid)
+        else:
+            idx = self._head
+            self._timestamps[idx] = timestamp
+            self._values[idx] = value
+            if self._mask is not None:
+                self._mask[idx] = valid
+            self._head = (idx + 1) % self.size
+
+    def _last_index(self) -> int:
+        if not self._timestamps:
+            raise IndexError("History is empty")
+        return (self._head - 1) % len(self._timestamps)
+
+    def last_timestamp(self) -> int:
+        return self._timestamps[self._last_index()]
+
+    def last_value(self):
+        idx = self._last_index()
+        return self._value(idx)
+
+    def last_valid(self) -> t.Tuple[t.Optional[int], t.Any]:
+        """
+        Last sample that is not None, without scanning the buffer. O(1)
+
+        :returns: (timestamp, value) or (None, None)
+        """
+        seq, timestamp, value = self._last_valid
+        if seq < 0 or seq < self.appended - len(self._timestamps):
+            # never read or overwritten, every sample in the buffer is None
+            return (None, None)
+        return (timestamp, value)
+
+    def _value(self, idx):
+        value = self._values[idx]
+        if self.kind == "float" and math.isnan(value):
+            return None
+        if self._mask is not None and not self._mask[idx]:
+            return None
+        return value
+
+    def _tail(self, column, n):
+        start = (self._head - n) % len(self._timestamps)
+        if start < self._head:
+            return column[start : self._head]  # noqa E203
+        return column[start:] + column[: self._head]
+
+    def tail(self, n: int) -> t.Tuple[array, t.List[t.Any]]:
+        """
+        The n most recent samples, oldest first. Cost depends on n, not on
+        the size of the buffer.
+
+        :returns: (timestamps, values) a missing value is None (NaN in a
+            float column)
+        """
+        n = min(n, len(self._timestamps))
+        if n <= 0:
+            return (array("q"), [])
+        values = self._tail(self._values, n)
+        if self.kind != "object":
+            values = values.tolist()
+        if self._mask is not None:
+            values = [
+                v if valid else None
+                for v, valid in zip(values, self._tail(self._mask, n))
+            ]
+        return (self._tail(self._timestamps, n), values)
+
+    def since(self, timestamp: t.Optional[int]) -> t.Tuple[array, t.List[t.Any]]:
+        """
+        Samples newer than timestamp (all samples if None), oldest first.
+        Cost depends on the number of new samples.
+
+        :param timestamp: (int) nanoseconds since epoch
+        :returns: (timestamps, values) like tail()
+        """
+        length = len(self._timestamps)
+        if timestamp is None:
+            return self.tail(length)
+        n = 0
+        while (
+            n < length and self._timestamps[(self._head - 1 - n) % length] > timestamp
+        ):
+            n += 1
+        return self.tail(n)
+
+    def timestamps(self) -> array:
+        """
+        returns: (array) timestamps in nanoseconds, oldest first
+        """
+        return self._ordered(self._timestamps)
+
+    def values(self) -> t.List[t.Any]:
+        """
+        returns: (list) values, oldest first. A missing value is None (NaN in
+            a float column)
+        """
+        return self.tail(len(self._timestamps))[1]
+
+    def datetimes(self, tz=None) -> t.List[datetime]:
+        """
+        returns: (list) timestamps as timezone aware datetime, oldest first
+        """
+        tz = tz or local_timezone()
+        return [ns_to_datetime(ts, tz) for ts in self.timestamps()]
+
+
+class HistorySeries(object):
+    """
+    pandas Series view of a HistoryBuffer. The samples are copied once in
+    contiguous arrays, larger than the history, and each call returns a
+    Series over a slice of them : only the samples appended since the last
+    call are converted and written after the others, the arrays are rebuilt
+    when they are full (at most once every len(history) samples). So a call
+    costs the number of new samples, not the length of the history.
+
+    The Series returned are read-only views, a new one on each call.
+
+    :param history: (HistoryBuffer)
+    :param convert: function applied to each value (ex. state text)
+    """
+
+    def __init__(self, history: HistoryBuffer, convert=None):
+        self._history = history
+        self._convert = convert
+        self.clear()
+
+    def _samples(self, n: int):
+        timestamps, values = self._history.tail(n)
+        if self._convert is not None:
+            values = [self._convert(value) for value in values]
+        # same dtype the Series would infer from the values
+        return timestamps, pd.Series(values).to_numpy()
+
+    def _rebuild(self) -> None:
+        n = len(self._history)
+        capacity = max(2 * n, 64)
+        timestamps, values = self._samples(n)
+        stamps = np.zeros(capacity, dtype="int64")
+        stamps[:n] = timestamps
+        # built once, the new timestamps are then written in place (asi8 is
+        # a view) after the part already handed out
+        self._index = (
+            pd.DatetimeIndex(stamps.view("M8[ns]"))
+            .tz_localize("UTC")
+            .tz_convert(local_timezone())
+        )
+        self._stamps = self._index.asi8
+        self._values = np.empty(capacity, dtype=values.dtype)
+        self._values[:n] = values
+        self._start, self._end = 0, n
+
+    def _extend(self, new: int) -> bool:
+        """
+        Write the new samples after the others, False if they don't fit
+        """
+        if self._end + new > len(self._stamps):
+            return False
+        timestamps, values = self._samples(new)
+        if values.dtype != self._values.dtype and not np.can_cast(
+            values.dtype, self._values.dtype
+        ):
+            return False
+        end = self._end + new
+        self._stamps[self._end : end] = timestamps  # noqa E203
+        self._values[self._end : end] = values  # noqa E203
+        self._end = end
+        return True
+
+    def clear(self) -> None:
+        self._index = None
+        self._key = (None, 0)
+
+    def get(self):
+        """
+        returns: (pd.Series) history, oldest first (read-only)
+        """
+        history = self._history
+        generation, appended = self._key
+        new = history.appended - appended
+        if (
+            self._index is None
+            or generation != history.generation
+            or new >= len(history)
+            or (new and not self._extend(new))
+        ):
+            self._rebuild()
+        self._key = (history.generation, history.appended)
+        # older samples overwritten in the buffer (or buffer resized)
+        self._start = max(self._start, self._end - len(history))
+        window = slice(self._start, self._end)
+        values = self._values[window]
+        values.flags.writeable = False
+        return pd.Series(values, index=self._index[window], copy=False)
@@ -19,7 +19,8 @@ from bacpypes3.basetypes import BinaryPV, PropertyIdentifier
 from bacpypes3.pdu import Address
 
 # --- 3rd party modules ---
-from bacpypes3.primitivedata import Boolean, CharacterString, ObjectIdentifier
+from bacpypes3.primitivedata import Boolean, CharacterString, Null, ObjectIdentifier
+from bacpypes3.vendor import get_vendor_info
 
 from ...tasks.Match import Match, Match_Value
 
@@ -33,8 +34,11 @@ from ..io.IOExceptions import (
 )
 from ..utils.lookfordependency import pandas_if_available
 from ..utils.notes import note_and_log
+from .History import HistoryBuffer, HistorySeries, ns_to_datetime
 
 _PANDAS, pd, sql, Timestamp = pandas_if_available()
+_PRESENT_VALUE = PropertyIdentifier("presentValue")
+_PRIORITY_ARRAY = PropertyIdentifier("priorityArray")
 # ------------------------------------------------------------------------------
 
 
@@ -78,8 +82,8 @@ class Point:
     """
 
     _cache_delta = timedelta(seconds=5)
-    _last_cov_identifier = 0
-    _running_cov_tasks = {}
+    _history_kind = "object"
+    _history_states = "analog"
 
     def __init__(
         self,
@@ -93,7 +97,6 @@ class Point:
         history_size=None,
         tags=[],
     ):
-        self._history = namedtuple("_history", ["timestamp", "value"])
         self.properties = PointProperties()
 
         self._polling_task = namedtuple("_polling_task", ["task", "running"])
@@ -104,11 +107,9 @@ class Point:
         self._match_task.task = None
         self._match_task.running = False
 
-        self._history.timestamp = []
-        self._history.value = []
-        # self._history.value = [presentValue]
-        # self._history.timestamp.append(datetime.now().astimezone())
-
+        self._history = HistoryBuffer(kind=self._history_kind, size=history_size)
+        self._history_series = HistorySeries(self._history, self._history_value)
+        self._history_codes = HistorySeries(self._history)
         self.properties.history_size = history_size
 
         self.properties.device = device
@@ -122,6 +123,8 @@ class Point:
         self.properties.overridden = (False, 0)
 
         self.cov_registered = False
+        # subscription made by the COVManager of the network
+        self.cov_task = None
 
         self.tags = tags
 
@@ -142,13 +145,9 @@ class Point:
             return self._cache["_previous_read"][1]
 
         try:
-            res = await self.properties.device.properties.network.read(
-                "{} {} {} presentValue".format(
-                    self.properties.device.properties.address,
-                    self.properties.type,
-                    str(self.properties.address),
-                ),
-                vendor_id=self.properties.device.properties.vendor_id,
+            address, object_identifier = self._object_reference()
+            res = await self.properties.device.properties.network.readProperty(
+                address, object_identifier, _PRESENT_VALUE
             )
             # self._trend(res)
         except Exception:
@@ -162,13 +161,9 @@ class Point:
         """
         if self.properties.priority_array is not False:
             try:
-                res = await self.properties.device.properties.network.read(
-                    "{} {} {} priorityArray".format(
-                        self.properties.device.properties.address,
-                        self.properties.type,
-                        str(self.properties.address),
-                    ),
-                    vendor_id=self.properties.device.properties.vendor_id,
+                address, object_identifier = self._object_reference()
+                res = await self.properties.device.properties.network.readProperty(
+                    address, object_identifier, _PRIORITY_ARRAY
                 )
                 self.properties.priority_array = []
                 for i, each in enumerate(res):
@@ -189,18 +184,53 @@ class Point:
 
     async def read_property(self, prop):
         try:
-            return await self.properties.device.properties.network.read(
-                "{} {} {} {}".format(
-                    self.properties.device.properties.address,
-                    self.properties.type,
-                    str(self.properties.address),
-                    prop,
-                ),
-                vendor_id=self.properties.device.properties.vendor_id,
+            array_index = None
+            if "@idx:" in str(prop):
+                prop, array_index = prop.split("@idx:")
+                array_index = int(array_index)
+            address, object_identifier = self._object_reference()
+            return await self.properties.device.properties.network.readProperty(
+                address,
+                object_identifier,
+                self._property_identifier(prop),
+                array_index,
             )
         except Exception as e:
             raise Exception(f"Problem reading : {self.properties.name} | {e}")
 
+    def _object_reference(self) -> t.Tuple[Address, ObjectIdentifier]:
+        """
+        Address and ObjectIdentifier of the point, used with the typed network
+        API (readProperty, writeProperty). Built once, then rebuilt only if the
+        device address or vendor changes.
+        """
+        device_properties = self.properties.device.properties
+        key = (device_properties.address, device_properties.vendor_id)
+        ref = getattr(self, "_object_ref", None)
+        if ref is None or ref[0] != key:
+            vendor_info = get_vendor_info(device_properties.vendor_id)
+            ref = (
+                key,
+                Address(device_properties.address),
+                vendor_info.object_identifier(
+                    (self.properties.type, int(self.properties.address))
+                ),
+            )
+            self._object_ref = ref
+        return ref[1], ref[2]
+
+    def _property_identifier(self, prop) -> PropertyIdentifier:
+        """
+        PropertyIdentifier from a property name, a number or @prop_<number>
+        """
+        if isinstance(prop, str):
+            if "@prop_" in prop:
+                prop = prop.split("@prop_")[1]
+            if prop.isdigit():
+                prop = int(prop)
+        vendor_info = get_vendor_info(self.properties.device.properties.vendor_id)
+        return vendor_info.property_identifier(prop)
+
     async def update_bacnet_properties(self):
         """
         Retrieve bacnet properties for this point
@@ -259,29 +289,38 @@ class Point:
             return val
 
     def _trend(self, res: t.Optional[t.Union[float, int, str]]) -> None:
-        now = datetime.now().astimezone()
-        self._history.timestamp.append(now)
-        self._history.value.append(res)
-        if self.properties.device.properties.network.database:
-            self.properties.device.properties.network.database.prepare_point([self])
+        history_size = self.properties.history_size
+        if history_size is not None and history_size < 1:
+            history_size = self.properties.history_size = 1
+        if history_size != self._history.size:
+            self._history.resize(history_size)
+        self._history.append(res)
+        database = self.properties.device.properties.network.database
+        if database:
+            database.add_sample(self, res, self._history.last_timestamp())
 
-        if self.properties.history_size is None:
-            return
-        else:
-            if self.properties.history_size < 1:
-                self.properties.history_size = 1
-            if len(self._history.timestamp) >= self.properties.history_size:
-                try:
-                    self._history.timestamp = self._history.timestamp[
-                        -self.properties.history_size :  # noqa E203
-                    ]
-                    self._history.value = self._history.value[
-                        -self.properties.history_size :  # noqa E203
-                    ]
-                    assert len(self._history.timestamp) == len(self._history.value)
-
-                except Exception:
-                    self._log.exception("Can't append to history")
+    def _history_value(self, value):
+        """
+        Convert a value stored in the history buffer to the value
+        presented in history
+        """
+        return value
+
+    def _history_values(self) -> t.List[t.Any]:
+        return [self._history_value(value) for value in self._history.values()]
+
+    def _history_codes_series(self):
+        """
+        returns: (pd.Series) history as stored, the integer codes of a binary
+            or multistate point
+        """
+        return self._history_codes.get()
+
+    def _history_state_texts(self) -> t.Dict[int, str]:
+        """
+        returns: (dict) state text of each code stored in the history
+        """
+        return {}
 
     @property
     def units(self):
@@ -295,53 +334,41 @@ class Point:
         """
         returns: last value read
         """
-        if _PANDAS:
-            last_val = self.history.dropna()
-            last_val_clean = None if len(last_val) == 0 else last_val.iloc[-1]
-            return last_val_clean
-        else:
-            return self._history.value[-1]
+        _, value = self._history.last_valid()
+        return self._history_value(value)
 
     @property
     def lastTimestamp(self):
         """
         returns: last timestamp read
         """
-        if _PANDAS:
-            last_val = self.history.dropna()
-            last_val_clean = None if len(last_val) == 0 else last_val.index[-1]
-            return last_val_clean
-        else:
-            return self._history.timestamp[-1]
+        timestamp, _ = self._history.last_valid()
+        return None if timestamp is None else ns_to_datetime(timestamp)
 
     @property
     def history(self) -> t.Dict[datetime, t.Union[int, float, str]]:
         """
         returns : (pd.Series) containing timestamp and value of all readings
+
+        The Series is cached, only new readings are added to it.
         """
         if not _PANDAS:
-            return dict(zip(self._history.timestamp, self._history.value))
-        idx = self._history.timestamp.copy()
-        his_table = pd.Series(index=idx, data=self._history.value[: len(idx)])
-        del idx
+            return dict(zip(self._history.datetimes(), self._history_values()))
+        his_table = self._history_series.get()
         his_table.name = ("{}/{}").format(
             self.properties.device.properties.name, self.properties.name
         )
         his_table.units = self.properties.units_state
-        if self.properties.name in self.properties.device.binary_states:
-            his_table.states = "binary"
-        elif self.properties.name in self.properties.device.multi_states:
-            his_table.states = "multistates"
-        else:
-            his_table.states = "analog"
+        his_table.states = self._history_states
         his_table.description = self.properties.description
 
         his_table.datatype = self.properties.type
         return his_table
 
     def clear_history(self):
-        self._history.timestamp = []
-        self._history.value = []
+        self._history.clear()
+        self._history_series.clear()
+        self._history_codes.clear()
 
     def chart(self, remove=False):
         """
@@ -395,15 +422,23 @@ class Point:
                     and float(priority) >= 1
                     and float(priority) <= 16
                 ):
-                    priority = f"{priority}"
+                    priority = int(float(priority))
                 else:
                     raise ValueError("Priority must be a number between 1 and 16")
-            req = f"{self.properties.device.properties.address} {self.properties.type} {self.properties.address} {prop} {value} - {priority}"
-            # self.log(req, level='info')
+            else:
+                priority = None
+            # value is sent as text (like the string API does) and bacpypes3
+            # casts it to the property datatype
+            value = Null(()) if str(value) == "null" else str(value)
+            address, object_identifier = self._object_reference()
+            network = self.properties.device.properties.network
             try:
-                response = await self.properties.device.properties.network._write(
-                    req,
-                    vendor_id=self.properties.device.properties.vendor_id,
+                response = await network.writeProperty(
+                    address,
+                    object_identifier,
+                    self._property_identifier(prop),
+                    value,
+                    priority=priority,
                 )
                 # print(response)
                 self.log(f"Write response : {response}", level="debug")
@@ -630,38 +665,30 @@ class Point:
         Subscribes to the Change of Value (COV) service for this point.
 
         The COV service allows the device to notify the application of changes to the value of a property.
-        This method sets up the subscription and starts an asynchronous task to listen for these notifications.
+        The subscription is made, and renewed before it expires, by the COV manager of the network
+        (network.cov_manager) which adds the notified values to the history of the point.
 
         Args:
             confirmed (bool, optional): If True, the device will wait for a confirmation from the application
-                after sending a COV notification. Defaults to True.
-            lifetime (int, optional): The lifetime of the subscription in seconds. If None, the subscription
-                will last indefinitely. Defaults to None.
-            callback (function, optional): A function to be called when a COV notification is received.
-                The function should accept two arguments: the sender (the device) and the args (the notification).
-
-        Raises:
-            RuntimeError: If the task is already running, a RuntimeError will be raised.
+                after sending a COV notification. Defaults to False.
+            lifetime (int, optional): The lifetime of the subscription in seconds, renewed before it
+                expires. 0 for a subscription without expiry. Defaults to 900.
 
         Returns:
-            None
+            None, the subscription is in self.cov_task (check cov_task.active or cov_task.error)
         """
-        self.cov_task = COVSubscription(
-            point=self, confirmed=confirmed, lifetime=lifetime
+        self.log(f"Subscribing to COV for {self.properties.name}", level="info")
+        network = self.properties.device.properties.network
+        self.cov_task = network.cov_manager.subscribe(
+            self, confirmed=confirmed, lifetime=lifetime
         )
-        Point._running_cov_tasks[self.cov_task.process_identifier] = self.cov_task
-        self.cov_task.task = asyncio.create_task(self.cov_task.run())
 
     async def cancel_cov(self):
         self.log(f"Canceling COV subscription for {self.properties.name}", level="info")
-        process_identifer = self.cov_task.process_identifier
-
-        if process_identifer not in Point._running_cov_tasks:
-            await self.response("COV subscription not found")
+        if self.cov_task is None or self.cov_task.cancelled:
+            self.log("COV subscription not found", level="warning")
             return
-        cov_subscription = Point._running_cov_tasks.pop(process_identifer)
-        cov_subscription.stop()
-        # await cov_subscription.task
+        self.cov_task.stop()
 
     def update_description(self, value):
         asyncio.create_task(self._update_description(value=value))
@@ -687,19 +714,19 @@ class Point:
         They will be included if InfluxDB is used.
         """
         if lst is None:
-            self.tag.append((tag_id, tag_value))
-        else:
-            for each in lst:
-                tag_id, tag_value = each
-                self.tag.append((tag_id, tag_value))
+            lst = [(tag_id, tag_value)]
+        # new list, the default one is shared by the points
+        self.tags = self.tags + [tuple(each) for each in lst]
+        # InfluxDB tags are formatted again on next sample
+        self._line_protocol = None
 
     async def _update_value(self):
         await asyncio.wait_for(self.value, timeout=1.0)
 
     def _update_value_if_required(self):
+        last_timestamp = ns_to_datetime(self._history.last_timestamp())
         value_too_old = (
-            self._history.timestamp[-1]
-            > datetime.now().astimezone() - Point._cache_delta
+            last_timestamp > datetime.now().astimezone() - Point._cache_delta
         )
         if value_too_old:
             try:
@@ -708,11 +735,9 @@ class Point:
             except Exception as e:
                 self.log(f"Error updating value : {e}", level="error")
                 return self.lastValue
-        if datetime.now().astimezone() - self._history.timestamp[-1] > timedelta(
-            seconds=60
-        ):
+        if datetime.now().astimezone() - last_timestamp > timedelta(seconds=60):
             self.log(
-                f"Last known value {self._history.value[-1]} with timestamp of {self._history.timestamp[-1]}, older than 10sec {datetime.now().astimezone()}. Consider using dev['point'].lastValue if you trust polling of device of manage a up to date read in asynchronous side of your app for better precision",
+                f"Last known value {self._history_value(self._history.last_value())} with timestamp of {last_timestamp}, older than 10sec {datetime.now().astimezone()}. Consider using dev['point'].lastValue if you trust polling of device of manage a up to date read in asynchronous side of your app for better precision",
                 level="warning",
             )
         return self.lastValue
@@ -726,6 +751,8 @@ class NumericPoint(Point):
     Representation of a Numeric value
     """
 
+    _history_kind = "float"
+
     def __init__(
         self,
         device=None,
@@ -778,7 +805,9 @@ class NumericPoint(Point):
                 raise WritePropertyException(f"Problem writing to device : {error}")
 
     def __repr__(self):
-        val = self.lastValue if self.lastValue is not None else "NaN"
+        val = self.lastValue
+        # no value yet, formatted as nan
+        val = float("nan") if val is None else val
         return f"{self.properties.device.properties.name}/{self.properties.name} : {val:.2f} {self.properties.units_state}"
 
     def __add__(self, other):
@@ -828,6 +857,9 @@ class BooleanPoint(Point):
     Representation of a Boolean value
     """
 
+    _history_kind = "int"
+    _history_states = "binary"
+
     def __init__(
         self,
         device=None,
@@ -854,9 +886,17 @@ class BooleanPoint(Point):
 
     def _trend(self, res):
         if res is not None:
-            res = "1: active" if res == BinaryPV.active else "0: inactive"
+            res = 1 if res == BinaryPV.active else 0
         super()._trend(res)
 
+    def _history_value(self, value):
+        if value is None:
+            return None
+        return "1: active" if value else "0: inactive"
+
+    def _history_state_texts(self):
+        return {0: "inactive", 1: "active"}
+
     @property
     async def value(self):
         """
@@ -963,6 +1003,9 @@ class EnumPoint(Point):
     Representation of an Enumerated (multiState) value
     """
 
+    _history_kind = "int"
+    _history_states = "multistates"
+
     def __init__(
         self,
         device=None,
@@ -989,10 +1032,16 @@ class EnumPoint(Point):
             [str(x) for x in units_state] if units_state else []
         )
 
-    def _trend(self, res):
-        if res is not None:
-            res = f"{res}: {self.get_state(res)}"
-        super()._trend(res)
+    def _history_value(self, value):
+        if value is None:
+            return None
+        return f"{value}: {self.get_state(value)}"
+
+    def _history_state_texts(self):
+        return {
+            code: self.get_state(code)
+            for code in range(1, len(self.properties.units_state or ()) + 1)
+        }
 
     @property
     async def value(self):
@@ -1268,16 +1317,36 @@ class OfflinePoint(Point):
         self.__class__ = newstate
 
 
-class NumericPointOffline(NumericPoint):
+class OfflineHistoryMixin:
+    """
+    History of an offline point, taken from the SQLHistory loaded once by
+    DeviceFromDB
+    """
+
     @property
     def history(self):
-        his = self.properties.device._read_from_sql(
-            'select * from "history"',
-            self.properties.device.properties.db_name,
-        )
-        his.index = his["index"].apply(Timestamp)
-        return his.set_index("index")[self.properties.name]
+        return self.properties.device._offline_history.series(self.properties.name)
+
+    def _history_codes_series(self):
+        return self.history
+
+    def _offline_last(self):
+        try:
+            return self.properties.device._offline_history.last(self.properties.name)
+        except IndexError:
+            # never read, or only NaN samples
+            return (None, None)
+
+    @property
+    def lastValue(self):
+        return self._offline_last()[1]
 
+    @property
+    def lastTimestamp(self):
+        return self._offline_last()[0]
+
+
+class NumericPointOffline(OfflineHistoryMixin, NumericPoint):
     @property
     def value(self):
         """
@@ -1314,16 +1383,7 @@ class NumericPointOffline(NumericPoint):
         )
 
 
-class BooleanPointOffline(BooleanPoint):
-    @property
-    def history(self):
-        his = self.properties.device._read_from_sql(
-            'select * from "history"',
-            self.properties.device.properties.db_name,
-        )
-        his.index = his["index"].apply(Timestamp)
-        return his.set_index("index")[self.properties.name]
-
+class BooleanPointOffline(OfflineHistoryMixin, BooleanPoint):
     @property
     def value(self):
         try:
@@ -1345,16 +1405,7 @@ class BooleanPointOffline(BooleanPoint):
         raise OfflineException("Must be online to write")
 
 
-class EnumPointOffline(EnumPoint):
-    @property
-    def history(self):
-        his = self.properties.device._read_from_sql(
-            'select * from "history"',
-            self.properties.device.properties.db_name,
-        )
-        his.index = his["index"].apply(Timestamp)
-        return his.set_index("index")[self.properties.name]
-
+class EnumPointOffline(OfflineHistoryMixin, EnumPoint):
     @property
     def value(self):
         """
@@ -1394,16 +1445,7 @@ class EnumPointOffline(EnumPoint):
         raise OfflineException("Must be online to write")
 
 
-class StringPointOffline(EnumPoint):
-    @property
-    def history(self):
-        his = self.properties.device._read_from_sql(
-            'select * from "history"',
-            self.properties.device.properties.db_name,
-        )
-        his.index = his["index"].apply(Timestamp)
-        return his.set_index("index")[self.properties.name]
-
+class StringPointOffline(OfflineHistoryMixin, EnumPoint):
     @property
     def value(self):
         """
@@ -1430,78 +1472,6 @@ class StringPointOffline(EnumPoint):
         raise OfflineException("Must be online to write")
 
 
-class COVSubscription:
-    def __init__(
-        self, point: Point = None, lifetime: int = 900, confirmed: bool = False
-    ):
-        self.address = Address(point.properties.device.properties.address)
-        self.cov_fini = asyncio.Event()
-        self.task = None
-        self.obj_identifier = ObjectIdentifier(
-            (point.properties.type, int(point.properties.address))
-        )
-        self._app = point.properties.device.properties.network.this_application.app
-        self.process_identifier = Point._last_cov_identifier + 1
-        Point._last_cov_identifier = self.process_identifier
-
-        self.point = point
-        self.lifetime = lifetime
-        self.confirmed = confirmed
-
-    async def run(self):
-        self.point.cov_registered = True
-        self.point.log(
-            f"Subscribing to COV for {self.point.properties.name}", level="info"
-        )
-
-        try:
-            async with self._app.change_of_value(
-                self.address,
-                self.obj_identifier,
-                self.process_identifier,
-                self.confirmed,
-                self.lifetime,
-            ) as scm:
-                cov_fini_task_monitor = asyncio.create_task(self.cov_fini.wait())
-                while not self.cov_fini.is_set():
-                    incoming: asyncio.Future = asyncio.ensure_future(scm.get_value())
-                    done, pending = await asyncio.wait(
-                        [
-                            incoming,
-                        ],
-                        return_when=asyncio.FIRST_COMPLETED,
-                    )
-                    for task in pending:
-                        task.cancel()
-
-                    if incoming in done:
-                        property_identifier, property_value = incoming.result()
-                        self.point.log(
-                            f"COV notification received for {self.point.properties.name} | {property_identifier} -> {type(property_identifier)} with value {property_value} | {property_value} -> {type(property_value)}",
-                            level="info",
-                        )
-                        if property_identifier == PropertyIdentifier.presentValue:
-                            val = extract_value_from_primitive_data(property_value)
-                            self.point._trend(val)
-                        elif property_identifier == PropertyIdentifier.statusFlags:
-                            self.point.properties.status_flags = property_value
-                        else:
-                            self.point._log.warning(
-                                f"Unsupported COV property identifier {property_identifier}"
-                            )
-                await cov_fini_task_monitor
-        except Exception as e:
-            self.point.log(f"Error in COV subscription : {e}", level="error")
-
-    def stop(self):
-        self.point.log(
-            f"Stopping COV subscription class for {self.point.properties.name}",
-            level="debug",
-        )
-        self.cov_fini.set()
-        self.point.cov_registered = False
-
-
 class OfflineException(Exception):
     pass
 
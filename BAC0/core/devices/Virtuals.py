@@ -14,8 +14,6 @@ from collections import namedtuple
 
 
 # --- standard Python modules ---
-from datetime import datetime
-
 from bacpypes3.basetypes import EngineeringUnits
 
 from ...tasks.Match import Match_Value
@@ -23,6 +21,7 @@ from ...tasks.Match import Match_Value
 # --- this application's modules ---
 from ..utils.notes import note_and_log
 from ..utils.lookfordependency import pandas_if_available
+from .History import HistoryBuffer, HistorySeries, ns_to_datetime
 
 _PANDAS, pd, _, _ = pandas_if_available()
 # ------------------------------------------------------------------------------
@@ -130,9 +129,8 @@ class VirtualPoint:
         self.tags = tags
         self._history_fn = history_fn
 
-        self._history = namedtuple("_history", ["timestamp", "value"])
-        self._history.timestamp = []
-        self._history.value = []
+        self._history = HistoryBuffer(kind="float", size=self.properties.history_size)
+        self._history_series = HistorySeries(self._history)
 
         self._match_task = namedtuple("_match_task", ["task", "running"])
         self._match_task.task = None
@@ -161,39 +159,23 @@ class VirtualPoint:
             )
 
     def _trend(self, res):
-        self._history.timestamp.append(datetime.now().astimezone())
-        self._history.value.append(res)
-        if self.properties.device.properties.network.database:
-            self.properties.device.properties.network.database.prepare_point([self])
-
-        if self.properties.history_size is None:
-            return
-        else:
-            if self.properties.history_size < 1:
-                self.properties.history_size = 1
-            if len(self._history.timestamp) >= self.properties.history_size:
-                try:
-                    self._history.timestamp = self._history.timestamp[
-                        -self.properties.history_size :
-                    ]
-                    self._history.value = self._history.value[
-                        -self.properties.history_size :
-                    ]
-                    assert len(self._history.timestamp) == len(self._history.value)
-                except Exception:
-                    self._log.exception("Can't append to history")
+        history_size = self.properties.history_size
+        if history_size is not None and history_size < 1:
+            history_size = self.properties.history_size = 1
+        if history_size != self._history.size:
+            self._history.resize(history_size)
+        self._history.append(res)
+        database = self.properties.device.properties.network.database
+        if database:
+            database.add_sample(self, res, self._history.last_timestamp())
 
     @property
     def lastTimestamp(self):
         """
         returns: last timestamp read
         """
-        if _PANDAS:
-            last_val = self.history.dropna()
-            last_val_clean = None if len(last_val) == 0 else last_val.index[-1]
-            return last_val_clean
-        else:
-            return self._history.timestamp[-1]
+        timestamp, _ = self._history.last_valid()
+        return None if timestamp is None else ns_to_datetime(timestamp)
 
     @property
     async def value(self):
@@ -207,10 +189,9 @@ class VirtualPoint:
         """
         returns: last value read
         """
-        if _PANDAS:
+        if self._history_fn is not None:
             return self.history.dropna().iloc[-1]
-        else:
-            return self._history.value[-1]
+        return self._history.last_valid()[1]
 
     @property
     def history(self):
@@ -221,10 +202,8 @@ class VirtualPoint:
             return self._history_fn()
         else:
             if not _PANDAS:
-                return dict(zip(self._history.timestamp, self._history.value))
-            idx = self._history.timestamp.copy()
-            his_table = pd.Series(index=idx, data=self._history.value[: len(idx)])
-            del idx
+                return dict(zip(self._history.datetimes(), self._history.values()))
+            his_table = self._history_series.get()
             his_table.name = ("{}/{}").format(
                 self.properties.device.properties.name, self.properties.name
             )
@@ -280,11 +259,11 @@ class VirtualPoint:
         They will be included if InfluxDB is used.
         """
         if lst is None:
-            self.tag.append((tag_id, tag_value))
-        else:
-            for each in lst:
-                tag_id, tag_value = each
-                self.tag.append((tag_id, tag_value))
+            lst = [(tag_id, tag_value)]
+        # new list, the default one is shared by the points
+        self.tags = self.tags + [tuple(each) for each in lst]
+        # InfluxDB tags are formatted again on next sample
+        self._line_protocol = None
 
     def __repr__(self):
         return "{}/{} : {:.2f} {}".format(
@@ -8,20 +8,26 @@
 read_mixin.py - Add ReadProperty and ReadPropertyMultiple to a device
 """
 # --- standard Python modules ---
+import asyncio
 import typing as t
 
+# --- 3rd party modules ---
+from bacpypes3.basetypes import ErrorType, Segmentation
+from bacpypes3.pdu import Address
+from bacpypes3.vendor import get_vendor_info
+
 # --- this application's modules ---
 from ....tasks.Poll import DeviceFastPoll, DeviceNormalPoll
 from ...io.IOExceptions import (
     BufferOverflow,
     NoResponseFromController,
     SegmentationNotSupported,
+    UnknownObjectError,
+    UnknownPropertyError,
 )
 from ..Points import BooleanPoint, DateTimePoint, EnumPoint, NumericPoint, StringPoint
 from ..Trends import TrendLog
 
-# --- 3rd party modules ---
-
 
 # from ...functions.Schedule import Schedule
 
@@ -58,6 +64,122 @@ class TrendLogCreationException(Exception):
     pass
 
 
+class RPMPlan:
+    """
+    A list of points compiled into ReadPropertyMultiple parameter lists.
+    Each batch is (parameter_list, points) where parameter_list is ready to be
+    sent using the network readPropertyMultiple and points are the Point
+    objects receiving the values, in the same order.
+    """
+
+    def __init__(self, key, address, batches):
+        self.key = key
+        self.address = address
+        self.batches = batches
+
+    def __len__(self):
+        return len(self.batches)
+
+
+# Rough size (bytes) of a presentValue encoded in a ReadPropertyMultiple-ACK,
+# by object type. Used to keep responses under maxApduLengthAccepted when the
+# device can't send segmented responses.
+RPM_VALUE_SIZE = {
+    "analog": 5,
+    "loop": 5,
+    "binary": 2,
+    "multistate": 3,
+    "integer": 5,
+    "positiveinteger": 5,
+    "largeanalog": 9,
+    "datetime": 12,
+    "characterstring": 64,
+}
+RPM_DEFAULT_VALUE_SIZE = 16
+# object identifier, property identifier and opening/closing tags
+RPM_RESULT_OVERHEAD = 12
+# APDU header of the ComplexACK
+RPM_ACK_HEADER = 8
+# compiled plans kept by a device (one per list of points read)
+RPM_PLANS_CACHED = 8
+
+
+def rpm_response_size(object_type):
+    """
+    Estimated number of bytes used by one object/presentValue in a
+    ReadPropertyMultiple-ACK
+    """
+    _type = str(object_type).replace("-", "").lower()
+    for key, size in RPM_VALUE_SIZE.items():
+        if _type.startswith(key):
+            return RPM_RESULT_OVERHEAD + size
+    return RPM_RESULT_OVERHEAD + RPM_DEFAULT_VALUE_SIZE
+
+
+class RPMBatchSizer:
+    """
+    Number of properties sent in each ReadPropertyMultiple request to a device.
+
+    The size is adjusted AIMD-style : it grows by one after a few clean poll
+    cycles and is cut in half when a request is refused for being too big
+    (segmentation not supported, buffer overflow). The size that failed
+    becomes the ceiling so the size settles just below it instead of being
+    probed over and over.
+
+    When the device can't send segmented responses, max_response_size gives
+    the byte budget (its maxApduLengthAccepted) used to build the requests.
+    """
+
+    def __init__(self, initial=25, minimum=1, maximum=100, grow_after=3):
+        self.size = initial
+        self.minimum = minimum
+        self.maximum = maximum
+        self.ceiling = maximum
+        self.grow_after = grow_after
+        self.max_apdu = None
+        self.segmented = True
+        self._clean_cycles = 0
+
+    def configure(self, device_info=None, segmentation_supported=True):
+        """
+        :param device_info: bacpypes3 DeviceInfo from the device info cache
+        :param segmentation_supported: (bool) device property
+        """
+        self.segmented = bool(segmentation_supported)
+        if device_info is not None:
+            self.max_apdu = device_info.max_apdu_length_accepted
+            self.segmented = self.segmented and device_info.segmentation_supported in (
+                Segmentation.segmentedBoth,
+                Segmentation.segmentedTransmit,
+            )
+
+    @property
+    def max_response_size(self):
+        if self.segmented or not self.max_apdu:
+            return None
+        return self.max_apdu
+
+    def success(self):
+        """
+        A complete poll cycle without refused requests
+        """
+        self._clean_cycles += 1
+        if self._clean_cycles >= self.grow_after and self.size < self.ceiling:
+            self.size += 1
+            self._clean_cycles = 0
+
+    def failure(self, failed_size):
+        """
+        A request made of failed_size properties was refused
+        """
+        self._clean_cycles = 0
+        self.ceiling = max(self.minimum, min(self.ceiling, failed_size - 1))
+        self.size = max(self.minimum, min(self.size, failed_size) // 2)
+
+    def __repr__(self):
+        return f"RPMBatchSizer(size={self.size}, ceiling={self.ceiling}, max_response_size={self.max_response_size})"
+
+
 async def create_trendlogs(objList, device):
     trendlogs = {}
     for each in retrieve_type(objList, "trend-log"):
@@ -134,6 +256,114 @@ class ReadUtilsMixin:
 
         return (requests, points)
 
+    def _compile_rpm_plan(
+        self,
+        point_list,
+        points_per_request,
+        property_identifier="presentValue",
+        max_response_size=None,
+    ):
+        """
+        Build the ReadPropertyMultiple parameter lists for point_list.
+        Vendor information is looked up once here so polling doesn't have to
+        build and parse strings on every cycle.
+
+        :param max_response_size: (int) if given, a batch is closed before its
+            estimated response gets bigger than this number of bytes
+
+        :returns: (RPMPlan)
+        """
+        vendor_info = get_vendor_info(self.properties.vendor_id)
+        property_identifier = vendor_info.property_identifier(property_identifier)
+        points = [self._findPoint(each, force_read=False) for each in point_list]
+        batches = []
+        parameter_list, chunk, size = [], [], RPM_ACK_HEADER
+        for point in points:
+            point_size = rpm_response_size(point.properties.type)
+            if chunk and (
+                len(chunk) >= points_per_request
+                or (max_response_size and size + point_size > max_response_size)
+            ):
+                batches.append((parameter_list, chunk))
+                parameter_list, chunk, size = [], [], RPM_ACK_HEADER
+            parameter_list.append(
+                vendor_info.object_identifier(
+                    (point.properties.type, int(point.properties.address))
+                )
+            )
+            parameter_list.append([property_identifier])
+            chunk.append(point)
+            size += point_size
+        if chunk:
+            batches.append((parameter_list, chunk))
+        return RPMPlan(None, Address(self.properties.address), batches)
+
+    def rpm_plan(
+        self,
+        point_list,
+        points_per_request=25,
+        property_identifier="presentValue",
+        max_response_size=None,
+    ):
+        """
+        Return the compiled RPMPlan for point_list. The plan is cached and
+        compiled again only if the point list (or the request parameters) change.
+        """
+        key = (
+            tuple(point_list),
+            id(self.points),
+            len(self.points),
+            self.properties.address,
+            points_per_request,
+            property_identifier,
+            self.properties.vendor_id,
+            max_response_size,
+        )
+        plans = self._rpm_plans
+        plan = plans.get(key)
+        if plan is None:
+            self.log("Compiling RPM plan for %s points", len(key[0]), level="debug")
+            plan = self._compile_rpm_plan(
+                point_list, points_per_request, property_identifier, max_response_size
+            )
+            plan.key = key
+            # poll groups read a few different lists, keep a plan for each
+            if len(plans) >= RPM_PLANS_CACHED:
+                del plans[next(iter(plans))]
+            plans[key] = plan
+        self._rpm_plan = plan
+        return plan
+
+    def clear_rpm_plan(self):
+        """
+        Forget the compiled RPMPlan, next poll will compile it again. Points
+        removed from polling because of errors are polled again.
+        """
+        self._rpm_plan = None
+        self._rpm_plans.clear()
+        self._rpm_excluded.clear()
+        self._rpm_errors.clear()
+
+    async def rpm_batch_sizer(self):
+        """
+        Return the RPMBatchSizer of the device, configured from the device info
+        cache (maxApduLengthAccepted, segmentationSupported) the first time.
+        """
+        sizer = getattr(self, "_rpm_batch_sizer", None)
+        if sizer is None:
+            sizer = RPMBatchSizer()
+            _app = self.properties.network.this_application.app
+            device_info = await _app.device_info_cache.get_device_info(
+                Address(self.properties.address)
+            )
+            sizer.configure(
+                device_info,
+                segmentation_supported=self.properties.segmentation_supported,
+            )
+            self.log("RPM batch size : %r", sizer, level="debug")
+            self._rpm_batch_sizer = sizer
+        return sizer
+
 
 class DiscoveryUtilsMixin:
     """
@@ -230,13 +460,13 @@ class DiscoveryUtilsMixin:
         values = []
         info_length = discover_request[1]
         big_request = discover_request[0]
-        self.log(f"Discover : {big_request}", level="debug")
-        self.log(f"Length : {info_length}", level="debug")
+        self.log("Discover : %s", big_request, level="debug")
+        self.log("Length : %s", info_length, level="debug")
 
         for request in batch_requests(big_request, points_per_request):
             try:
                 request = f"{self.properties.address} {''.join(request)}"
-                self.log(f"RP_Request: {request} ", level="debug")
+                self.log("RP_Request: %s ", request, level="debug")
                 val = await self.properties.network.read(
                     request, vendor_id=self.properties.vendor_id
                 )
@@ -253,7 +483,7 @@ class DiscoveryUtilsMixin:
 
 class RPMObjectsProcessing:
     async def _process_new_objects(
-        self, obj_cls=None, obj_type: str = "", objList=None, points_per_request=5
+        self, obj_cls=None, obj_type: str = "", objList=None, points_per_request=None
     ):
         """
         Template to generate BAC0 points instances from information coming from the network.
@@ -279,7 +509,7 @@ class RPMObjectsProcessing:
             request.append(f"{points} {address} {prop_list} ")
 
         def _find_propid_index(key):
-            self.log(f"Prop List : {prop_list}", level="debug")
+            self.log("Prop List : %s", prop_list, level="debug")
             _prop_list = prop_list.split(" ")
             for i, each in enumerate(_prop_list):
                 if key == each:
@@ -287,13 +517,13 @@ class RPMObjectsProcessing:
             raise KeyError(f"{key} not part of property list")
 
         try:
-            self.log(f"Request : {request}", level="debug")
+            self.log("Request : %s", request, level="debug")
             points_info = await self.read_multiple(
                 "",
                 discover_request=(request, len(prop_list.split(" "))),
                 points_per_request=points_per_request,
             )
-            self.log(f"Points Info : {points_info}", level="debug")
+            self.log("Points Info : %s", points_info, level="debug")
         except SegmentationNotSupported:
             raise
         # Process responses and create point
@@ -427,7 +657,7 @@ class ReadPropertyMultiple(ReadUtilsMixin, DiscoveryUtilsMixin, RPMObjectsProces
         self,
         points_list,
         *,
-        points_per_request=25,
+        points_per_request=None,
         discover_request=(None, 6),
         force_single=False,
         property_identifier="presentValue",
@@ -437,11 +667,12 @@ class ReadPropertyMultiple(ReadUtilsMixin, DiscoveryUtilsMixin, RPMObjectsProces
         [ReadProperty requests are very slow in comparison].
 
         :param points_list: (list) a list of all point_name as str
-        :param points_per_request: (int) number of points in the request
+        :param points_per_request: (int) number of points in the request. By
+            default, the size is managed by the RPMBatchSizer of the device.
 
-        Requesting many points results big requests that need segmentation.  Aim to request
-        just the 'right amount' so segmentation can be avoided.  Determining the 'right amount'
-        is often trial-&-error.
+        Requesting many points results big requests that need segmentation.
+        When a request is refused for being too big, it is split in two and
+        the batch size of the device is reduced (see RPMBatchSizer).
 
         :Example:
 
@@ -453,102 +684,220 @@ class ReadPropertyMultiple(ReadUtilsMixin, DiscoveryUtilsMixin, RPMObjectsProces
                 points_list, points_per_request=1, discover_request=discover_request
             )
         else:
-            if not self.properties.segmentation_supported:
-                points_per_request = 1
+            adaptive = points_per_request is None
+            sizer = await self.rpm_batch_sizer()
 
             if discover_request[0]:
                 values = []
                 info_length = discover_request[1]
                 big_request = discover_request[0]
-                self.log(f"Discover : {big_request}", level="debug")
-                self.log(f"Length : {info_length}", level="debug")
+                self.log("Discover : %s", big_request, level="debug")
+                self.log("Length : %s", info_length, level="debug")
+                if adaptive:
+                    points_per_request = max(1, sizer.size // info_length)
 
-                for request in batch_requests(big_request, points_per_request):
+                i = 0
+                while i < len(big_request):
+                    batch = big_request[i : i + points_per_request]
                     try:
-                        self.properties.address
-                        request = f"{self.properties.address} {''.join(request)}"
-                        self.log(f"RPM_Request: {request} ", level="debug")
-                        try:
-                            val = await self.properties.network.readMultiple(
-                                request, vendor_id=self.properties.vendor_id
-                            )
-                        except SegmentationNotSupported:
-                            raise
-                        except ValueError as error:
-                            # high limit ?
-                            self._log.warning(
-                                f"Got a value error of {error} for request : {request}"
-                            )
-                            self._log.warning(
-                                "We will use single point reading to create device and turn off segmentation support"
-                            )
-                            self.properties.segmentation_supported = False
-                            await self.read_multiple(
-                                points_list,
-                                points_per_request=1,
-                                discover_request=discover_request,
-                            )
-                            break
-
-                        # print('val : ', val, len(val), type(val))
+                        request = f"{self.properties.address} {''.join(batch)}"
+                        self.log("RPM_Request: %s ", request, level="debug")
+                        val = await self.properties.network.readMultiple(
+                            request, vendor_id=self.properties.vendor_id
+                        )
                         if val is None:
-                            self.properties.segmentation_supported = False
                             raise SegmentationNotSupported
+                        if len(val) != len(batch) * info_length:
+                            # the device refused the whole request
+                            raise UnknownPropertyError(request)
 
                     except KeyError as error:
                         raise Exception(f"Unknown point name : {error}")
 
-                    except SegmentationNotSupported:
-                        self.properties.segmentation_supported = False
-                        self._log.warning(
-                            "Looks like segmentation is not supported. Turning that off."
-                        )
-                        # self.read_multiple(points_list,points_per_request=1, discover_request=discover_request)
-                        self.log("Segmentation not supported", level="warning")
-                        self.log("Request too big...will reduce it", level="warning")
+                    except (
+                        SegmentationNotSupported,
+                        BufferOverflow,
+                        ValueError,
+                    ) as error:
                         if points_per_request == 1:
                             raise
-                        await self.read_multiple(
-                            points_list,
-                            points_per_request=1,
-                            discover_request=discover_request,
+                        self._log.warning(
+                            f"Request too big ({str(error) or type(error).__name__}) with {points_per_request} objects, will reduce it"
+                        )
+                        sizer.failure(points_per_request * info_length)
+                        points_per_request = max(1, points_per_request // 2)
+
+                    except (UnknownObjectError, UnknownPropertyError) as error:
+                        # isolate the object causing the error
+                        if points_per_request > 1:
+                            points_per_request = max(1, points_per_request // 2)
+                            continue
+                        self._log.warning(
+                            f"Request refused ({error}), reading {batch[0]}one property at a time"
                         )
+                        values.append(await self._read_properties_one_by_one(batch[0]))
+                        i += 1
 
                     else:
                         for points_info in batch_requests(val, info_length):
                             values.append(points_info)
+                        i += points_per_request
                 return values
 
             else:
                 self.log("Read Multiple", level="debug")
-                big_request = self._rpm_request_by_name(
-                    points_list, property_identifier=property_identifier
+                if self._rpm_excluded:
+                    points_list = [
+                        name for name in points_list if name not in self._rpm_excluded
+                    ]
+                plan = self.rpm_plan(
+                    points_list,
+                    points_per_request=sizer.size if adaptive else points_per_request,
+                    property_identifier=property_identifier,
+                    max_response_size=sizer.max_response_size if adaptive else None,
                 )
-                i = 0
-                for request in batch_requests(big_request[0], points_per_request):
-                    try:
-                        request = f"{self.properties.address} {''.join(request)}"
-                        self.log(request, level="debug")
-                        val = await self.properties.network.readMultiple(
-                            request, vendor_id=self.properties.vendor_id
+                window = self._rpm_window()
+                results = await asyncio.gather(
+                    *(
+                        self._read_rpm_batch(
+                            plan.address, parameter_list, points, window
                         )
+                        for parameter_list, points in plan.batches
+                    )
+                )
+                # results come back in the order of the plan
+                failed_size = None
+                for values, errors, failed in results:
+                    for point, value in values:
+                        point._trend(value)
+                    for point, error in errors:
+                        self._rpm_point_error(point, error)
+                    if failed:
+                        failed_size = min(failed_size or failed, failed)
+                if self._rpm_errors:
+                    for point, _ in (v for values, _, _ in results for v in values):
+                        if self._rpm_errors.pop(point.properties.name, None):
+                            self.log(
+                                f"{point.properties.name} can be read again",
+                                level="info",
+                            )
 
-                    except SegmentationNotSupported:
-                        self.properties.segmentation_supported = False
-                        await self.read_multiple(
-                            points_list,
-                            points_per_request=1,
-                            discover_request=discover_request,
+                if adaptive:
+                    if failed_size:
+                        sizer.failure(failed_size)
+                        self.log(
+                            f"RPM request of {failed_size} points refused, batch size reduced to {sizer.size}",
+                            level="warning",
                         )
+                    else:
+                        sizer.success()
 
-                    except KeyError as error:
-                        raise Exception(f"Unknown point name : {error}")
+    async def _read_properties_one_by_one(self, request):
+        """
+        :param request: (str) "<type> <inst> <prop> <prop>..."
+        :returns: (list) value of each property, None if it can't be read
+        """
+        obj_type, obj_inst, *properties = request.split()
+        values = []
+        for prop in properties:
+            try:
+                values.append(
+                    await self.properties.network.read(
+                        f"{self.properties.address} {obj_type} {obj_inst} {prop}",
+                        vendor_id=self.properties.vendor_id,
+                    )
+                )
+            except (UnknownObjectError, UnknownPropertyError):
+                values.append(None)
+        return values
+
+    def _rpm_window(self):
+        """
+        Semaphore limiting the number of ReadPropertyMultiple requests in flight
+        for this device (properties.rpm_window)
+        """
+        size = max(1, int(getattr(self.properties, "rpm_window", 1) or 1))
+        window = getattr(self, "_rpm_window_semaphore", None)
+        if window is None or window[0] != size:
+            window = (size, asyncio.Semaphore(size))
+            self._rpm_window_semaphore = window
+        return window[1]
+
+    async def _read_rpm_batch(self, address, parameter_list, points, window):
+        """
+        Read one batch of a RPMPlan. A batch refused for being too big, or
+        refused as a whole because of one bad object or property, is split in
+        two and both halves are read again.
 
+        :returns: ([(point, value), ...], [(point, error), ...], smallest size
+            refused for being too big or None)
+        """
+        async with window:
+            errors = []
+            try:
+                val = await self.properties.network.readPropertyMultiple(
+                    address, parameter_list, errors=errors
+                )
+            except (SegmentationNotSupported, BufferOverflow) as error:
+                if len(points) == 1:
+                    return ([], [(points[0], error)], None)
+                too_big = True
+            except (UnknownObjectError, UnknownPropertyError) as error:
+                if len(points) == 1:
+                    self._rpm_exclude(points[0], error)
+                    return ([], [(points[0], error)], None)
+                too_big = False
+            else:
+                # errors of single properties, the other values are kept
+                errors = {
+                    object_identifier: error
+                    for object_identifier, _, _, error in errors
+                }
+                values, point_errors = [], []
+                for i, (point, value) in enumerate(zip(points, val)):
+                    error = errors.get(parameter_list[2 * i]) if errors else None
+                    if error is None:
+                        values.append((point, value))
                     else:
-                        points_values = zip(big_request[1][i : i + len(val)], val)
-                        i += len(val)
-                        for each in points_values:
-                            each[0]._trend(each[1])
+                        point_errors.append((point, error))
+                return (values, point_errors, None)
+
+        failed_size = len(points) if too_big else None
+        half = len(points) // 2
+        first, second = await asyncio.gather(
+            self._read_rpm_batch(
+                address, parameter_list[: 2 * half], points[:half], window
+            ),
+            self._read_rpm_batch(
+                address, parameter_list[2 * half :], points[half:], window
+            ),
+        )
+        for _, _, failed in (first, second):
+            if failed:
+                failed_size = min(failed_size or failed, failed)
+        return (first[0] + second[0], first[1] + second[1], failed_size)
+
+    def _rpm_point_error(self, point, error):
+        """
+        Report a point that couldn't be read by ReadPropertyMultiple. Logged
+        as a warning the first time (or when the error changes).
+        """
+        reason = str(error) or type(error).__name__
+        if isinstance(error, ErrorType):
+            reason = f"{error.errorClass} / {error.errorCode}"
+        if self._rpm_errors.get(point.properties.name) != reason:
+            self._rpm_errors[point.properties.name] = reason
+            self._log.warning(f"Cannot read {point.properties.name} ({reason})")
+
+    def _rpm_exclude(self, point, error):
+        """
+        The device refuses any ReadPropertyMultiple including this point, keep
+        it out of the polling so the other points are read in one request.
+        """
+        self._rpm_excluded.add(point.properties.name)
+        self._log.warning(
+            f"{point.properties.name} removed from polling ({error}). Use clear_rpm_plan() to try again."
+        )
 
     async def read_single(
         self, points_list, *, points_per_request=1, discover_request=(None, 4)
@@ -689,7 +1038,7 @@ class ReadProperty(ReadUtilsMixin, DiscoveryUtilsMixin, RPObjectsProcessing):
     ):
         try:
             request = f"{self.properties.address} {''.join(request)}"
-            self.log(f"RP_Request: {request} ", level="debug")
+            self.log("RP_Request: %s ", request, level="debug")
             return await self.properties.network.read(
                 request, vendor_id=self.properties.vendor_id
             )
@@ -184,6 +184,9 @@ class Discover:
                     "vendor_name": "unknown",
                 }
 
+        # warm the device info cache so reading those devices don't need a Who-Is
+        await self.update_device_info_cache(iam for iam, _ in found)
+
         self.log(
             f"Discovery done. Found {len(self.discoveredDevices) if self.discoveredDevices else 0} devices on {len(_networks) if _networks else 0} BACnet networks.",
             level="info",
@@ -0,0 +1,93 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+#
+# Copyright (C) 2015 by Christian Tremblay, P.Eng <christian.tremblay@servisys.com>
+# Licensed under LGPLv3, see file LICENSE in this source tree.
+#
+"""
+COVMultiple.py - SubscribeCOVPropertyMultiple and COVNotificationMultiple
+requests (ASHRAE 135, 13.15 to 13.17).
+
+bacpypes3 defines the service choices but not the requests. They are
+registered here so the requests can be sent and the notifications decoded,
+an application handles the notifications with
+do_ConfirmedCOVNotificationMultipleRequest and
+do_UnconfirmedCOVNotificationMultipleRequest.
+"""
+
+from bacpypes3.apdu import (
+    ConfirmedRequestSequence,
+    ConfirmedServiceChoice,
+    UnconfirmedRequestSequence,
+    UnconfirmedServiceChoice,
+    register_confirmed_request_type,
+    register_unconfirmed_request_type,
+)
+from bacpypes3.basetypes import (
+    COVMultipleSubscriptionList,
+    DateTime,
+    PropertyIdentifier,
+)
+from bacpypes3.constructeddata import Any, Sequence, SequenceOf
+from bacpypes3.primitivedata import Boolean, ObjectIdentifier, Time, Unsigned
+
+
+class COVNotificationMultipleValue(Sequence):
+    _order = ("propertyIdentifier", "propertyArrayIndex", "value", "timeOfChange")
+    propertyIdentifier = PropertyIdentifier(_context=0)
+    propertyArrayIndex = Unsigned(_context=1, _optional=True)
+    value = Any(_context=2)
+    timeOfChange = Time(_context=3, _optional=True)
+
+
+class COVNotificationMultipleList(Sequence):
+    _order = ("monitoredObjectIdentifier", "listOfValues")
+    monitoredObjectIdentifier = ObjectIdentifier(_context=0)
+    listOfValues = SequenceOf(COVNotificationMultipleValue, _context=1)
+
+
+@register_confirmed_request_type
+class SubscribeCOVPropertyMultipleRequest(ConfirmedRequestSequence):
+    service_choice = ConfirmedServiceChoice.subscribeCOVPropertyMultiple
+    _order = (
+        "subscriberProcessIdentifier",
+        "issueConfirmedNotifications",
+        "lifetime",
+        "maxNotificationDelay",
+        "listOfCOVSubscriptionSpecifications",
+    )
+    subscriberProcessIdentifier = Unsigned(_context=0)
+    issueConfirmedNotifications = Boolean(_context=1, _optional=True)
+    lifetime = Unsigned(_context=2, _optional=True)
+    maxNotificationDelay = Unsigned(_context=3, _optional=True)
+    listOfCOVSubscriptionSpecifications = SequenceOf(
+        COVMultipleSubscriptionList, _context=4
+    )
+
+
+@register_confirmed_request_type
+class ConfirmedCOVNotificationMultipleRequest(ConfirmedRequestSequence):
+    service_choice = ConfirmedServiceChoice.confirmedCOVNotificationMultiple
+    _order = (
+        "subscriberProcessIdentifier",
+        "initiatingDeviceIdentifier",
+        "timeRemaining",
+        "timestamp",
+        "listOfCOVNotifications",
+    )
+    subscriberProcessIdentifier = Unsigned(_context=0)
+    initiatingDeviceIdentifier = ObjectIdentifier(_context=1)
+    timeRemaining = Unsigned(_context=2)
+    timestamp = DateTime(_context=3, _optional=True)
+    listOfCOVNotifications = SequenceOf(COVNotificationMultipleList, _context=4)
+
+
+@register_unconfirmed_request_type
+class UnconfirmedCOVNotificationMultipleRequest(UnconfirmedRequestSequence):
+    service_choice = UnconfirmedServiceChoice.unconfirmedCOVNotificationMultiple
+    _order = ConfirmedCOVNotificationMultipleRequest._order
+    subscriberProcessIdentifier = Unsigned(_context=0)
+    initiatingDeviceIdentifier = ObjectIdentifier(_context=1)
+    timeRemaining = Unsigned(_context=2)
+    timestamp = DateTime(_context=3, _optional=True)
+    listOfCOVNotifications = SequenceOf(COVNotificationMultipleList, _context=4)
@@ -5,7 +5,7 @@
 # Licensed under LGPLv3, see file LICENSE in this source tree.
 #
 """
-IOExceptions.py - BAC0 application level exceptions 
+IOExceptions.py - BAC0 application level exceptions
 """
 
 
@@ -179,3 +179,11 @@ class NotReadyError(Exception):
 
 class DataError(Exception):
     pass
+
+
+class COVSubscriptionLimit(Exception):
+    """
+    Maximum number of COV subscriptions to a device reached.
+    """
+
+    pass
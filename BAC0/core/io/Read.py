@@ -17,11 +17,14 @@ Read.py - creation of ReadProperty and ReadPropertyMultiple requests
         ReadProperty()
             def read()
             def readMultiple()
+            def readProperty()
+            def readPropertyMultiple()
 
 """
 
 import asyncio
 import re
+import time
 
 # --- standard Python modules ---
 import typing as t
@@ -46,6 +49,7 @@ from bacpypes3.app import Application
 from bacpypes3.basetypes import (
     DateTime,
     EngineeringUnits,
+    ErrorType,
     PropertyIdentifier,
     RangeByPosition,
     RangeBySequenceNumber,
@@ -65,6 +69,7 @@ from ..utils.notes import note_and_log
 # --- this application's modules ---
 from .IOExceptions import (
     ApplicationNotStarted,
+    BufferOverflow,
     NoResponseFromController,
     ReadRangeException,
     SegmentationNotSupported,
@@ -88,6 +93,12 @@ class ReadProperty:
     A timeout of 10 seconds allows detection of invalid device or communciation errors.
     """
 
+    # Maximum number of ReadPropertyMultiple requests in flight at the same time
+    # on one BACnet network (local network or behind the same router)
+    rpm_network_window: int = 8
+    # Seconds during which an address that didn't answer Who-Is is not asked again
+    device_info_negative_ttl: float = 30.0
+
     async def read(
         self,
         args: str,
@@ -116,9 +127,6 @@ class ReadProperty:
         if not self._started:
             raise ApplicationNotStarted("BACnet stack not running - use startApp()")
 
-        _this_application: BAC0Application = self.this_application
-        _app: Application = _this_application.app
-
         args_split = args.split()
 
         (
@@ -131,32 +139,49 @@ class ReadProperty:
         )
 
         self.log_title("Read property", args_split)
-        # Do I know you ?
-        dic = await self.this_application.app.device_info_cache.get_device_info(
-            device_address
+        return await self.readProperty(
+            device_address,
+            object_identifier,
+            property_identifier,
+            property_array_index,
         )
-        if dic is None:
-            _iam = await self.this_application.app.who_is(address=device_address)
-            failures = 0
-            while _iam == []:
-                # retry
-                failures += 1
-                await asyncio.sleep(1)
-                _iam = await self.this_application.app.who_is(address=device_address)
-                if failures > 5:
-                    self.log(
-                        f"Trouble with Iam... Response received from {device_address} = {_iam}",
-                        level="error",
-                    )
-                    raise NoResponseFromController
-            await self.this_application.app.device_info_cache.set_device_info(_iam[0])
-            dic = await self.this_application.app.device_info_cache.get_device_info(
-                device_address
+
+    async def readProperty(
+        self,
+        address: Address,
+        object_identifier: ObjectIdentifier,
+        property_identifier: PropertyIdentifier,
+        property_array_index: t.Optional[int] = None,
+    ) -> t.Optional[ReadValue]:
+        """
+        Typed version of read(). Nothing is parsed, the request is sent as is.
+
+        :param address: (Address) address of the device
+        :param object_identifier: (ObjectIdentifier)
+        :param property_identifier: (PropertyIdentifier)
+        :param property_array_index: (int) optional array index
+        :returns: data read from device
+
+        *Example*::
+
+            await bacnet.readProperty(
+                Address("2:5"),
+                ObjectIdentifier("analogInput:1"),
+                PropertyIdentifier("presentValue"),
             )
-            self.log(f"Device Info Cache : {dic}", level="debug")
+        """
+        if not self._started:
+            raise ApplicationNotStarted("BACnet stack not running - use startApp()")
+
+        _this_application: BAC0Application = self.this_application
+        _app: Application = _this_application.app
+
+        # Do I know you ?
+        await self._ensure_device_info(address)
+        self._request_sent(address)
         try:
             response = await _app.read_property(
-                device_address,
+                address,
                 object_identifier,
                 property_identifier,
                 property_array_index,
@@ -166,37 +191,13 @@ class ReadProperty:
             response = err
 
             if "unknown-property" in str(err.reason):
-                if "description" in args:
-                    self._log.warning(
-                        "The description property is not implemented in the device. "
-                        "Using a default value for internal needs."
-                    )
-                    return "n/a"
-                elif "inactiveText" in args:
-                    self._log.warning(
-                        "The inactiveText property is not implemented in the device. "
-                        "Using a default value of Off for internal needs."
-                    )
-                    return "False"
-                elif "activeText" in args:
-                    self._log.warning(
-                        "The activeText property is not implemented in the device. "
-                        "Using a default value of On for internal needs."
-                    )
-                    return "True"
-                if "units" in args:
-                    self._log.warning(
-                        "The units property is not implemented in the device. We will consider noUnits"
-                        "Using a default value for internal needs. Please note that units is a required property for BACnet objects like analog values. The device you are reading from may be non-compliant."
-                    )
-                    return EngineeringUnits("noUnits")
-                else:
-
-                    raise UnknownPropertyError(f"Unknown property {args}")
+                return self._unknown_property_default(
+                    address, object_identifier, property_identifier
+                )
             else:
                 self.log(f"Error : {err}", level="error")
         except ObjectError:
-            raise UnknownObjectError(f"Unknown object {args}")
+            raise UnknownObjectError(f"Unknown object {address} {object_identifier}")
 
         # except bufferOverflow
         except NoResponse:
@@ -205,6 +206,127 @@ class ReadProperty:
         if not isinstance(response, ErrorRejectAbortNack):
             return response
 
+    def _unknown_property_default(
+        self,
+        address: Address,
+        object_identifier: ObjectIdentifier,
+        property_identifier: PropertyIdentifier,
+    ) -> ReadValue:
+        """
+        Some properties used internally by BAC0 are not implemented in every
+        device. Return a default value for those, raise UnknownPropertyError
+        for any other property.
+        """
+        if property_identifier == PropertyIdentifier.description:
+            self._log.warning(
+                "The description property is not implemented in the device. "
+                "Using a default value for internal needs."
+            )
+            return "n/a"
+        elif property_identifier == PropertyIdentifier.inactiveText:
+            self._log.warning(
+                "The inactiveText property is not implemented in the device. "
+                "Using a default value of Off for internal needs."
+            )
+            return "False"
+        elif property_identifier == PropertyIdentifier.activeText:
+            self._log.warning(
+                "The activeText property is not implemented in the device. "
+                "Using a default value of On for internal needs."
+            )
+            return "True"
+        elif property_identifier == PropertyIdentifier.units:
+            self._log.warning(
+                "The units property is not implemented in the device. We will consider noUnits"
+                "Using a default value for internal needs. Please note that units is a required property for BACnet objects like analog values. The device you are reading from may be non-compliant."
+            )
+            return EngineeringUnits("noUnits")
+        raise UnknownPropertyError(
+            f"Unknown property {address} {object_identifier} {property_identifier}"
+        )
+
+    async def _ensure_device_info(self, address: Address) -> t.Any:
+        """
+        Make sure the device info cache knows the device at address (needed
+        by bacpypes3 to build requests), sending Who-Is if required.
+
+        Concurrent requests to an unknown device share the same Who-Is. An
+        address that didn't answer is not asked again for
+        device_info_negative_ttl seconds, NoResponseFromController is raised
+        right away instead.
+        """
+        _app: Application = self.this_application.app
+        dic = await _app.device_info_cache.get_device_info(address)
+        if dic is not None:
+            return dic
+
+        pending, unreachable = self._device_info_lookups()
+        expiry = unreachable.get(address)
+        if expiry is not None:
+            if time.monotonic() < expiry:
+                raise NoResponseFromController(
+                    f"{address} did not answer Who-Is, will retry later"
+                )
+            del unreachable[address]
+
+        lookup = pending.get(address)
+        if lookup is None:
+            lookup = asyncio.ensure_future(self._who_is_device_info(address))
+            pending[address] = lookup
+            lookup.add_done_callback(
+                lambda future: self._device_info_lookup_done(address, future)
+            )
+        # shield : a cancelled caller must not cancel the lookup of the others
+        return await asyncio.shield(lookup)
+
+    def _device_info_lookups(self) -> t.Tuple[t.Dict, t.Dict]:
+        """
+        Who-Is lookups in progress and unreachable addresses (with expiry)
+        """
+        pending = getattr(self, "_device_info_pending", None)
+        if pending is None:
+            pending = self._device_info_pending = {}
+            self._device_info_unreachable = {}
+        return pending, self._device_info_unreachable
+
+    def _device_info_lookup_done(self, address: Address, future: asyncio.Future):
+        self._device_info_pending.pop(address, None)
+        if not future.cancelled() and future.exception() is not None:
+            self._device_info_unreachable[address] = (
+                time.monotonic() + self.device_info_negative_ttl
+            )
+
+    async def _who_is_device_info(self, address: Address) -> t.Any:
+        _app: Application = self.this_application.app
+        _iam = await _app.who_is(address=address)
+        failures = 0
+        while _iam == []:
+            # retry
+            failures += 1
+            await asyncio.sleep(1)
+            _iam = await _app.who_is(address=address)
+            if failures > 5:
+                self.log(
+                    f"Trouble with Iam... Response received from {address} = {_iam}",
+                    level="error",
+                )
+                raise NoResponseFromController(f"No I-Am from {address}")
+        await _app.device_info_cache.set_device_info(_iam[0])
+        dic = await _app.device_info_cache.get_device_info(address)
+        self.log("Device Info Cache : %s", dic, level="debug")
+        return dic
+
+    async def update_device_info_cache(self, i_am_requests: t.Iterable) -> None:
+        """
+        Fill the device info cache using I-Am already received (ex. during
+        discover) so the first requests to those devices don't need a Who-Is.
+        """
+        _app: Application = self.this_application.app
+        _, unreachable = self._device_info_lookups()
+        for i_am in i_am_requests:
+            await _app.device_info_cache.set_device_info(i_am)
+            unreachable.pop(i_am.pduSource, None)
+
     def _split_the_read_request(self, args, arr_index):
         """
         When a device doesn't support segmentation, this function
@@ -247,9 +369,6 @@ class ReadProperty:
         if not self._started:
             raise ApplicationNotStarted("BACnet stack not running - use startApp()")
 
-        _this_application: BAC0Application = self.this_application
-        _app: Application = _this_application.app
-
         if request_dict is not None:
             address, parameter_list = await self.build_rpm_request_from_dict(
                 request_dict, vendor_id
@@ -267,25 +386,110 @@ class ReadProperty:
             )
             self.log_title("Read Multiple", args_list)
 
-        # Force DeviceInfoCache
-        dic = await self.this_application.app.device_info_cache.get_device_info(address)
-        if dic is None:
-            _iam = await self.this_application.app.who_is(address=address)
-            await self.this_application.app.device_info_cache.set_device_info(_iam[0])
-            dic = await self.this_application.app.device_info_cache.get_device_info(
-                address
+        errors = []
+        try:
+            values = await self._read_multiple_request(
+                address,
+                parameter_list,
+                show_property_name=show_property_name,
+                as_dict=request_dict is not None,
+                args=args,
+                errors=errors,
+            )
+        except UnknownPropertyError:
+            return [""]
+        for object_identifier, property_identifier, _, error in errors:
+            self.log(
+                f"{address} {object_identifier} {property_identifier} : {error.errorClass} / {error.errorCode}",
+                level="warning",
             )
-            self.log(f"Device Info Cache : {dic}", level="debug")
+        return values
+
+    async def readPropertyMultiple(
+        self,
+        address: Address,
+        parameter_list: t.List,
+        *,
+        show_property_name: bool = False,
+        as_dict: bool = False,
+        errors: t.Optional[t.List] = None,
+    ) -> t.Union[t.Dict, t.List[t.Tuple[t.Any, str]]]:
+        """
+        Typed version of readMultiple(). Nothing is parsed, the request is sent
+        as is.
+
+        :param address: (Address) address of the device
+        :param parameter_list: list made of ObjectIdentifier, each one followed by
+            its list of PropertyIdentifier (or (PropertyIdentifier, array_index))
+        :param show_property_name: return (value, property_identifier) tuples
+        :param as_dict: return values grouped by object identifier
+        :param errors: (list) if given, properties returned with an error are
+            added to it as (object_identifier, property_identifier,
+            property_array_index, ErrorType). Their value is None (or the
+            default value BAC0 uses for unknown description, units...).
+
+        *Example*::
+
+            await bacnet.readPropertyMultiple(
+                Address("2:5"),
+                [
+                    ObjectIdentifier("analogInput:1"),
+                    [PropertyIdentifier("presentValue"), PropertyIdentifier("units")],
+                ],
+            )
+        """
+        if not self._started:
+            raise ApplicationNotStarted("BACnet stack not running - use startApp()")
+
+        return await self._read_multiple_request(
+            address,
+            parameter_list,
+            show_property_name=show_property_name,
+            as_dict=as_dict,
+            errors=errors,
+        )
+
+    async def _read_multiple_request(
+        self,
+        address: Address,
+        parameter_list: t.List,
+        *,
+        show_property_name: bool = False,
+        as_dict: bool = False,
+        args: t.Any = None,
+        errors: t.Optional[t.List] = None,
+    ) -> t.Union[t.Dict, t.List[t.Tuple[t.Any, str]]]:
+        """
+        Send an already built ReadPropertyMultiple request and decode the answer.
+
+        :param address: (Address) address of the device
+        :param parameter_list: list made of ObjectIdentifier followed by their list
+            of PropertyIdentifier (or (PropertyIdentifier, array_index)), the way
+            bacpypes3 Application.read_property_multiple expects it
+        :param as_dict: return values grouped by object identifier
+        :param args: original request, used in error messages
+        :param errors: (list) receives the properties returned with an error,
+            see readPropertyMultiple
+        """
+        _this_application: BAC0Application = self.this_application
+        _app: Application = _this_application.app
+        if args is None:
+            args = f"{address} {parameter_list}"
+
+        # Force DeviceInfoCache
+        await self._ensure_device_info(address)
 
         values = []
         dict_values = {}
 
-        self.log(f"Parameter list : {parameter_list}", level="debug")
+        self.log("Parameter list : %s", parameter_list, level="debug")
 
         try:
             # build an ReadPropertyMultiple request
-            response = await _app.read_property_multiple(address, parameter_list)
-            self.log(f"Response : {response}", level="debug")
+            async with self._rpm_network_limiter(address):
+                self._request_sent(address)
+                response = await _app.read_property_multiple(address, parameter_list)
+            self.log("Response : %s", response, level="debug")
 
         except ErrorRejectAbortNack as err:
             # construction error
@@ -293,44 +497,57 @@ class ReadProperty:
             self._log.exception(f"exception: {err.reason}")
             if "segmentation-not-supported" in str(err.reason):
                 raise SegmentationNotSupported
+            if "buffer-overflow" in str(err.reason) or "apdu-too-long" in str(
+                err.reason
+            ):
+                raise BufferOverflow(f"Response too big for {address}")
             if "unrecognized-service" in str(err.reason):
                 raise UnrecognizedService()
             if "unknown-object" in str(err.reason):
                 self.log(f"Unknown object {args}", level="warning")
                 raise UnknownObjectError(f"Unknown object {args}")
             if "unknown-property" in str(err.reason):
-                values.append("")  # type: ignore[arg-type]
-                return values
+                raise UnknownPropertyError(f"Unknown property {args}")
             if "no-response" in str(err.reason):
                 # values.append("")  # type: ignore[arg-type]
                 # return values
                 # try again
                 try:
-                    response = await _app.read_property_multiple(
-                        address, parameter_list
-                    )
+                    async with self._rpm_network_limiter(address):
+                        self._request_sent(address)
+                        response = await _app.read_property_multiple(
+                            address, parameter_list
+                        )
                 except ErrorRejectAbortNack as err:
                     raise err
 
         if not isinstance(response, ErrorRejectAbortNack):
-            """
-            TODO : Need improvement here and look for the property identifier that is coming from the response
-            Then we'll be able to support multiple properties for the same object in the read multiple function
-            """
             for (
                 object_identifier,
                 property_identifier,
                 property_array_index,
                 property_value,
             ) in response:
-                self._log.debug(
-                    "{!r:<20} {!r:<20} {!r:<30} {!r:<20}".format(
-                        property_identifier,
-                        property_array_index,
-                        property_value,
-                        # datatype,
-                        "",
+                if isinstance(property_value, ErrorType):
+                    # error for this property only, keep the rest of the response
+                    if errors is not None:
+                        errors.append(
+                            (
+                                object_identifier,
+                                property_identifier,
+                                property_array_index,
+                                property_value,
+                            )
+                        )
+                    property_value = self._property_error_value(
+                        address, object_identifier, property_identifier, property_value
                     )
+                self.log(
+                    "%-20r %-20r %-30r",
+                    property_identifier,
+                    property_array_index,
+                    property_value,
+                    level="debug",
                 )
                 if str(object_identifier) not in dict_values:
                     dict_values[str(object_identifier)] = []
@@ -345,13 +562,78 @@ class ReadProperty:
                         (property_identifier, property_value)
                     )
 
-            if request_dict is not None:
+            if as_dict:
                 return dict_values
             else:
                 return values
 
         return values
 
+    def _property_error_value(
+        self,
+        address: Address,
+        object_identifier: ObjectIdentifier,
+        property_identifier: PropertyIdentifier,
+        error: ErrorType,
+    ) -> t.Optional[ReadValue]:
+        """
+        Value used in place of a property returned with an error in a
+        ReadPropertyMultiple-ACK.
+        """
+        self.log(
+            "%s %s %s : %s / %s",
+            address,
+            object_identifier,
+            property_identifier,
+            error.errorClass,
+            error.errorCode,
+            level="debug",
+        )
+        if str(error.errorCode) == "unknown-property":
+            try:
+                return self._unknown_property_default(
+                    address, object_identifier, property_identifier
+                )
+            except UnknownPropertyError:
+                pass
+        return None
+
+    def _trunk(self, address: Address, network: t.Optional[int] = None) -> tuple:
+        """
+        What requests to address go through : ("router", router address) when
+        its network is reached through a known router, else ("network",
+        network number).
+
+        :param network: network number, when address doesn't tell it
+        """
+        network = address.addrNet if network is None else network
+        if network is not None:
+            path_info = self.this_application.app.nsap.router_info_cache.path_info
+            for (_, dnet), (router_address, _) in path_info.items():
+                if dnet == network:
+                    return ("router", router_address)
+        return ("network", network)
+
+    def _rpm_network_limiter(self, address: Address) -> asyncio.Semaphore:
+        """
+        Semaphore shared by all ReadPropertyMultiple requests going to the
+        network of address. Remote networks are grouped by the router used to
+        reach them (when known) so a slow router isn't flooded.
+        """
+        key = self._trunk(address)
+        limiters = getattr(self, "_rpm_limiters", None)
+        if limiters is None:
+            limiters = self._rpm_limiters = {}
+        if key not in limiters:
+            limiters[key] = asyncio.Semaphore(self.rpm_network_window)
+        return limiters[key]
+
+    def _request_sent(self, address: Address) -> None:
+        # requests per second of each network (see PollPlanner)
+        planner = getattr(self, "poll_planner", None)
+        if planner is not None:
+            planner.record(address.addrNet)
+
     def build_rp_request(
         self, args: t.List[str], arr_index=None, vendor_id: int = 0, bacoid=None
     ) -> t.Tuple:
@@ -382,7 +664,7 @@ class ReadProperty:
         if arr_index is None:
             arr_index = int(args[4]) if len(args) == 5 else arr_index
         params = (device_address, object_identifier, prop_id, arr_index)
-        self.log(f"{'REQUEST':<20} {params!r}", level="debug")
+        self.log("%-20s %r", "REQUEST", params, level="debug")
         return params
 
     async def build_rpm_request(
@@ -394,7 +676,7 @@ class ReadProperty:
         property_array_index = None
         _this_application: BAC0Application = self.this_application
         _app: Application = _this_application.app
-        self.log(args, level="debug")
+        self.log("%s", args, level="debug")
 
         vendor_id = vendor_id
         address = Address(args.pop(0))
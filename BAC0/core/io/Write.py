@@ -16,6 +16,7 @@ Write.py - creation of WriteProperty requests
 
         WriteProperty()
             def write()
+            def writeProperty()
 
 
 """
@@ -85,9 +86,6 @@ class WriteProperty:
         if not self._started:
             raise ApplicationNotStarted("BACnet stack not running - use startApp()")
 
-        _this_application: BAC0Application = self.this_application
-        _app: Application = _this_application.app
-
         self.log_title("Write property", args)
 
         (
@@ -97,12 +95,66 @@ class WriteProperty:
             value,
             property_array_index,
             priority,
-        ) = request = self.build_wp_request(args)
-        # print(request)
+        ) = self.build_wp_request(args)
+
+        return await self.writeProperty(
+            device_address,
+            object_identifier,
+            property_identifier,
+            value,
+            property_array_index=property_array_index,
+            priority=priority,
+        )
+
+    async def writeProperty(
+        self,
+        address: Address,
+        object_identifier: ObjectIdentifier,
+        property_identifier: PropertyIdentifier,
+        value,
+        property_array_index=None,
+        priority=None,
+    ):
+        """
+        Typed version of _write(). Nothing is parsed, the request is sent as is.
+        The value is cast by bacpypes3 to the datatype of the property ; use
+        Null(()) to relinquish a priority.
+
+        :param address: (Address) address of the device
+        :param object_identifier: (ObjectIdentifier)
+        :param property_identifier: (PropertyIdentifier)
+        :param value: value to write
+        :param property_array_index: (int) optional array index
+        :param priority: (int) optional priority (1-16)
+
+        *Example*::
+
+            await bacnet.writeProperty(
+                Address("2:5"),
+                ObjectIdentifier("analogValue:1"),
+                PropertyIdentifier("presentValue"),
+                100,
+                priority=8,
+            )
+        """
+        if not self._started:
+            raise ApplicationNotStarted("BACnet stack not running - use startApp()")
+
+        _this_application: BAC0Application = self.this_application
+        _app: Application = _this_application.app
+
+        request = (
+            address,
+            object_identifier,
+            property_identifier,
+            value,
+            property_array_index,
+            priority,
+        )
 
         try:
             response = await _app.write_property(
-                device_address,
+                address,
                 object_identifier,
                 property_identifier,
                 value,
@@ -118,11 +170,11 @@ class WriteProperty:
 
         except ErrorRejectAbortNack as err:
             self.log(f"exception: {err!r}", level="error")
-            raise NoResponseFromController(f"APDU Abort Reason : {response}")
+            raise NoResponseFromController(f"APDU Abort Reason : {err}")
 
         except ValueError as err:
             self.log(f"exception: {err!r}", level="error")
-            raise ValueError(f"Invalid value for property : {err} | {response}")
+            raise ValueError(f"Invalid value for property : {err} | {request}")
 
         except WritePropertyException as error:
             # construction error
@@ -196,11 +248,15 @@ class WriteProperty:
 
         self.log_subtitle("Creating Request")
         self.log(
-            f"{'indx':<20} {'priority':<20} {'datatype':<20} {'value':<20}",
+            "%-20s %-20s %-20s %-20s",
+            "indx",
+            "priority",
+            "datatype",
+            "value",
             level="debug",
         )
 
-        self.log(f"{'REQUEST':<20} {request}", level="debug")
+        self.log("%-20s %s", "REQUEST", request, level="debug")
         return request
 
 
@@ -1,3 +1,4 @@
+import importlib
 import importlib.util
 from types import ModuleType
 from typing import Type
@@ -76,6 +77,19 @@ def pandas_if_available() -> tuple[bool, Type, ModuleType, ModuleType]:
     return (_PANDAS, pd, sql, Timestamp)
 
 
+def pyarrow_if_available():
+    if not check_dependencies(["pyarrow"]):
+        return (False, None, None, None)
+    try:
+        # pyarrow is a compiled package, import it the usual way
+        pa = importlib.import_module("pyarrow")
+        pq = importlib.import_module("pyarrow.parquet")
+        ipc = importlib.import_module("pyarrow.ipc")
+    except ImportError:
+        return (False, None, None, None)
+    return (True, pa, pq, ipc)
+
+
 class FakePandas:
     "Typing in Device requires pandas, but it is not available"
 
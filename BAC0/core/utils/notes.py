@@ -6,7 +6,6 @@ logging feature at the same time.
 Goal is to be able to access quickly to important informations for
 the web interface.
 """
-import inspect
 import logging
 import os
 import sys
@@ -30,6 +29,41 @@ _PANDAS, pd, _, _ = pandas_if_available()
 
 class LogList:
     LOGGERS: t.List[Logger] = []
+    # Add the calling module name to non-INFO messages (costs a frame lookup)
+    CAPTURE_CALLER: bool = True
+
+
+def set_caller_capture(enabled: bool = True) -> None:
+    """
+    Enable or disable the capture of the calling module name in log messages.
+    Disabling it removes the frame lookup done for each DEBUG/WARNING/ERROR
+    message that is actually emitted.
+    """
+    LogList.CAPTURE_CALLER = bool(enabled)
+
+
+def _handlers_threshold(logger: Logger) -> int:
+    """
+    Loggers created by note_and_log are set to DEBUG and the filtering is
+    made by the handlers. Find the lowest level any handler reachable from
+    this logger will accept. Walking the few parent loggers is cheap, so
+    this is done on each call and handlers added later (basicConfig,
+    pytest...) are seen.
+    """
+    threshold: t.Optional[int] = None
+    current: t.Optional[Logger] = logger
+    while current is not None:
+        for handler in current.handlers:
+            if threshold is None or handler.level < threshold:
+                threshold = handler.level
+        if not current.propagate:
+            break
+        current = current.parent  # type: ignore[assignment]
+    if threshold is None:
+        # no handler, the records go to logging.lastResort
+        last_resort = logging.lastResort
+        return last_resort.level if last_resort else logging.CRITICAL + 1
+    return threshold
 
 
 def convert_level(level):
@@ -231,7 +265,21 @@ def note_and_log(cls):
 
     LogList.LOGGERS.append(cls._log)
 
+    def log_enabled(self, level: t.Union[str, int] = logging.DEBUG) -> bool:
+        """
+        Tell if a message of this level would reach at least one handler.
+        Useful to guard expensive message building ::
+
+            if self.log_enabled("debug"):
+                self.log(f"{big_object!r}", level="debug")
+        """
+        if isinstance(level, str):
+            level = convert_level(level)
+        return cls._log.isEnabledFor(level) and level >= _handlers_threshold(cls._log)
+
     def log_title(self, title, args=None, width=35):
+        if not log_enabled(self, logging.DEBUG):
+            return
         cls._log.debug("")
         cls._log.debug("#" * width)
         cls._log.debug(f"# {title}")
@@ -241,6 +289,8 @@ def note_and_log(cls):
             cls._log.debug("#" * 35)
 
     def log_subtitle(self, subtitle, args=None, width=35):
+        if not log_enabled(self, logging.DEBUG):
+            return
         cls._log.debug("")
         cls._log.debug("=" * width)
         cls._log.debug(f"{subtitle}")
@@ -249,21 +299,31 @@ def note_and_log(cls):
             cls._log.debug(f"{args!r}")
             cls._log.debug("=" * width)
 
-    def log(self, note, *, level: t.Union[str, int] = logging.DEBUG):
+    def log(self, note, *args, level: t.Union[str, int] = logging.DEBUG):
         """
         Add a log entry...no note
+
+        Extra positional args are merged into note using %-formatting, only
+        if the level is enabled. This way, nothing is formatted for
+        messages that would be discarded by the handlers ::
+
+            self.log("Read %s gave %r", request, value, level="debug")
         """
         if not note:
             raise ValueError("Provide something to log")
         if isinstance(level, str):
             level = convert_level(level)
+        if not log_enabled(self, level):
+            return
+        if args:
+            note = note % args
         if level == logging.INFO:
             note = f"{note}"
-        else:
-            caller_frame = inspect.stack()[1]
-            module = inspect.getmodule(caller_frame[0])
-            module_name = module.__name__ if module else "unknown"
+        elif LogList.CAPTURE_CALLER:
+            module_name = sys._getframe(1).f_globals.get("__name__", "unknown")
             note = f"{cls.logname} | {module_name} | {note}"
+        else:
+            note = f"{cls.logname} | {note}"
         cls._log.log(level, note)
 
     def note(self, note, *, level=logging.INFO, log=True):
@@ -303,6 +363,7 @@ def note_and_log(cls):
     cls.note = note
     cls.notes = notes
     cls.log = log
+    cls.log_enabled = log_enabled
     cls.log_title = log_title
     cls.log_subtitle = log_subtitle
     return cls
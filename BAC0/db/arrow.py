@@ -0,0 +1,169 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+#
+# Copyright (C) 2015 by Christian Tremblay, P.Eng <christian.tremblay@servisys.com>
+# Licensed under LGPLv3, see file LICENSE in this source tree.
+#
+"""
+arrow.py - export of point histories to Parquet or Arrow IPC files.
+
+Files are partitioned by device and day (hive style) ::
+
+    <root>/device_id=<id>/date=<YYYY-MM-DD>/part-<first ts>.parquet
+
+Every export adds new files with the samples read since the previous one.
+<root>/device_id=<id>/_device.json holds the device and point properties
+and the timestamp of the last sample exported. Files starting with "_"
+are ignored by pyarrow.dataset.
+"""
+
+import glob
+import json
+import os.path
+from datetime import datetime, timezone
+
+# --- this application's modules ---
+from ..core.utils.lookfordependency import pyarrow_if_available
+
+_PYARROW, pa, pq, ipc = pyarrow_if_available()
+
+# ------------------------------------------------------------------------------
+
+FORMATS = {"parquet": ".parquet", "arrow": ".arrow"}
+METADATA_FILE = "_device.json"
+_NS_PER_DAY = 86_400 * 1_000_000_000
+
+if _PYARROW:
+    SCHEMA = pa.schema(
+        [
+            ("ts", pa.timestamp("ns", tz="UTC")),
+            ("point", pa.dictionary(pa.int32(), pa.string())),
+            ("value", pa.float64()),
+            ("string_value", pa.dictionary(pa.int32(), pa.string())),
+        ]
+    )
+else:
+    SCHEMA = None
+
+
+def device_folder(root, device_id):
+    return os.path.join(root, f"device_id={device_id}")
+
+
+def is_export(path):
+    """
+    True if path is the folder of a device export
+    """
+    return os.path.isfile(os.path.join(path, METADATA_FILE))
+
+
+def read_metadata(folder):
+    try:
+        with open(os.path.join(folder, METADATA_FILE)) as file:
+            return json.load(file)
+    except FileNotFoundError:
+        return {}
+
+
+def _write_metadata(folder, metadata):
+    filename = os.path.join(folder, METADATA_FILE)
+    with open(f"{filename}.tmp", "w") as file:
+        json.dump(metadata, file)
+    os.replace(f"{filename}.tmp", filename)
+
+
+def _table(rows):
+    """
+    rows : (point, ts, value, string_value)
+    """
+    point, ts, value, string_value = zip(*rows)
+    return pa.Table.from_arrays(
+        [
+            pa.array(ts, pa.int64()).cast(SCHEMA.field("ts").type),
+            pa.array(point, pa.string()).dictionary_encode(),
+            pa.array([None if v is None else float(v) for v in value], pa.float64()),
+            pa.array(string_value, pa.string()).dictionary_encode(),
+        ],
+        schema=SCHEMA,
+    )
+
+
+def _write_table(table, filename, fmt):
+    os.makedirs(os.path.dirname(filename), exist_ok=True)
+    if fmt == "parquet":
+        pq.write_table(table, filename)
+    else:
+        with ipc.new_file(filename, table.schema) as writer:
+            writer.write_table(table)
+
+
+def write_export(
+    root, fmt, device_id, points, samples, device, point_properties, version=1
+):
+    """
+    Write the samples newer than the last export of the device, one file
+    per day. Only uses its arguments, so it can run in a thread or process
+    pool.
+
+    :param fmt: "parquet" or "arrow"
+    :param points: (name, object_type, address, units_state, description)
+    :param samples: (object_type, address, ts, value, string_value)
+    :param device: device properties (JSON)
+    :param point_properties: (name, properties JSON)
+    :param version: version of the properties format
+    :returns: (number of samples written, timestamp of the last one)
+    """
+    if not _PYARROW:
+        raise ImportError("pyarrow is required to export to Parquet or Arrow")
+    folder = device_folder(root, device_id)
+    os.makedirs(folder, exist_ok=True)
+    last = read_metadata(folder).get("last_ts")
+    names = {(point[1], point[2]): point[0] for point in points}
+
+    days = {}
+    for object_type, address, ts, value, string_value in samples:
+        if last is None or ts > last:
+            days.setdefault(ts // _NS_PER_DAY, []).append(
+                (names[(object_type, address)], ts, value, string_value)
+            )
+    newest = last
+    for day, rows in days.items():
+        rows.sort(key=lambda row: row[1])
+        date = datetime.fromtimestamp(day * 86_400, timezone.utc).date()
+        filename = os.path.join(
+            folder, f"date={date.isoformat()}", f"part-{rows[0][1]}{FORMATS[fmt]}"
+        )
+        _write_table(_table(rows), filename, fmt)
+        if newest is None or rows[-1][1] > newest:
+            newest = rows[-1][1]
+
+    _write_metadata(
+        folder,
+        {
+            "format": fmt,
+            "properties_version": version,
+            "last_ts": newest,
+            "device": json.loads(device),
+            "points": {name: json.loads(props) for name, props in point_properties},
+        },
+    )
+    return (sum(len(rows) for rows in days.values()), newest)
+
+
+def read_export(folder):
+    """
+    All the samples of a device export, memory mapped when possible
+
+    :returns: (pyarrow.Table) ts, point, value, string_value
+    """
+    if not _PYARROW:
+        raise ImportError("pyarrow is required to read Parquet or Arrow exports")
+    tables = []
+    for filename in sorted(glob.glob(os.path.join(folder, "date=*", "part-*"))):
+        if filename.endswith(FORMATS["parquet"]):
+            tables.append(pq.read_table(filename, memory_map=True))
+        elif filename.endswith(FORMATS["arrow"]):
+            tables.append(ipc.open_file(pa.memory_map(filename)).read_all())
+    if not tables:
+        return SCHEMA.empty_table()
+    return pa.concat_tables(tables)
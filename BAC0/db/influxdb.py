@@ -1,23 +1,25 @@
+import time
 from datetime import datetime
 
-import pytz
-
 from ..core.utils.lookfordependency import influxdb_if_available
 from ..core.utils.notes import note_and_log
+from .lineprotocol import LineProtocolBuffer, LineProtocolSpool
+from .sinks import Sink
 
 
 _INFLUX, _ = influxdb_if_available()
 if _INFLUX:
-    from influxdb_client import Point, WriteOptions
+    from influxdb_client import WriteOptions
     from influxdb_client.client.influxdb_client_async import InfluxDBClientAsync
 else:
     raise ImportError("Install influxdb to use this feature")
 
 
 @note_and_log
-class InfluxDB:
+class InfluxDB(Sink):
     """
     This class provides a connection to an InfluxDB database.
+    It is a sink (see sinks.py) : interval and accept can be given in params.
 
     It allows for writing to and reading from the database. The connection parameters such as the URL, port, token, organization,
     and bucket are specified as class attributes.
@@ -33,6 +35,12 @@ class InfluxDB:
     username (str): The username for authentication with the InfluxDB server.
     password (str): The password for authentication with the InfluxDB server.
     client (InfluxDBClientAsync): The client for interacting with the InfluxDB server.
+    buffer_size (int): The maximum number of samples waiting to be written.
+    overflow (str): What to do with the oldest samples when the buffer is full,
+        "drop" them or "spool" them to a file replayed when the server answers again.
+    spool_file (str): The spool file, <bucket>_influxdb_spool.lp by default.
+    spool_max_bytes (int): The maximum size of the spool file (no limit if None).
+    replay_batch_size (int): The number of spooled lines sent per request.
     """
 
     url = None
@@ -44,6 +52,11 @@ class InfluxDB:
     tags_file = None
     username = None
     password = None
+    buffer_size = 100_000
+    overflow = "drop"
+    spool_file = None
+    spool_max_bytes = None
+    replay_batch_size = 5_000
     client: InfluxDBClientAsync
 
     def __init__(self, params):
@@ -51,8 +64,22 @@ class InfluxDB:
             setattr(self, k, v)
         if self.bucket is None:
             raise ValueError("Missing bucket name, please provide one in db_params")
+        Sink.__init__(self, interval=self.interval, accept=self.accept)
+        if self.overflow not in ("drop", "spool"):
+            raise ValueError(
+                f"Invalid overflow {self.overflow}, choose 'drop' or 'spool'"
+            )
         # self.connect_to_db()
-        self.points = []
+        self.buffer = LineProtocolBuffer()
+        self.spool = LineProtocolSpool(
+            self.spool_file or f"{self.bucket}_influxdb_spool.lp",
+            max_bytes=self.spool_max_bytes,
+        )
+        self.written = 0
+        self.dropped = 0
+        self.spooled = 0
+        self.failures = 0
+        self._next_attempt = 0.0
         self.write_options = WriteOptions(
             batch_size=getattr(self, "batch_size", 25),
             flush_interval=getattr(self, "flush_interval", 10_000),
@@ -81,7 +108,7 @@ class InfluxDB:
         """
         async with InfluxDBClientAsync.from_env_properties() as client:
             try:
-                self.log(f"Write called for record: {record}", level="debug")
+                self.log("Write called", level="debug")
                 write_api = client.write_api()
                 success = await write_api.write(
                     bucket=bucket, org=self.org, record=record
@@ -89,7 +116,7 @@ class InfluxDB:
                 self.log(f"Write response: {success}", level="debug")
                 return success
             except Exception as error:
-                self.log(f"Error while writing{record} to db: {error}", level="error")
+                self.log(f"Error while writing to db: {error}", level="error")
                 return False
 
     async def query(self, query: str) -> list:
@@ -215,54 +242,109 @@ class InfluxDB:
                 f"Error while cleaning value {val} of object type {object_type}: {error}"
             )
 
-    def prepare_point(self, list_of_points):
-        _points = []
-
-        for point in list_of_points:
-            _object_name = point.properties.name
-            _devicename = point.properties.device.properties.name
-            _device_id = point.properties.device.properties.device_id
-            _units_state = f"{point.properties.units_state}"
-            _description = point.properties.description
-            _object = f"{point.properties.type}:{point.properties.address}"
-            _value, _string_value = self.clean_value(
-                point.properties.type, point.lastValue, point.properties.units_state
-            )
-            _name = f"{_devicename}/{_object_name}"
-            _id = f"Device_{_device_id}/{_object}"
-            _point = (
-                Point(_id)
-                .tag("object_name", _object_name)
-                .tag("name", _name)
-                .tag("description", _description)
-                .tag("units_state", _units_state)
-                .tag("object", _object)
-                .tag("device", _devicename)
-                .tag("device_id", _device_id)
-                .field("value", _value)
-                .field("string_value", _string_value)
-                .time(point.lastTimestamp.astimezone(pytz.UTC))
-            )
-            for each in point.tags:
-                _tag_id, _tag_value = each
-                _point.tag(_tag_id, _tag_value)
-            self.points.append(_point)
+    @property
+    def metrics(self):
+        """
+        State of the write buffer and of the spool
+        """
+        return {
+            "buffered": len(self.buffer),
+            "buffer_size": self.buffer_size,
+            "written": self.written,
+            "dropped": self.dropped,
+            "spooled": self.spooled,
+            "spool_bytes": self.spool.pending(),
+            "failures": self.failures,
+            "next_attempt_in": max(self._next_attempt - time.monotonic(), 0),
+        }
+
+    def _add_sample(self, point, value, timestamp):
+        """
+        Buffer one sample of a point, called each time a point is read.
+        The line protocol is built when the buffer is written.
+
+        :param value: value as stored in the point history
+        :param timestamp: (int) nanoseconds since epoch
+        """
+        self.buffer.append(point, value, timestamp)
+        if len(self.buffer) > self.buffer_size:
+            self._overflow()
+
+    def _overflow(self):
+        # room is made for a tenth of the buffer, not at every sample
+        count = len(self.buffer) - self.buffer_size + self.buffer_size // 10
+        if self.overflow == "spool":
+            lines, count = self.buffer.encode(count)
+            if self.spool.append(lines):
+                self.buffer.discard(count)
+                self.spooled += count
+                self.log(
+                    f"InfluxDB buffer full, {count} samples spooled to {self.spool.filename}",
+                    level="warning",
+                )
+                return
+            self.log(f"Spool file {self.spool.filename} is full", level="warning")
+        self.buffer.discard(count)
+        self.dropped += count
+        self.log(
+            f"InfluxDB buffer full, {count} oldest samples dropped", level="warning"
+        )
+
+    def _backoff(self):
+        self.failures += 1
+        options = self.write_options
+        delay = min(
+            options.retry_interval * options.exponential_base ** (self.failures - 1),
+            options.max_retry_delay,
+        )
+        self._next_attempt = time.monotonic() + delay / 1000
+        self.log(
+            f"InfluxDB write failed ({self.failures} in a row), next attempt in {delay / 1000:.1f} s",
+            level="warning",
+        )
 
     async def write_points_lastvalue_to_db(self, list_of_points):
         """
-        Writes a list of points to the InfluxDB database.
+        Writes the buffered samples to the InfluxDB database, in one request,
+        then replays the spool file if there is one.
+        After a failure, samples are kept and the next attempts are delayed
+        (exponential backoff using retry_interval, exponential_base and
+        max_retry_delay).
 
         Args:
-            list_of_points (list): A list of points to be written to the database.
+            list_of_points (list): not used, every buffered sample is written
 
         Returns:
-            None
+            bool: False if the write failed or was delayed
         """
+        if time.monotonic() < self._next_attempt:
+            return False
+        if len(self.buffer) > 0:
+            lines, count = self.buffer.encode()
+            # samples may be dropped or spooled while waiting for the server
+            end = self.buffer.start + count
+            self.log(f"Writing {count} samples to db", level="debug")
+            if not await self.write(self.bucket, lines):
+                self._backoff()
+                return False
+            self.buffer.discard(max(end - self.buffer.start, 0))
+            self.written += count
+        while self.spool.pending():
+            lines, offset = self.spool.read(self.replay_batch_size)
+            if not lines:
+                # incomplete last line
+                self.spool.clear()
+                break
+            if not await self.write(self.bucket, lines):
+                self._backoff()
+                return False
+            self.spool.advance(offset)
+            self.log(f"Spool replayed up to byte {offset}", level="debug")
+        self.failures = 0
+        return True
 
-        self.log(f"Writing to db: {self.points}", level="debug")
-        success = await self.write(self.bucket, self.points)
-        if success:
-            self.points = []
+    async def flush(self):
+        return await self.write_points_lastvalue_to_db([])
 
     def read_last_value_from_db(self, id=None):
         # example id : Device_5004/analogInput:1
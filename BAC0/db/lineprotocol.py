@@ -0,0 +1,308 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+#
+# Copyright (C) 2015 by Christian Tremblay, P.Eng <christian.tremblay@servisys.com>
+# Licensed under LGPLv3, see file LICENSE in this source tree.
+#
+"""
+lineprotocol.py - InfluxDB line protocol encoding of point samples.
+
+Adding a sample only appends to three columns. The measurement and tags of
+a point are formatted once (and kept on the point), the lines are built
+when the buffer is written.
+
+When InfluxDB can't be reached, the oldest samples can be moved to a spool
+file (append-only) and replayed later.
+"""
+
+import itertools
+import math
+import os
+import typing as t
+from array import array
+
+# --- this application's modules ---
+from ..core.utils.notes import note_and_log
+
+# ------------------------------------------------------------------------------
+
+
+_ESCAPE_MEASUREMENT = str.maketrans(
+    {",": r"\,", " ": r"\ ", "\n": r"\n", "\t": r"\t", "\r": r"\r"}
+)
+_ESCAPE_TAG = str.maketrans(
+    {",": r"\,", "=": r"\=", " ": r"\ ", "\n": r"\n", "\t": r"\t", "\r": r"\r"}
+)
+_ESCAPE_STRING = str.maketrans({'"': r"\"", "\\": r"\\"})
+
+
+def _escape_measurement(value: str) -> str:
+    return value.translate(_ESCAPE_MEASUREMENT)
+
+
+def _escape_tag(value: str) -> str:
+    return value.translate(_ESCAPE_TAG)
+
+
+def _escape_string(value: str) -> str:
+    return '"{}"'.format(value.translate(_ESCAPE_STRING))
+
+
+@note_and_log
+class PointSeries(object):
+    """
+    What doesn't change between the samples of a point : measurement and
+    tags (already escaped), kind of value, units and state texts.
+
+    info is used by the other sinks : (device_id, point name, object type,
+    address, units_state, description)
+    """
+
+    # a value that can't be converted is logged once per point
+    _bad_value_logged = False
+
+    def __init__(
+        self,
+        measurement: str,
+        tags: t.Dict[str, t.Any],
+        kind,
+        units,
+        states,
+        info: t.Optional[tuple] = None,
+    ):
+        self.prefix = _escape_measurement(measurement) + "".join(
+            f",{_escape_tag(str(key))}={_escape_tag(str(value))}"
+            for key, value in sorted(tags.items())
+            if value is not None and str(value) != ""
+        )
+        self.kind = kind
+        self.units = units
+        self.states = states
+        self.info = info
+
+    @classmethod
+    def of(cls, point) -> "PointSeries":
+        """
+        PointSeries of a point, built the first time then kept on the point
+        """
+        series = getattr(point, "_line_protocol", None)
+        if series is None:
+            series = point._line_protocol = cls.from_point(point)
+        return series
+
+    @classmethod
+    def from_point(cls, point) -> "PointSeries":
+        device = point.properties.device.properties
+        object_type = str(point.properties.type)
+        _object = f"{object_type}:{point.properties.address}"
+        tags = {
+            "object_name": point.properties.name,
+            "name": f"{device.name}/{point.properties.name}",
+            "description": point.properties.description,
+            "units_state": f"{point.properties.units_state}",
+            "object": _object,
+            "device": device.name,
+            "device_id": device.device_id,
+        }
+        tags.update(dict(point.tags))
+        states = None
+        if "analog" in object_type:
+            kind = "analog"
+        elif "binary" in object_type or "multi" in object_type:
+            kind = "state"
+            states = point._history_state_texts()
+        else:
+            kind = "object"
+        return cls(
+            f"Device_{device.device_id}/{_object}",
+            tags,
+            kind,
+            point.properties.units_state,
+            states,
+            info=(
+                device.device_id,
+                point.properties.name,
+                object_type,
+                point.properties.address,
+                f"{point.properties.units_state}",
+                point.properties.description,
+            ),
+        )
+
+    def values(self, value) -> t.Optional[t.Tuple[t.Any, str]]:
+        """
+        (value, string_value) of a sample, None if the value can't be written.
+        value is None for samples that are not numbers.
+        """
+        if value is None:
+            return None
+        try:
+            if self.kind == "analog":
+                value = float(value)
+                if not math.isfinite(value):
+                    return None
+                return (value, f"{value:.3f} {self.units}")
+            if self.kind == "state":
+                value = int(value)
+                return (value, self.states.get(value, "n/a"))
+        except (TypeError, ValueError) as error:
+            if not self._bad_value_logged:
+                self._bad_value_logged = True
+                self._log.warning(
+                    f"Sample {value!r} of {self.prefix} skipped, it will not be "
+                    f"logged again for this point : {error}"
+                )
+            return None
+        if isinstance(value, (int, float)):
+            if not math.isfinite(value):
+                return None
+            return (value, str(value))
+        return (None, str(value))
+
+    def fields(self, value) -> t.Optional[str]:
+        """
+        Field set of a sample, None if the value can't be written
+        """
+        if self.kind != "object":
+            values = self.values(value)
+            if values is None:
+                return None
+            value, text = values
+            field = repr(value) if self.kind == "analog" else f"{value}i"
+            return f"value={field},string_value={_escape_string(text)}"
+        if value is None:
+            return None
+        if isinstance(value, bool):
+            field = "true" if value else "false"
+        elif isinstance(value, int):
+            field = f"{value}i"
+        elif isinstance(value, float):
+            if not math.isfinite(value):
+                return None
+            field = repr(value)
+        else:
+            field = _escape_string(str(value))
+        return f"value={field},string_value={_escape_string(str(value))}"
+
+
+class LineProtocolBuffer(object):
+    """
+    Samples waiting to be written to InfluxDB, stored by column.
+    """
+
+    def __init__(self):
+        self._series: t.List[PointSeries] = []
+        self._timestamps = array("q")
+        self._values: t.List[t.Any] = []
+        # number of samples discarded since the creation of the buffer
+        self.start = 0
+
+    def __len__(self) -> int:
+        return len(self._timestamps)
+
+    def append(self, point, value, timestamp: int) -> None:
+        """
+        :param value: value as stored in the point history (state code for
+            binary and multistate points)
+        :param timestamp: (int) nanoseconds since epoch
+        """
+        self._series.append(PointSeries.of(point))
+        self._timestamps.append(timestamp)
+        self._values.append(value)
+
+    def encode(self, count: t.Optional[int] = None) -> t.Tuple[str, int]:
+        """
+        Line protocol of the first count samples (all by default)
+
+        :returns: (lines, number of samples encoded)
+        """
+        count = len(self) if count is None else min(count, len(self))
+        lines = []
+        for series, value, timestamp in zip(
+            self._series[:count], self._values[:count], self._timestamps[:count]
+        ):
+            fields = series.fields(value)
+            if fields is not None:
+                lines.append(f"{series.prefix} {fields} {timestamp}")
+        return ("\n".join(lines), count)
+
+    def discard(self, count: int) -> None:
+        """
+        Remove the first count samples (once written)
+        """
+        del self._series[:count]
+        del self._timestamps[:count]
+        del self._values[:count]
+        self.start += count
+
+
+class LineProtocolSpool(object):
+    """
+    Append-only file of line protocol, replayed once InfluxDB answers again.
+    Sending lines twice is harmless, InfluxDB keeps one point per series and
+    timestamp.
+
+    :param filename: (str) spool file
+    :param max_bytes: (int) maximum size of the file, None for no limit
+    """
+
+    def __init__(self, filename: str, max_bytes: t.Optional[int] = None):
+        self.filename = filename
+        self.max_bytes = max_bytes
+        self._offset = 0
+
+    @property
+    def size(self) -> int:
+        try:
+            return os.path.getsize(self.filename)
+        except FileNotFoundError:
+            return 0
+
+    def pending(self) -> int:
+        """
+        Bytes not replayed yet
+        """
+        return max(self.size - self._offset, 0)
+
+    def append(self, lines: str) -> bool:
+        """
+        :returns: (bool) False if the file would exceed max_bytes
+        """
+        if not lines:
+            return True
+        data = f"{lines}\n".encode("utf-8")
+        if self.max_bytes is not None and self.size + len(data) > self.max_bytes:
+            return False
+        with open(self.filename, "ab") as file:
+            file.write(data)
+        return True
+
+    def read(self, count: int) -> t.Tuple[str, int]:
+        """
+        Next count lines to replay. Only complete lines are returned.
+
+        :returns: (lines, offset to pass to advance() once they are written)
+        """
+        with open(self.filename, "rb") as file:
+            file.seek(self._offset)
+            lines = [
+                line for line in itertools.islice(file, count) if line.endswith(b"\n")
+            ]
+        data = b"".join(lines)
+        return (data.decode("utf-8").rstrip("\n"), self._offset + len(data))
+
+    def advance(self, offset: int) -> None:
+        """
+        Lines before offset are written. The file is removed when everything
+        has been replayed.
+        """
+        self._offset = offset
+        if self._offset >= self.size:
+            self.clear()
+
+    def clear(self) -> None:
+        try:
+            os.remove(self.filename)
+        except FileNotFoundError:
+            pass
+        self._offset = 0
@@ -0,0 +1,382 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+#
+# Copyright (C) 2015 by Christian Tremblay, P.Eng <christian.tremblay@servisys.com>
+# Licensed under LGPLv3, see file LICENSE in this source tree.
+#
+"""
+sinks.py - destinations of the samples read on the network.
+
+Each time a point is read, network.database.add_sample() is called. A sink
+only buffers the sample there ; flush() is called periodically by the
+network and writes the buffer (InfluxDB, SQLite, CSV or Parquet files...).
+
+SinkFanOut sends the samples to several sinks. Each sink can keep only some
+points (accept) and downsample (interval) ::
+
+    db_params = [
+        {"name": "parquet", "folder": "fast_polls"},
+        {"name": "InfluxDB", "bucket": "BAC0", "interval": 60},
+    ]
+"""
+
+import csv
+import glob
+import os.path
+import typing as t
+from collections import deque
+from datetime import datetime, timezone
+
+# --- 3rd party modules ---
+import aiosqlite
+
+# --- this application's modules ---
+from ..core.io.IOExceptions import WrongParameter
+from ..core.utils.notes import note_and_log
+from . import arrow
+from .lineprotocol import PointSeries
+from .sql import TALL_SCHEMA
+
+# ------------------------------------------------------------------------------
+
+
+@note_and_log
+class Sink(object):
+    """
+    Base class of the sinks. Subclasses implement _add_sample() and flush().
+
+    :param interval: (float) seconds, keep at most one sample per point in
+        each interval (the first one). None keeps every sample.
+    :param accept: (callable) point -> bool, samples of the other points
+        are ignored
+    """
+
+    interval = None
+    accept = None
+
+    def __init__(
+        self,
+        interval: t.Optional[float] = None,
+        accept: t.Optional[t.Callable] = None,
+    ):
+        self.interval = interval
+        self.accept = accept
+        self._last_sample: t.Dict[PointSeries, int] = {}
+
+    def add_sample(self, point, value, timestamp: int) -> None:
+        """
+        Called each time a point is read
+
+        :param value: value as stored in the point history
+        :param timestamp: (int) nanoseconds since epoch
+        """
+        if self.accept is not None and not self.accept(point):
+            return
+        if self.interval:
+            series = PointSeries.of(point)
+            last = self._last_sample.get(series)
+            if last is not None and timestamp - last < self.interval * 1e9:
+                return
+            self._last_sample[series] = timestamp
+        self._add_sample(point, value, timestamp)
+
+    def _add_sample(self, point, value, timestamp: int) -> None:
+        raise NotImplementedError()
+
+    def prepare_point(self, list_of_points) -> None:
+        """
+        Add the last valid sample of each point
+        """
+        for point in list_of_points:
+            timestamp, value = point._history.last_valid()
+            if timestamp is not None:
+                self.add_sample(point, value, timestamp)
+
+    async def flush(self) -> bool:
+        """
+        Write the buffered samples
+
+        :returns: (bool) False if they couldn't be written (they are kept)
+        """
+        return True
+
+    async def close(self) -> None:
+        await self.flush()
+
+    async def _health(self) -> bool:
+        return True
+
+
+class SinkFanOut(Sink):
+    """
+    Send the samples to several sinks. An error in one of them doesn't
+    prevent the others from being written.
+    """
+
+    def __init__(self, sinks: t.Iterable[Sink]):
+        super().__init__()
+        self.sinks = list(sinks)
+
+    def add_sample(self, point, value, timestamp: int) -> None:
+        for sink in self.sinks:
+            sink.add_sample(point, value, timestamp)
+
+    async def flush(self) -> bool:
+        success = True
+        for sink in self.sinks:
+            try:
+                success = await sink.flush() and success
+            except Exception as error:
+                self.log(f"Error flushing {sink} : {error}", level="error")
+                success = False
+        return success
+
+    async def close(self) -> None:
+        for sink in self.sinks:
+            try:
+                await sink.close()
+            except Exception as error:
+                self.log(f"Error closing {sink} : {error}", level="error")
+
+    async def _health(self) -> bool:
+        results = [await sink._health() for sink in self.sinks]
+        return all(results)
+
+
+class MemorySink(Sink):
+    """
+    Keep the samples in memory (point, value, timestamp), for tests
+
+    :param maxlen: (int) number of samples kept, None for no limit
+    """
+
+    def __init__(self, maxlen: t.Optional[int] = None, **kwargs):
+        super().__init__(**kwargs)
+        self.samples = deque(maxlen=maxlen)
+        self.flushes = 0
+
+    def _add_sample(self, point, value, timestamp: int) -> None:
+        self.samples.append((point, value, timestamp))
+
+    async def flush(self) -> bool:
+        self.flushes += 1
+        return True
+
+
+class _RowSink(Sink):
+    """
+    Sinks writing (series, (value, string_value), timestamp) rows when
+    flushed. Samples that can't be written are dropped when they are added,
+    so they can't make every flush fail.
+    """
+
+    def __init__(self, **kwargs):
+        super().__init__(**kwargs)
+        self._rows: t.List[t.Tuple[PointSeries, tuple, int]] = []
+
+    def _add_sample(self, point, value, timestamp: int) -> None:
+        series = PointSeries.of(point)
+        values = series.values(value)
+        if values is not None:
+            self._rows.append((series, values, timestamp))
+
+    def _take_rows(self):
+        rows, self._rows = self._rows, []
+        return rows
+
+
+class SQLiteSink(_RowSink):
+    """
+    Samples appended to a SQLite database using the tall layout (points and
+    point_history tables), so it can be opened like a device saved with
+    db_layout="tall".
+
+    :param filename: (str) database file
+    """
+
+    def __init__(self, filename: str = "BAC0_samples.db", **kwargs):
+        super().__init__(**kwargs)
+        self.filename = filename
+        self._point_ids: t.Dict[tuple, int] = {}
+
+    async def flush(self) -> bool:
+        rows = self._take_rows()
+        if not rows:
+            return True
+        try:
+            async with aiosqlite.connect(self.filename) as con:
+                await con.execute("PRAGMA journal_mode=WAL")
+                await con.executescript(TALL_SCHEMA)
+                samples = []
+                for series, values, timestamp in rows:
+                    key = series.info[:1] + series.info[2:4]
+                    if key not in self._point_ids:
+                        self._point_ids[key] = await self._point_id(con, series)
+                    samples.append((key[0], self._point_ids[key], timestamp, *values))
+                await con.executemany(
+                    "INSERT OR REPLACE INTO point_history "
+                    "(device_id, point_id, ts, value, string_value) "
+                    "VALUES (?, ?, ?, ?, ?)",
+                    samples,
+                )
+                await con.commit()
+        except Exception as error:
+            self._rows[:0] = rows
+            self.log(
+                f"Error writing samples to {self.filename} : {error}", level="error"
+            )
+            return False
+        return True
+
+    async def _point_id(self, con, series) -> int:
+        await con.execute(
+            "INSERT INTO points "
+            "(device_id, name, object_type, address, units_state, description) "
+            "VALUES (?, ?, ?, ?, ?, ?) "
+            "ON CONFLICT (device_id, object_type, address) DO UPDATE SET "
+            "name = excluded.name, units_state = excluded.units_state, "
+            "description = excluded.description",
+            series.info,
+        )
+        async with con.execute(
+            "SELECT point_id FROM points "
+            "WHERE device_id IS ? AND object_type = ? AND address = ?",
+            series.info[:1] + series.info[2:4],
+        ) as cursor:
+            return (await cursor.fetchone())[0]
+
+
+class FileSink(_RowSink):
+    """
+    Samples written to files, a new file every rotation seconds ::
+
+        <folder>/samples-<start of period>.csv
+        <folder>/samples-<start of period>-<first ts>.parquet
+
+    CSV files are appended at each flush. Parquet files are written once
+    their period is over (or when the sink is closed).
+
+    :param folder: (str) where the files are written
+    :param fmt: "csv" or "parquet"
+    :param rotation: (int) seconds covered by each file
+    :param keep: (int) number of files kept, None to keep them all
+    """
+
+    def __init__(
+        self,
+        folder: str = "BAC0_samples",
+        fmt: str = "csv",
+        rotation: int = 3600,
+        keep: t.Optional[int] = None,
+        **kwargs,
+    ):
+        if fmt not in ("csv", "parquet"):
+            raise WrongParameter(f"Invalid format {fmt}, choose 'csv' or 'parquet'")
+        super().__init__(**kwargs)
+        self.folder = folder
+        self.fmt = fmt
+        self.rotation = rotation
+        self.keep = keep
+
+    def _period(self, timestamp: int) -> int:
+        return int(timestamp // (self.rotation * 1_000_000_000))
+
+    def _filename(self, period: int, suffix: str = "") -> str:
+        start = datetime.fromtimestamp(period * self.rotation, timezone.utc)
+        name = f"samples-{start:%Y%m%dT%H%M%S}{suffix}.{self.fmt}"
+        return os.path.join(self.folder, name)
+
+    async def flush(self, final: bool = False) -> bool:
+        rows = self._take_rows()
+        if not rows:
+            return True
+        periods = {}
+        for row in rows:
+            periods.setdefault(self._period(row[2]), []).append(row)
+        current = self._period(datetime.now(timezone.utc).timestamp() * 1e9)
+        # rows to keep : current period, and what is not written on error
+        kept = []
+        periods = sorted(periods.items())
+        try:
+            os.makedirs(self.folder, exist_ok=True)
+            while periods:
+                period, period_rows = periods[0]
+                if self.fmt == "csv":
+                    self._write_csv(period, period_rows)
+                elif period < current or final:
+                    self._write_parquet(period, period_rows)
+                else:
+                    # current period, kept until it is over
+                    kept.extend(period_rows)
+                del periods[0]
+        except Exception as error:
+            for period, period_rows in periods:
+                kept.extend(period_rows)
+            self._rows[:0] = kept
+            self.log(f"Error writing samples to {self.folder} : {error}", level="error")
+            return False
+        self._rows[:0] = kept
+        self._remove_old_files()
+        return True
+
+    async def close(self) -> None:
+        await self.flush(final=True)
+
+    def _write_csv(self, period, rows) -> None:
+        filename = self._filename(period)
+        new = not os.path.exists(filename)
+        with open(filename, "a", newline="") as file:
+            writer = csv.writer(file)
+            if new:
+                writer.writerow(["timestamp", "point", "value", "string_value"])
+            for series, values, timestamp in rows:
+                writer.writerow(
+                    [
+                        datetime.fromtimestamp(timestamp / 1e9, timezone.utc),
+                        f"{series.info[0]}/{series.info[1]}",
+                        *values,
+                    ]
+                )
+
+    def _write_parquet(self, period, rows) -> None:
+        table_rows = [
+            (f"{series.info[0]}/{series.info[1]}", timestamp, *values)
+            for series, values, timestamp in rows
+        ]
+        if table_rows:
+            table_rows.sort(key=lambda row: row[1])
+            filename = self._filename(period, f"-{table_rows[0][1]}")
+            arrow._write_table(arrow._table(table_rows), filename, "parquet")
+
+    def _remove_old_files(self) -> None:
+        if self.keep is None:
+            return
+        files = sorted(glob.glob(os.path.join(self.folder, f"samples-*.{self.fmt}")))
+        for filename in files[: max(len(files) - self.keep, 0)]:
+            os.remove(filename)
+
+
+def sink_from_params(params) -> Sink:
+    """
+    Sink described by db_params : a dict with a name (InfluxDB, sqlite, csv,
+    parquet or memory) and the parameters of the sink, a Sink, or a list of
+    those (fan-out).
+    """
+    if isinstance(params, Sink):
+        return params
+    if isinstance(params, (list, tuple)):
+        sinks = [sink_from_params(each) for each in params]
+        return sinks[0] if len(sinks) == 1 else SinkFanOut(sinks)
+    kwargs = dict(params)
+    name = str(kwargs.pop("name", "")).lower()
+    if name == "influxdb":
+        from .influxdb import InfluxDB
+
+        return InfluxDB(params)
+    if name == "sqlite":
+        return SQLiteSink(**kwargs)
+    if name in ("csv", "parquet"):
+        return FileSink(fmt=name, **kwargs)
+    if name == "memory":
+        return MemorySink(**kwargs)
+    raise WrongParameter(f"Unknown database {name}")
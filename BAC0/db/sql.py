@@ -8,32 +8,322 @@
 sql.py -
 """
 
+import asyncio
+import json
 import os.path
 
 # --- standard Python modules ---
 import pickle
+import sqlite3
+import time
+from contextlib import closing
+from itertools import groupby
 
 # --- 3rd party modules ---
 import aiosqlite
+from bacpypes3.primitivedata import Enumerated
 
 from ..core.io.IOExceptions import (
     DataError,
     NoResponseFromController,
     RemovedPointException,
+    WrongParameter,
 )
+from ..core.devices.History import local_timezone
 from ..core.utils.lookfordependency import pandas_if_available
+from . import arrow
 
 _PANDAS, pd, sql, Timestamp = pandas_if_available()
 # --- this application's modules ---
 
 # ------------------------------------------------------------------------------
 
+# "tall" layout : one row per sample, points described in their own table
+TALL_SCHEMA = """
+CREATE TABLE IF NOT EXISTS points (
+    point_id INTEGER PRIMARY KEY,
+    device_id INTEGER,
+    name TEXT NOT NULL,
+    object_type TEXT NOT NULL,
+    address INTEGER NOT NULL,
+    units_state TEXT,
+    description TEXT,
+    UNIQUE (device_id, object_type, address)
+);
+CREATE INDEX IF NOT EXISTS points_by_name ON points (device_id, name);
+CREATE TABLE IF NOT EXISTS point_history (
+    device_id INTEGER,
+    point_id INTEGER NOT NULL REFERENCES points (point_id),
+    ts INTEGER NOT NULL,
+    value NUMERIC,
+    string_value TEXT,
+    PRIMARY KEY (device_id, point_id, ts)
+) WITHOUT ROWID;
+CREATE TABLE IF NOT EXISTS metadata (name TEXT PRIMARY KEY, value TEXT);
+"""
+
+# Device and point properties, stored as JSON with the histories
+PROPERTIES_VERSION = 1
+PROPERTIES_SCHEMA = """
+CREATE TABLE IF NOT EXISTS metadata (name TEXT PRIMARY KEY, value TEXT);
+CREATE TABLE IF NOT EXISTS point_properties (
+    name TEXT PRIMARY KEY,
+    properties TEXT NOT NULL
+);
+"""
+
+
+def _quote(identifier):
+    """
+    Quote a table or column name for SQLite
+    """
+    return '"{}"'.format(str(identifier).replace('"', '""'))
+
+
+def _sql_type(dtype):
+    if pd.api.types.is_integer_dtype(dtype) or pd.api.types.is_bool_dtype(dtype):
+        return "INTEGER"
+    if pd.api.types.is_float_dtype(dtype):
+        return "REAL"
+    return "TEXT"
+
+
+def _tall_values(point, kind, value):
+    """
+    (value, string_value) stored in the tall layout for one sample
+    """
+    if value is None or value != value:
+        return None
+    if kind == "float":
+        return (value, None)
+    if kind == "int":
+        return (value, point._history_value(value).split(": ", 1)[-1])
+    if isinstance(value, (int, float)):
+        return (value, None)
+    return (None, str(value))
+
+
+def _newest(stamps):
+    """
+    Latest of text timestamps, whatever their UTC offset
+    """
+    return pd.to_datetime(stamps, utc=True).max().isoformat(sep=" ")
+
+
+def histories_to_df(histories, resampling="1s"):
+    """
+    Build the dataframe saved in the wide layout from (name, type, history,
+    states) tuples. Only uses its arguments, so it can run in a thread or
+    process pool.
+
+    Analog values are resampled with mean(). Binary and multistate
+    histories are integer codes, resampled with last(); their state text
+    ("<name>_str" column, categorical) comes from the states mapping
+    {code: text}. Other points are not saved.
+
+    :param resampling: pandas frequency, 0 or False to keep the samples
+    :raises DataError: if a history cannot be resampled
+    """
+    backup = {}
+    resampling_needed = isinstance(resampling, str)
+
+    for name, object_type, history, states in histories:
+        try:
+            if resampling_needed:
+                resampler = history.resample(resampling)
+                if states is None:
+                    history = resampler.mean()
+                else:
+                    history = resampler.last()
+            if states is not None:
+                texts = history.map(states).fillna("n/a")
+                backup[f"{name}_str"] = texts.where(history.notna()).astype("category")
+            backup[name] = history
+        except Exception as error:
+            raise DataError(
+                f"Error in resampling {name} | {error} (probably not enough points)"
+            )
+
+    df = pd.DataFrame(backup)
+    if resampling_needed:
+        return df.resample(resampling).last().ffill().bfill()
+    return df
+
+
+def _jsonable(value):
+    """
+    Plain Python value that json can store. BACnet enumerations are kept
+    by name, other objects as text.
+    """
+    if value is None or type(value) in (str, int, float, bool):
+        return value
+    if isinstance(value, dict):
+        return {str(k): _jsonable(v) for k, v in value.items()}
+    if isinstance(value, (list, tuple, set)):
+        return [_jsonable(v) for v in value]
+    if isinstance(value, Enumerated):
+        return str(value)
+    if isinstance(value, int):
+        return int(value)
+    if isinstance(value, float):
+        return float(value)
+    return str(value)
+
+
+def _to_json(value):
+    return json.dumps(_jsonable(value))
+
+
+class SaveSnapshot(object):
+    """
+    What a save writes, taken from the device on the event loop. The
+    database can then be written later without touching the device points.
+
+        * histories : (name, type, history Series, states) for the wide layout
+        * points, samples : rows for the points and point_history tables
+          of the tall layout
+        * properties : device and point properties as JSON
+    """
+
+    def __init__(self, db_name, layout, resampling, device_id=None):
+        self.db_name = db_name
+        self.layout = layout
+        self.resampling = resampling
+        self.device_id = device_id
+        self.histories = []
+        self.points = []
+        self.samples = []
+        self.properties = None
+        self.created = time.monotonic()
+
+
+class SQLHistory(object):
+    """
+    Histories of a saved device, read from the SQLite file in one query.
+    The Series of a point is built the first time it is needed then kept.
+    The last valid sample of every point is found while loading.
+    """
+
+    def __init__(self):
+        self.names = []
+        self._df = None
+        self._samples = {}
+        self._series = {}
+        self._last = {}
+
+    @classmethod
+    async def load(cls, con, device_id=None, tall=False):
+        self = cls()
+        if tall:
+            request = (
+                "SELECT p.name, h.ts, coalesce(h.value, h.string_value) "
+                "FROM points p JOIN point_history h "
+                "ON h.device_id IS p.device_id AND h.point_id = p.point_id "
+                "WHERE ? IS NULL OR p.device_id = ? ORDER BY p.point_id, h.ts"
+            )
+            async with con.execute(request, (device_id, device_id)) as cursor:
+                rows = await cursor.fetchall()
+            for name, samples in groupby(rows, key=lambda row: row[0]):
+                samples = list(samples)
+                self.names.append(name)
+                self._samples[name] = samples
+                self._last[name] = (samples[-1][1], samples[-1][2])
+            return self
+
+        async with con.execute("SELECT * FROM history") as cursor:
+            rows = await cursor.fetchall()
+            columns = [description[0] for description in cursor.description]
+        df = pd.DataFrame(rows, columns=columns)
+        index = pd.to_datetime(df.pop(columns[0]), utc=True)
+        df.index = index.dt.tz_convert(local_timezone())
+        # rows ordered as instants, not as text timestamps. Older saves
+        # appended the last saved row again, keep one row per timestamp
+        df = df.sort_index(kind="stable")
+        df = df[~df.index.duplicated(keep="last")]
+        self._df = df
+        self.names = list(df.columns)
+        for name in self.names:
+            column = df[name].dropna()
+            if len(column):
+                self._last[name] = (column.index[-1], column.iloc[-1])
+        return self
+
+    @classmethod
+    def from_table(cls, table):
+        """
+        Histories of a Parquet / Arrow export (see arrow.read_export)
+        """
+        self = cls()
+        df = table.to_pandas().sort_values("ts", kind="stable")
+        for name, group in df.groupby("point", sort=False, observed=True):
+            values = group["value"]
+            if values.isna().any():
+                values = values.astype(object).where(
+                    values.notna(), group["string_value"].astype(object)
+                )
+            index = pd.DatetimeIndex(group["ts"]).tz_convert(local_timezone())
+            name = str(name)
+            self.names.append(name)
+            self._series[name] = pd.Series(values.to_numpy(), index=index, name=name)
+            self._last[name] = (index[-1].value, values.iloc[-1])
+        return self
+
+    def __contains__(self, name):
+        return name in self._last or name in self.names
+
+    def series(self, name):
+        """
+        returns: (pd.Series) history of the point
+        """
+        try:
+            return self._series[name]
+        except KeyError:
+            pass
+        if self._df is not None:
+            series = self._df[name]
+        else:
+            samples = self._samples.get(name, [])
+            index = pd.to_datetime([row[1] for row in samples], unit="ns", utc=True)
+            series = pd.Series(
+                [row[2] for row in samples],
+                index=index.tz_convert(local_timezone()),
+                name=name,
+            )
+        self._series[name] = series
+        return series
+
+    def last(self, name):
+        """
+        Last valid sample of a point
+
+        :returns: (timestamp, value)
+        :raises IndexError: if the point has no valid sample
+        """
+        try:
+            timestamp, value = self._last[name]
+        except KeyError:
+            raise IndexError(f"No history for {name}")
+        if self._df is None:
+            timestamp = pd.Timestamp(timestamp, unit="ns", tz="UTC").tz_convert(
+                local_timezone()
+            )
+        return (timestamp, value)
+
 
 class SQLMixin(object):
     """
     Use SQL to persist a device's contents.  By saving the device contents to an SQL
     database, you can work with the device's data while offline, or while the device
     is not available.
+
+    Two layouts are available (properties.db_layout) :
+
+        * wide : a history table with one column per point (resampled)
+        * tall : a point_history table with one row per sample, indexed by
+          (device_id, point_id, ts) and a points table describing each point
+
+    Histories can also be exported to Parquet or Arrow IPC files (see
+    arrow.py) with save(export="parquet") or save(export="arrow").
     """
 
     async def _read_from_sql(self, request, db_name):
@@ -47,6 +337,17 @@ class SQLMixin(object):
                 columns = [description[0] for description in cursor.description]
                 return pd.DataFrame(rows, columns=columns)
 
+    def _points_properties(self):
+        pprops = {}
+        for each in self.points:
+            p = each.properties.asdict.copy()
+            p.pop("device", None)
+            p.pop("network", None)
+            p.pop("simulated", None)
+            p.pop("overridden", None)
+            pprops[str(each.properties.name)] = p
+        return pprops
+
     def dev_properties_df(self):
         dic = self.properties.asdict.copy()
         dic.pop("network", None)
@@ -58,16 +359,32 @@ class SQLMixin(object):
         """
         Return a dictionary of point/point_properties in preparation for storage in SQL.
         """
-        pprops = {}
-        for each in self.points:
-            p = each.properties.asdict.copy()
-            p.pop("device", None)
-            p.pop("network", None)
-            p.pop("simulated", None)
-            p.pop("overridden", None)
-            pprops[str(each.properties.name)] = p
+        return pd.DataFrame(self._points_properties())
 
-        return pd.DataFrame(pprops)
+    def _histories_snapshot(self):
+        """
+        (name, type, history, states) of the points saved in the wide layout.
+        Binary and multistate histories are their integer codes. The Series
+        are not modified afterwards so they can be resampled away from the
+        event loop.
+        """
+        histories = []
+        for point in self.points:
+            object_type = str(point.properties.type)
+            if "binary" in object_type or "multi" in object_type:
+                histories.append(
+                    (
+                        str(point.properties.name),
+                        object_type,
+                        point._history_codes_series(),
+                        point._history_state_texts(),
+                    )
+                )
+            elif "analog" in object_type:
+                histories.append(
+                    (str(point.properties.name), object_type, point.history, None)
+                )
+        return histories
 
     def backup_histories_df(self, resampling="1s"):
         """
@@ -91,215 +408,521 @@ class SQLMixin(object):
         if not _PANDAS:
             self.log("Pandas is required to create dataframe.", level="error")
             return
-        backup = {}
-        if isinstance(resampling, str):
-            resampling_needed = True
-            resampling_freq = resampling
-        elif resampling in [0, False]:
-            resampling_needed = False
-
-        def extract_value_and_string(val):
-            if isinstance(val, str):
-                if ":" in val:
-                    _v, _s = val.split(":")
-                    return (int(_v), _s)
-                elif val == "active":
-                    val = 1
-                elif val == "inactive":
-                    val = 0
-            return (int(val), "unknown")
-
-        # print(resampling, resampling_freq, resampling_needed)
-        for point in self.points:
-            _name = str(point.properties.name)
-            try:
-                if (
-                    "binary" in point.properties.type
-                    or "multi" in point.properties.type
-                ):
-                    backup[f"{_name}_str"] = (
-                        point.history.apply(lambda x: extract_value_and_string(x)[1])
-                        .resample(resampling_freq)
-                        .last()
-                    )
-                    backup[_name] = (
-                        point.history.apply(lambda x: extract_value_and_string(x)[0])
-                        .resample(resampling_freq)
-                        .last()
-                    )
-                elif resampling_needed and "analog" in point.properties.type:
-                    backup[_name] = point.history.resample(resampling_freq).mean()
-                else:
-                    # backup[point.properties.name] = point.history.resample(
-                    #    resampling_freq
-                    # ).last()
-                    continue
+        return histories_to_df(self._histories_snapshot(), resampling=resampling)
 
-            except Exception as error:
-                try:
-                    self.log(
-                        f"{self.properties.name} ({self.properties.device.properties.address}) | Error in resampling {point.properties.name} | {error} (probably not enough points)",
-                        level="error",
-                    )
-                except AttributeError as error:
-                    raise DataError(
-                        f"Cannot save, missing required information : {error}"
-                    )
-                if (
-                    "binary" in point.properties.type
-                    or "multi" in point.properties.type
-                ):
-                    backup[f"{_name}.str"] = (
-                        point.history.apply(lambda x: extract_value_and_string(x)[1])
-                        .resample(resampling_freq)
-                        .last()
-                    )
-                    backup[f"{_name}.val"] = (
-                        point.history.apply(lambda x: extract_value_and_string(x)[0])
-                        .resample(resampling_freq)
-                        .last()
-                    )
-                    backup[_name] = point.history.resample(resampling_freq).last()
-                elif "analog" in point.properties.type:
-                    backup[_name] = point.history.resample(resampling_freq).mean()
-                else:
-                    # backup[point.properties.name] = point.history
-                    continue
-
-        df = pd.DataFrame(dict([(k, pd.Series(v)) for k, v in backup.items()]))
-        if resampling_needed:
-            return df.resample(resampling_freq).last().ffill().bfill()
-        else:
-            return df
-
-    async def save(self, filename=None, resampling=None):
+    async def save(self, filename=None, resampling=None, executor=None, export=None):
         """
         Save the point histories to sqlite3 database.
-        Save the device object properties to a pickle file so the device can be reloaded.
+        Save the device object and point properties in the same file so the device can be reloaded.
 
         Resampling : valid Pandas resampling frequency. If 0 or False, dataframe will not be resampled on save.
+        Samples are not resampled when using the tall layout.
+
+        The dataframe is built in executor (default executor of the loop if
+        None) so the event loop is not blocked while resampling.
+
+        :param export: "parquet" or "arrow" to add the samples read since the
+            last export to files partitioned by device and day, under the
+            folder filename ("histories" by default). Requires pyarrow.
         """
-        if not _PANDAS:
-            self.log("Pandas is required to save to SQLite.", level="error")
-            return
+        snapshot = self._save_snapshot(
+            filename=filename, resampling=resampling, export=export
+        )
+        if snapshot is not None:
+            await self._write_snapshot(snapshot, executor=executor)
+
+    def save_in_background(self, filename=None, resampling=None, export=None):
+        """
+        Queue a save of the device to the persistence writer of the network.
+        Returns immediately.
+
+        :returns: (bool) False if the writer queue is full, nothing was saved
+            and the histories were kept
+        """
+        writer = getattr(self.properties.network, "persistence", None)
+        if writer is None:
+            self._save_task = asyncio.create_task(
+                self.save(filename=filename, resampling=resampling, export=export)
+            )
+            return True
+        return writer.submit(
+            self, filename=filename, resampling=resampling, export=export
+        )
+
+    def _save_snapshot(self, filename=None, resampling=None, export=None):
+        """
+        Take, on the event loop, everything save() will write. Histories are
+        cleared here if clear_history_on_save is set.
 
-        if filename:
-            if ".db" in filename:
-                filename = filename.split(".")[0]
-            self.properties.db_name = filename
+        :returns: SaveSnapshot or None if pandas (or pyarrow) is missing
+        """
+        if export is not None:
+            if export not in arrow.FORMATS:
+                raise WrongParameter(
+                    f"export must be one of {', '.join(arrow.FORMATS)}, not {export}"
+                )
+            if not arrow._PYARROW:
+                self.log("pyarrow is required to export histories.", level="error")
+                return
+            db_name, layout = (filename or "histories", export)
         else:
-            self.properties.db_name = f"Device_{self.properties.device_id}"
+            if not _PANDAS:
+                self.log("Pandas is required to save to SQLite.", level="error")
+                return
+            if filename:
+                if ".db" in filename:
+                    filename = filename.split(".")[0]
+                self.properties.db_name = filename
+            else:
+                self.properties.db_name = f"Device_{self.properties.device_id}"
+            db_name, layout = (self.properties.db_name, self.properties.db_layout)
 
         if resampling is None:
             resampling = self.properties.save_resampling
 
-        # Does file exist? If so, append data
-
-        def _df_to_backup():
-            try:
-                return self.backup_histories_df(resampling=resampling)
-            except (DataError, NoResponseFromController):
-                self.log("Impossible to save right now, error in data", level="error")
-                return pd.DataFrame()
+        snapshot = SaveSnapshot(db_name, layout, resampling, self.properties.device_id)
+        if snapshot.layout != "wide":
+            # tall layout and exports : samples read since the last save
+            last = self._sql_last_saved.get(
+                (snapshot.db_name, snapshot.layout, snapshot.device_id)
+            )
+            for point in self.points:
+                key = (str(point.properties.type), int(point.properties.address))
+                snapshot.points.append(
+                    (
+                        str(point.properties.name),
+                        *key,
+                        str(point.properties.units_state),
+                        str(point.properties.description),
+                    )
+                )
+                history = getattr(point, "_history", None)
+                if history is None:
+                    continue
+                timestamps, values = history.since(last)
+                for timestamp, value in zip(timestamps, values):
+                    sample = _tall_values(point, history.kind, value)
+                    if sample is not None:
+                        snapshot.samples.append((*key, timestamp, *sample))
+        else:
+            snapshot.histories = self._histories_snapshot()
+
+        snapshot.properties = (
+            _to_json(self.dev_properties_df()),
+            [
+                (name, _to_json(props))
+                for name, props in self._points_properties().items()
+            ],
+        )
+        if self.properties.clear_history_on_save:
+            self.clear_histories()
+        return snapshot
+
+    async def _write_snapshot(self, snapshot, executor=None):
+        """
+        Write a SaveSnapshot to the database. Errors are logged.
 
-        if os.path.isfile(f"{self.properties.db_name}.db"):
+        :returns: (bool) False if something could not be written
+        """
+        loop = asyncio.get_running_loop()
+        db_name = snapshot.db_name
+        if snapshot.layout in arrow.FORMATS:
             try:
-                his = await self._read_from_sql(
-                    'select * from "history"', self.properties.db_name
+                count, newest = await loop.run_in_executor(
+                    executor,
+                    arrow.write_export,
+                    db_name,
+                    snapshot.layout,
+                    snapshot.device_id,
+                    snapshot.points,
+                    snapshot.samples,
+                    *snapshot.properties,
+                    PROPERTIES_VERSION,
                 )
-                his.index = his["index"].apply(Timestamp)
-                last = his.index[-1]
-                df_to_backup = _df_to_backup()[last:]
-            except Exception:
-                df_to_backup = _df_to_backup()
-
-        else:
+            except Exception as error:
+                self._log.error(f"Error exporting to {snapshot.layout} : {error}")
+                return False
+            self._sql_last_saved[(db_name, snapshot.layout, snapshot.device_id)] = (
+                newest
+            )
+            self.log(
+                f"{count} samples exported to {arrow.device_folder(db_name, snapshot.device_id)}",
+                level="info",
+            )
+            return True
+
+        if not os.path.isfile(f"{db_name}.db"):
             self.log("Creating a new backup database", level="debug")
-            df_to_backup = _df_to_backup()
+            self._sql_last_saved.pop(db_name, None)
+            self._sql_last_saved.pop((db_name, "tall", snapshot.device_id), None)
 
-        if df_to_backup is None:
-            return
-        # DataFrames that will be saved to SQL
-        async with aiosqlite.connect(f"{self.properties.db_name}.db") as con:
+        written = True
+
+        if snapshot.layout == "tall":
+            async with aiosqlite.connect(f"{db_name}.db") as con:
+                try:
+                    await self._save_tall(con, snapshot)
+                except Exception as error:
+                    written = False
+                    await con.rollback()
+                    self._log.error(f"Error saving to SQL database : {error}")
+        else:
             try:
-                async with con.execute("SELECT * FROM history") as cursor:
-                    data = await cursor.fetchall()
-                    columns = [description[0] for description in cursor.description]
-                    data = pd.DataFrame(data, columns=columns)
-                    df = pd.concat([data, df_to_backup], sort=True)
-                    sql.to_sql(
-                        df_to_backup,
-                        name="history",
-                        con=con,
-                        index_label="index",
-                        index=True,
-                        if_exists="append",
-                    )
-            except Exception:
-                # df = df_to_backup
-                self._log.error("Error saving to SQL database")
+                df_to_backup = await loop.run_in_executor(
+                    executor, histories_to_df, snapshot.histories, snapshot.resampling
+                )
+            except (DataError, NoResponseFromController) as error:
+                self.log(
+                    f"Impossible to save right now, error in data : {error}",
+                    level="error",
+                )
+                written = False
+                df_to_backup = pd.DataFrame()
+            # Only rows newer than what is already in the database are written
+            async with aiosqlite.connect(f"{db_name}.db") as con:
+                try:
+                    last = await self._last_saved_timestamp(con, db_name)
+                    if last is not None and len(df_to_backup):
+                        df_to_backup = df_to_backup[df_to_backup.index > last]
+                    await self._append_history(con, df_to_backup, db_name)
+                except Exception as error:
+                    written = False
+                    await con.rollback()
+                    self._log.error(f"Error saving to SQL database : {error}")
 
-            # asyncio.run(
-            #    None, df_to_backup.to_sql, "history", con, None, "append", True, "index"
-            # )
+        async with aiosqlite.connect(f"{db_name}.db") as con:
+            try:
+                await self._save_properties(con, *snapshot.properties)
+                self.log(f"Device saved to {db_name}.db", level="info")
+            except Exception as error:
+                written = False
+                await con.rollback()
+                self._log.error(f"Error saving device properties : {error}")
+        return written
 
-        # Saving other properties to a pickle file...
-        prop_backup = {"device": self.dev_properties_df()}
-        prop_backup["points"] = self.points_properties_df()
+    async def _save_properties(self, con, device, points):
+        """
+        Replace the device and point properties (JSON) stored in the database
+        """
+        await con.executescript(PROPERTIES_SCHEMA)
+        await con.executemany(
+            "INSERT OR REPLACE INTO metadata (name, value) VALUES (?, ?)",
+            [("properties_version", str(PROPERTIES_VERSION)), ("device", device)],
+        )
+        await con.execute("DELETE FROM point_properties")
+        await con.executemany(
+            "INSERT INTO point_properties (name, properties) VALUES (?, ?)", points
+        )
+        await con.commit()
+
+    async def _last_saved_timestamp(self, con, db_name):
+        """
+        Timestamp of the last row saved in the database. Kept in memory and
+        in the metadata table so the history table never has to be read.
+        """
+        if db_name in self._sql_last_saved:
+            return self._sql_last_saved[db_name]
+        last = None
         try:
-            with open(f"{self.properties.db_name}.bin", "wb") as file:
-                pickle.dump(prop_backup, file)
-            if self.properties.clear_history_on_save:
-                self.clear_histories()
+            async with con.execute(
+                "SELECT value FROM metadata WHERE name = 'last_timestamp'"
+            ) as cursor:
+                row = await cursor.fetchone()
+        except aiosqlite.OperationalError:
+            # database created before the metadata table existed
+            try:
+                async with con.execute('SELECT "index" FROM history') as cursor:
+                    stamps = [row[0] for row in await cursor.fetchall()]
+            except aiosqlite.OperationalError:
+                stamps = []
+            # text timestamps with different UTC offsets (DST) don't sort
+            # as text, compare them as instants
+            row = (_newest(stamps),) if stamps else None
+        if row and row[0]:
+            last = Timestamp(row[0])
+        self._sql_last_saved[db_name] = last
+        return last
+
+    async def _append_history(self, con, df, db_name):
+        """
+        Append the rows of df to the history table in one transaction,
+        adding the columns of new points when needed.
+        """
+        await con.execute(
+            'CREATE TABLE IF NOT EXISTS history ("index" TIMESTAMP PRIMARY KEY)'
+        )
+        await con.execute(
+            "CREATE TABLE IF NOT EXISTS metadata (name TEXT PRIMARY KEY, value TEXT)"
+        )
+        if len(df) == 0:
+            await con.commit()
+            return
+        async with con.execute("PRAGMA table_info(history)") as cursor:
+            existing = {row[1] for row in await cursor.fetchall()}
+        for column, dtype in df.dtypes.items():
+            if column not in existing:
+                await con.execute(
+                    f"ALTER TABLE history ADD COLUMN {_quote(column)} {_sql_type(dtype)}"
+                )
+        columns = ", ".join(_quote(column) for column in ["index", *df.columns])
+        placeholders = ", ".join("?" * (len(df.columns) + 1))
+        values = df.astype(object).where(df.notna(), None)
+        await con.executemany(
+            f"INSERT OR REPLACE INTO history ({columns}) VALUES ({placeholders})",
+            (
+                (index.isoformat(sep=" "), *row)
+                for index, *row in values.itertuples(name=None)
+            ),
+        )
+        last = df.index[-1]
+        await con.execute(
+            "INSERT OR REPLACE INTO metadata (name, value) VALUES ('last_timestamp', ?)",
+            (last.isoformat(sep=" "),),
+        )
+        await con.commit()
+        self._sql_last_saved[db_name] = last
+
+    async def _save_tall(self, con, snapshot):
+        """
+        Append the samples of a snapshot newer than the last save to the
+        point_history table, in one transaction.
+        """
+        await con.execute("PRAGMA journal_mode=WAL")
+        await con.executescript(TALL_SCHEMA)
+        db_name = snapshot.db_name
+        device_id = snapshot.device_id
+        # several devices can share the file, each one has its own mark
+        key = (db_name, "tall", device_id)
+        if key not in self._sql_last_saved:
+            async with con.execute(
+                "SELECT value FROM metadata WHERE name = ?", (f"last_ts:{device_id}",)
+            ) as cursor:
+                row = await cursor.fetchone()
+            if row is None:
+                # file saved before the mark was kept per device
+                async with con.execute(
+                    "SELECT max(ts) FROM point_history WHERE device_id IS ?",
+                    (device_id,),
+                ) as cursor:
+                    row = await cursor.fetchone()
+            self._sql_last_saved[key] = int(row[0]) if row and row[0] else None
+        last = self._sql_last_saved[key]
+
+        await con.executemany(
+            "INSERT INTO points "
+            "(device_id, name, object_type, address, units_state, description) "
+            "VALUES (?, ?, ?, ?, ?, ?) "
+            "ON CONFLICT (device_id, object_type, address) DO UPDATE SET "
+            "name = excluded.name, units_state = excluded.units_state, "
+            "description = excluded.description",
+            [(device_id, *point) for point in snapshot.points],
+        )
+        async with con.execute(
+            "SELECT object_type, address, point_id FROM points WHERE device_id IS ?",
+            (device_id,),
+        ) as cursor:
+            point_ids = {(row[0], row[1]): row[2] for row in await cursor.fetchall()}
+
+        rows = [
+            (device_id, point_ids[(object_type, address)], timestamp, *sample)
+            for object_type, address, timestamp, *sample in snapshot.samples
+            if last is None or timestamp > last
+        ]
+        newest = max((row[2] for row in rows), default=last)
+        await con.executemany(
+            "INSERT OR REPLACE INTO point_history "
+            "(device_id, point_id, ts, value, string_value) VALUES (?, ?, ?, ?, ?)",
+            rows,
+        )
+        if newest is not None:
+            await con.execute(
+                "INSERT OR REPLACE INTO metadata (name, value) VALUES (?, ?)",
+                (f"last_ts:{device_id}", str(newest)),
+            )
+        await con.commit()
+        self._sql_last_saved[key] = newest
+        self.log(f"{len(rows)} samples saved to {db_name}.db", level="debug")
+
+    async def _is_tall(self, con):
+        async with con.execute(
+            "SELECT name FROM sqlite_master "
+            "WHERE type = 'table' AND name = 'point_history'"
+        ) as cursor:
+            return await cursor.fetchone() is not None
+
+    async def offline_history_from_sql(self, db_name):
+        """
+        Read all the histories of the database once
 
-            self.log(f"Device saved to {self.properties.db_name}.db", level="info")
-        except Exception as error:
-            self._log.error(f"Error saving to pickle file: {error}")
+        :returns: SQLHistory
+        """
+        if arrow.is_export(db_name):
+            table = await asyncio.get_running_loop().run_in_executor(
+                None, arrow.read_export, db_name
+            )
+            return SQLHistory.from_table(table)
+        async with aiosqlite.connect(f"{db_name}.db") as con:
+            try:
+                return await SQLHistory.load(
+                    con, self.properties.device_id, tall=await self._is_tall(con)
+                )
+            except aiosqlite.OperationalError:
+                self._log.warning(f"No history retrieved from {db_name}.db:")
+                return SQLHistory()
 
     async def points_from_sql(self, db_name):
         """
         Retrieve point list from SQL database
         """
         try:
-            points = await self._read_from_sql("SELECT * FROM history;", db_name)
-            return list(points.columns.values)[1:]
+            async with aiosqlite.connect(f"{db_name}.db") as con:
+                if await self._is_tall(con):
+                    # points with at least one sample, like the columns of
+                    # the wide layout
+                    request = (
+                        "SELECT name FROM points p "
+                        "WHERE (? IS NULL OR device_id = ?) AND EXISTS ("
+                        "SELECT 1 FROM point_history h "
+                        "WHERE h.device_id IS p.device_id AND h.point_id = p.point_id"
+                        ") ORDER BY point_id"
+                    )
+                    params = (self.properties.device_id,) * 2
+                    async with con.execute(request, params) as cursor:
+                        return [row[0] for row in await cursor.fetchall()]
+                async with con.execute("PRAGMA table_info(history)") as cursor:
+                    columns = [row[1] for row in await cursor.fetchall()]
+            if not columns:
+                raise ValueError("No history table")
+            return columns[1:]
         except Exception:
             self._log.warning(f"No history retrieved from {db_name}.db:")
             return []
 
+    async def _point_samples(self, con, point, last=False):
+        """
+        Rows (timestamp, value) of one point, using the index of the layout
+        """
+        tall = await self._is_tall(con)
+        if tall:
+            request = (
+                "SELECT h.ts, coalesce(h.value, h.string_value) FROM point_history h "
+                "JOIN points p ON h.device_id IS p.device_id AND h.point_id = p.point_id "
+                "WHERE p.name = ? AND (? IS NULL OR p.device_id = ?) "
+                f"ORDER BY h.ts {'DESC LIMIT 1' if last else ''}"
+            )
+            params = (point, self.properties.device_id, self.properties.device_id)
+        else:
+            column = _quote(point)
+            request = (
+                f'SELECT "index", {column} FROM history WHERE {column} IS NOT NULL'
+            )
+            params = ()
+        async with con.execute(request, params) as cursor:
+            rows = await cursor.fetchall()
+        if tall or not rows:
+            return rows
+        # the wide layout stores text timestamps, possibly with different
+        # UTC offsets, so they are ordered as instants and not as text
+        order = pd.to_datetime([row[0] for row in rows], utc=True).argsort()
+        return [rows[order[-1]]] if last else [rows[i] for i in order]
+
     async def his_from_sql(self, db_name, point):
         """
         Retrive point histories from SQL database
         """
-        his = await self._read_from_sql('select * from "history"', db_name)
-        his.index = his["index"].apply(Timestamp)
-        return his.set_index("index")[point]
+        async with aiosqlite.connect(f"{db_name}.db") as con:
+            rows = await self._point_samples(con, point)
+            tall = await self._is_tall(con)
+        timestamps = [row[0] for row in rows]
+        if tall:
+            index = pd.to_datetime(timestamps, unit="ns", utc=True)
+        else:
+            index = pd.to_datetime(timestamps, utc=True)
+        return pd.Series(
+            [row[1] for row in rows],
+            index=index.tz_convert(local_timezone()),
+            name=point,
+        )
 
     async def value_from_sql(self, db_name, point):
         """
         Take last known value as the value
         """
-        return await self.his_from_sql(db_name, point).last_valid_index()
+        async with aiosqlite.connect(f"{db_name}.db") as con:
+            rows = await self._point_samples(con, point, last=True)
+        return rows[0][1] if rows else None
 
-    def read_point_prop(self, device_name, point):
+    def _read_prop_backup(self, device_name):
         """
-        Points properties retrieved from pickle
+        Device and point properties of a backup, read once and kept until
+        the file changes.
+
+        :returns: {"device": {...}, "points": {name: {...}}}
         """
+        if arrow.is_export(device_name):
+            filename = os.path.join(device_name, arrow.METADATA_FILE)
+        else:
+            filename = f"{device_name}.db"
+        key = (filename, os.path.getmtime(filename))
+        cache = getattr(self, "_prop_backup", None)
+        if cache is None or cache[0] != key:
+            cache = (key, self._load_properties(device_name))
+            self._prop_backup = cache
+        return cache[1]
+
+    def _load_properties(self, device_name):
+        if arrow.is_export(device_name):
+            metadata = arrow.read_metadata(device_name)
+            if metadata.get("properties_version", 0) > PROPERTIES_VERSION:
+                raise ValueError(
+                    f"{device_name} was exported by a newer version of BAC0"
+                )
+            return {"device": metadata["device"], "points": metadata["points"]}
+        try:
+            with closing(sqlite3.connect(f"{device_name}.db")) as con:
+                version = con.execute(
+                    "SELECT value FROM metadata WHERE name = 'properties_version'"
+                ).fetchone()
+                if version is not None:
+                    if int(version[0]) > PROPERTIES_VERSION:
+                        raise ValueError(
+                            f"{device_name}.db was saved by a newer version of BAC0"
+                        )
+                    (device,) = con.execute(
+                        "SELECT value FROM metadata WHERE name = 'device'"
+                    ).fetchone()
+                    rows = con.execute(
+                        "SELECT name, properties FROM point_properties"
+                    ).fetchall()
+                    return {
+                        "device": json.loads(device),
+                        "points": {name: json.loads(props) for name, props in rows},
+                    }
+        except sqlite3.OperationalError:
+            pass
+        # backup made before the properties were stored in the database
+        self._log.warning(
+            f"Reading legacy properties file {device_name}.bin, save the device again to convert it"
+        )
         with open(f"{device_name}.bin", "rb") as file:
-            try:
-                _point = pickle.load(file)["points"][point]
-            except KeyError:
-                raise RemovedPointException(f"{point} not found (probably deleted)")
-            return _point
+            return pickle.load(file)
+
+    def read_point_prop(self, device_name, point):
+        """
+        Points properties retrieved from the backup
+        """
+        try:
+            return self._read_prop_backup(device_name)["points"][point]
+        except KeyError:
+            raise RemovedPointException(f"{point} not found (probably deleted)")
 
     def read_dev_prop(self, device_name):
         """
-        Device properties retrieved from pickle
+        Device properties retrieved from the backup
         """
         self.log("Reading prop from DB file", level="debug")
         try:
-            with open(f"{device_name}.bin", "rb") as file:
-                return pickle.load(file)["device"]
+            return self._read_prop_backup(device_name)["device"]
         except (EOFError, FileNotFoundError):
             self._log.error("Error reading device properties")
             raise ValueError
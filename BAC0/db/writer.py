@@ -0,0 +1,151 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+#
+# Copyright (C) 2015 by Christian Tremblay, P.Eng <christian.tremblay@servisys.com>
+# Licensed under LGPLv3, see file LICENSE in this source tree.
+#
+"""
+writer.py - save devices to SQLite away from the polling tasks.
+
+Polls (auto_save) push a snapshot of the device in a bounded queue and
+return. One writer task takes the snapshots one at a time, builds the
+dataframes in an executor and writes the database.
+"""
+
+import asyncio
+import time
+import typing as t
+from concurrent.futures import Executor, ThreadPoolExecutor
+
+# --- this application's modules ---
+from ..core.utils.notes import note_and_log
+
+# ------------------------------------------------------------------------------
+
+
+@note_and_log
+class PersistenceWriter(object):
+    """
+    Background writer used by Device.save_in_background()
+
+    :param maxsize: (int) maximum number of snapshots waiting to be written.
+        When the queue is full, new saves are refused and the histories are
+        kept for the next one.
+    :param executor: (concurrent.futures.Executor) where dataframes are built,
+        a thread pool by default. A ProcessPoolExecutor can be used.
+    """
+
+    def __init__(self, maxsize: int = 100, executor: t.Optional[Executor] = None):
+        self.maxsize = maxsize
+        self._own_executor = executor is None
+        self.executor = executor or ThreadPoolExecutor(
+            max_workers=1, thread_name_prefix="BAC0_persistence"
+        )
+        self._queue: t.Optional[asyncio.Queue] = None
+        self._task: t.Optional[asyncio.Task] = None
+        self.saved = 0
+        self.rejected = 0
+        self.errors = 0
+        self.last_latency = 0.0
+        self.total_latency = 0.0
+        self.max_latency = 0.0
+        self.last_write_duration = 0.0
+
+    @property
+    def average_latency(self) -> float:
+        writes = self.saved + self.errors
+        return self.total_latency / writes if writes else 0.0
+
+    @property
+    def queue_depth(self) -> int:
+        return self._queue.qsize() if self._queue is not None else 0
+
+    @property
+    def metrics(self) -> t.Dict[str, t.Any]:
+        """
+        Queue depth and write latency : seconds between the snapshot and the
+        end of its write (latency) and seconds spent writing (write_duration)
+        """
+        return {
+            "queue_depth": self.queue_depth,
+            "maxsize": self.maxsize,
+            "saved": self.saved,
+            "rejected": self.rejected,
+            "errors": self.errors,
+            "last_latency": self.last_latency,
+            "average_latency": self.average_latency,
+            "max_latency": self.max_latency,
+            "last_write_duration": self.last_write_duration,
+        }
+
+    def _start(self) -> None:
+        if self._queue is None:
+            self._queue = asyncio.Queue(maxsize=self.maxsize)
+        if self._task is None or self._task.done():
+            self._task = asyncio.create_task(self._run(), name="BAC0_persistence")
+
+    def submit(self, device, filename=None, resampling=None, export=None) -> bool:
+        """
+        Take a snapshot of device and queue it. Does not wait.
+
+        :returns: (bool) False if the queue is full
+        """
+        self._start()
+        if self._queue.full():
+            self.rejected += 1
+            self.log(
+                f"{device.properties.name} | Persistence queue full ({self.maxsize}), save skipped",
+                level="warning",
+            )
+            return False
+        snapshot = device._save_snapshot(
+            filename=filename, resampling=resampling, export=export
+        )
+        if snapshot is None:
+            return False
+        self._queue.put_nowait((device, snapshot))
+        return True
+
+    async def _run(self) -> None:
+        while True:
+            device, snapshot = await self._queue.get()
+            start = time.monotonic()
+            try:
+                # the device logs its own errors and tells if the write failed
+                if await device._write_snapshot(snapshot, executor=self.executor):
+                    self.saved += 1
+                else:
+                    self.errors += 1
+            except Exception as error:
+                self.errors += 1
+                self.log(
+                    f"Error saving {snapshot.db_name} in background : {error}",
+                    level="error",
+                )
+            end = time.monotonic()
+            self.last_write_duration = end - start
+            self.last_latency = end - snapshot.created
+            self.max_latency = max(self.max_latency, self.last_latency)
+            self.total_latency += self.last_latency
+            self._queue.task_done()
+
+    async def join(self) -> None:
+        """
+        Wait until every queued snapshot is written
+        """
+        if self._queue is not None and self._task is not None:
+            await self._queue.join()
+
+    async def stop(self) -> None:
+        """
+        Write what is queued then stop the writer task
+        """
+        await self.join()
+        if self._task is not None:
+            self._task.cancel()
+            self._task = None
+        if self._own_executor:
+            self.executor.shutdown(wait=False)
+            self.executor = ThreadPoolExecutor(
+                max_workers=1, thread_name_prefix="BAC0_persistence"
+            )
@@ -48,23 +48,25 @@ from ..core.io.IOExceptions import (
     NumerousPingFailures,
     Timeout,
     UnrecognizedService,
+    WrongParameter,
 )
 from ..core.io.Read import ReadProperty
 from ..core.io.Simulate import Simulation
 from ..core.io.Write import WriteProperty
-from ..core.utils.lookfordependency import influxdb_if_available, rich_if_available
+from ..core.utils.lookfordependency import rich_if_available
 
 # from ..core.io.asynchronous.Write import WriteProperty
 from ..core.utils.notes import note_and_log
+from ..db.sinks import sink_from_params
+from ..db.writer import PersistenceWriter
 from ..infos import __version__ as version
 
 # --- this application's modules ---
+from ..tasks.COVManager import COVManager
+from ..tasks.PollPlanner import PollPlanner
 from ..tasks.RecurringTask import RecurringTask
 from ..tasks.TaskManager import Task
 
-INFLUXDB, _ = influxdb_if_available()
-if INFLUXDB:
-    from ..db.influxdb import InfluxDB
 RICH, rich = rich_if_available()
 if RICH:
     from rich import pretty
@@ -115,7 +117,7 @@ class Lite(
         bdtable=None,
         ping: bool = True,
         ping_delay: int = 300,
-        db_params: t.Optional[t.Dict[str, t.Any]] = None,
+        db_params: t.Optional[t.Union[t.Dict[str, t.Any], t.List[t.Any]]] = None,
         **params,
     ) -> None:
         self._initialized = False
@@ -176,6 +178,12 @@ class Lite(
         self.log(f"Device instance (id) : {self.Boid}", level="info")
         self.bokehserver = False
         self._points_to_trend = weakref.WeakValueDictionary()
+        # Devices saved by auto_save are written by this background writer
+        self.persistence = PersistenceWriter()
+        # Phase of the device polls, requests per second of each network
+        self.poll_planner = PollPlanner(self)
+        # COV subscriptions of the points, renewed before they expire
+        self.cov_manager = COVManager(self)
 
         # Do what's needed to support COV
         # self._update_local_cov_task = namedtuple(
@@ -188,20 +196,16 @@ class Lite(
         # self._update_local_cov_task.running = True
         # self.log("Update Local COV Task started (required to support COV)", level="info")
 
-        # Activate InfluxDB if params are available
-        if db_params and INFLUXDB:
+        # Activate the database (InfluxDB, files... see db/sinks.py) if params are available
+        if db_params:
             try:
-                self.database = (
-                    InfluxDB(db_params)
-                    if db_params["name"].lower() == "influxdb"
-                    else None
-                )
+                self.database = sink_from_params(db_params)
                 asyncio.create_task(
                     asyncio.wait_for(self.database._health(), timeout=5)
                 )
-            except TimeoutError:
+            except (ImportError, ValueError, WrongParameter) as error:
                 self._log.error(
-                    "Unable to connect to InfluxDB. Please validate parameters"
+                    f"Unable to use the database. Please validate parameters : {error}"
                 )
         if self.database:
             self.create_save_to_influxdb_task(delay=20)
@@ -228,25 +232,18 @@ class Lite(
     def create_save_to_influxdb_task(self, delay: int = 60) -> None:
         self._write_to_db = RecurringTask(
             self.save_registered_devices_to_db,
-            delay=60,
-            name="Write to InfluxDB Task",
+            delay=delay,
+            name="Write to database Task",
         )
         self._write_to_db.start()
 
     async def save_registered_devices_to_db(self):
-        if len(self.registered_devices) > 0:
-            for each in self.registered_devices:
-                try:
-                    await self.database.write_points_lastvalue_to_db(each.points)
-                except Exception as error:
-                    self._log.error(
-                        f"Error writing points of {each} to InfluxDB : {error}. Stopping task."
-                    )
-                    await self._write_to_db.stop()
-                    self.log(
-                        "Write to InfluxDB Task stopped. Restarting", level="warning"
-                    )
-                    self.create_save_to_influxdb_task(delay=20)
+        # samples of every device are buffered by the database (sinks) and
+        # written together. Failed writes are retried by the sinks.
+        try:
+            await self.database.flush()
+        except Exception as error:
+            self._log.error(f"Error writing to the database : {error}")
 
     def register_device(
         self, device: t.Union[RPDeviceConnected, RPMDeviceConnected]
@@ -436,7 +433,7 @@ class Lite(
         """
         This will present a list of all registered tasks
         """
-        return Task.tasks
+        return list(Task.tasks.values())
 
     def disconnect(self) -> None:
         asyncio.create_task(self._disconnect())
@@ -445,6 +442,10 @@ class Lite(
         self.log("Disconnecting", level="debug")
         for each in self.registered_devices:
             await each._disconnect()
+        await self.cov_manager.close()
+        await self.persistence.stop()
+        if self.database:
+            await self.database.close()
         await super()._disconnect()
         self._initialized = False
 
@@ -0,0 +1,198 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+#
+# Copyright (C) 2015 by Christian Tremblay, P.Eng <christian.tremblay@servisys.com>
+# Licensed under LGPLv3, see file LICENSE in this source tree.
+#
+"""
+COVAcquisition.py - read the points of a device with COV first, polling
+the others.
+
+Every point that can report its present value by COV is subscribed. Once a
+subscription is accepted, the point is no longer polled. A point whose
+subscription fails, or that stays silent longer than a subscription
+lifetime (a device notifies the value each time the subscription is
+renewed), is polled again.
+"""
+
+import time
+import typing as t
+import weakref
+
+from bacpypes3.basetypes import ObjectType
+
+# --- this application's modules ---
+from ..core.io.IOExceptions import COVSubscriptionLimit
+from ..core.utils.notes import note_and_log
+from .COVManager import services_supported
+from .TaskManager import Task
+
+# ------------------------------------------------------------------------------
+
+# object types reporting their present value by COV (ASHRAE 135, 13.1)
+COV_OBJECT_TYPES = {
+    "accumulator",
+    "analogInput",
+    "analogOutput",
+    "analogValue",
+    "binaryInput",
+    "binaryOutput",
+    "binaryValue",
+    "integerValue",
+    "largeAnalogValue",
+    "lifeSafetyPoint",
+    "lifeSafetyZone",
+    "loop",
+    "multiStateInput",
+    "multiStateOutput",
+    "multiStateValue",
+    "positiveIntegerValue",
+    "pulseConverter",
+}
+
+
+def supports_cov(device) -> bool:
+    """
+    subscribeCOV in the protocolServicesSupported read from the device
+    """
+    return services_supported(device, "subscribeCOV")
+
+
+@note_and_log
+class COVAcquisition(Task):
+    """
+    Subscribe the points of a device to COV and watch the subscriptions.
+    ex.
+        device.acquire_by_cov(lifetime=300)
+    """
+
+    def __init__(
+        self,
+        device,
+        *,
+        lifetime: int = 300,
+        confirmed: bool = False,
+        silence: t.Optional[float] = None,
+        delay: int = 10,
+    ) -> None:
+        """
+        :param device: (BAC0.core.devices.Device.Device) device to read
+        :param lifetime: (int) seconds, lifetime of the subscriptions (renewed
+            before they expire), 0 for no expiry
+        :param confirmed: (bool) ask for confirmed notifications
+        :param silence: (float) seconds without notification before a point
+            is polled again, defaults to lifetime + 30 (no check if lifetime
+            is 0)
+        :param delay: (int) seconds between checks of the subscriptions
+        """
+        self._device = weakref.ref(device)
+        self.lifetime = lifetime
+        self.confirmed = confirmed
+        if silence is None and lifetime:
+            silence = lifetime + 30
+        self.silence = silence
+        # name -> point subscribed (pending or active)
+        self.points: t.Dict[str, t.Any] = {}
+        # name -> reason, points polled again
+        self.fallback: t.Dict[str, str] = {}
+        self._subscribed = False
+        Task.__init__(self, name=f"cov_{device.properties.name}", delay=delay)
+
+    @property
+    def device(self):
+        return self._device()
+
+    @property
+    def covered(self) -> t.Set[str]:
+        """
+        Names of the points read by COV (not polled)
+        """
+        return {
+            name
+            for name, point in self.points.items()
+            if point.cov_task is not None and point.cov_task.active
+        }
+
+    @staticmethod
+    def eligible(point) -> bool:
+        object_type = ObjectType(point.properties.type).attr
+        return object_type in COV_OBJECT_TYPES and not point.cov_registered
+
+    async def subscribe(self) -> None:
+        device = self.device
+        if not supports_cov(device):
+            self.log(
+                f"{device.properties.name} | subscribeCOV not supported, polling every point",
+                level="info",
+            )
+            return
+        for name in list(device.pollable_points_name):
+            point = device._findPoint(name, force_read=False)
+            if name in self.fallback or not self.eligible(point):
+                continue
+            await point.subscribe_cov(confirmed=self.confirmed, lifetime=self.lifetime)
+            self.points[name] = point
+        self.log(
+            f"{device.properties.name} | {len(self.points)} points subscribed to COV",
+            level="info",
+        )
+
+    def _poll_again(self, name: str, reason: str) -> None:
+        point = self.points.pop(name)
+        self._unsubscribe(point)
+        self.fallback[name] = reason
+        self.log(
+            f"{self.device.properties.name} | {name} polled again ({reason})",
+            level="warning",
+        )
+
+    @staticmethod
+    def _unsubscribe(point) -> None:
+        point.cov_task.stop()
+
+    def check(self, now: t.Optional[float] = None) -> None:
+        """
+        Put back in the polling the points whose subscription failed or
+        stopped notifying
+        """
+        now = time.monotonic() if now is None else now
+        for name, point in list(self.points.items()):
+            cov_task = point.cov_task
+            if isinstance(cov_task.error, COVSubscriptionLimit):
+                self._poll_again(name, f"too many subscriptions : {cov_task.error}")
+            elif cov_task.error is not None:
+                self._poll_again(name, f"subscription failed : {cov_task.error}")
+            elif cov_task.cancelled:
+                self._poll_again(name, "subscription ended")
+            elif (
+                self.silence
+                and cov_task.active
+                and now - cov_task.last_notification > self.silence
+            ):
+                self._poll_again(name, f"no notification for {self.silence} sec")
+
+    async def task(self) -> None:
+        if self.device is None:
+            return
+        if not self._subscribed:
+            self._subscribed = True
+            await self.subscribe()
+        self.check()
+
+    def stop(self):
+        for point in self.points.values():
+            self._unsubscribe(point)
+        self.points.clear()
+        return Task.stop(self)
+
+    @property
+    def metrics(self) -> t.Dict[str, int]:
+        covered = self.covered
+        return {
+            "cov": len(covered),
+            "pending": len(self.points) - len(covered),
+            "polled_again": len(self.fallback),
+            "notifications": sum(
+                point.cov_task.notifications for point in self.points.values()
+            ),
+        }
@@ -0,0 +1,567 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+#
+# Copyright (C) 2015 by Christian Tremblay, P.Eng <christian.tremblay@servisys.com>
+# Licensed under LGPLv3, see file LICENSE in this source tree.
+#
+"""
+COVManager.py - the COV subscriptions of a network.
+
+A subscription is a record : the application gives the notifications to
+the manager, which adds the values to the point, so there is no coroutine
+per subscription. Requests to a device are sent by one coroutine, while the
+device has requests waiting, grouped in SubscribeCOVPropertyMultiple
+requests when the device supports it. One task renews the subscriptions
+before they expire, spread over their lifetime so subscriptions created
+together are not renewed together.
+"""
+
+import asyncio
+import heapq
+import itertools
+import time
+import typing as t
+import weakref
+from collections import deque
+
+from bacpypes3.apdu import ErrorRejectAbortNack, SimpleAckPDU, SubscribeCOVRequest
+from bacpypes3.basetypes import (
+    COVMultipleSubscriptionList,
+    COVMultipleSubscriptionListOfCOVReference,
+    PropertyIdentifier,
+    ServicesSupported,
+)
+from bacpypes3.constructeddata import Array
+from bacpypes3.errors import ServicesError
+from bacpypes3.pdu import Address
+from bacpypes3.primitivedata import ObjectIdentifier, Unsigned
+from bacpypes3.vendor import get_vendor_info
+
+# --- this application's modules ---
+from ..core.devices.Points import extract_value_from_primitive_data
+from ..core.io.COVMultiple import (
+    ConfirmedCOVNotificationMultipleRequest,
+    SubscribeCOVPropertyMultipleRequest,
+)
+from ..core.io.IOExceptions import COVSubscriptionLimit
+from ..core.utils.notes import note_and_log
+from .TaskManager import Task
+
+# ------------------------------------------------------------------------------
+
+# properties subscribed with SubscribeCOVPropertyMultiple
+COV_PROPERTIES = (PropertyIdentifier.presentValue, PropertyIdentifier.statusFlags)
+# renewals are spread between those fractions of the lifetime
+RENEW_FROM, RENEW_TO = 0.5, 0.8
+GOLDEN_RATIO = 0.6180339887
+
+
+def services_supported(device, service: str) -> bool:
+    """
+    service (ex. "subscribeCOV") in the protocolServicesSupported read from
+    the device
+    """
+    services = getattr(device.properties.pss, "value", None)
+    try:
+        return bool(services[getattr(ServicesSupported, service)])
+    except (TypeError, IndexError):
+        return False
+
+
+class COVSubscription(object):
+    """
+    Subscription of a point, managed by the COVManager of the network
+    """
+
+    def __init__(self, manager, point, process_identifier: int, confirmed, lifetime):
+        self._manager = manager
+        self.point = point
+        self.device_address = str(point.properties.device.properties.address)
+        self.address = Address(self.device_address)
+        self.monitored_object_identifier = ObjectIdentifier(
+            (point.properties.type, int(point.properties.address))
+        )
+        self.process_identifier = process_identifier
+        self.confirmed = confirmed
+        self.lifetime = lifetime
+        # subscribed with SubscribeCOVPropertyMultiple
+        self.multiple = False
+        self.active = False
+        self.cancelled = False
+        self.error: t.Optional[BaseException] = None
+        self.notifications = 0
+        self.last_notification: t.Optional[float] = None
+        self.renewals = 0
+        self._renew_seq: t.Optional[int] = None
+        self._cancel_queued = False
+
+    async def put(self, property_value) -> None:
+        # bacpypes3 gives the values of SubscribeCOV notifications here
+        self._manager._notify(
+            self,
+            property_value.propertyIdentifier,
+            property_value.propertyArrayIndex,
+            property_value.value,
+        )
+
+    def stop(self) -> None:
+        self._manager.cancel(self)
+
+    def __repr__(self):
+        state = "active" if self.active else "error" if self.error else "pending"
+        return f"COVSubscription({self.point.properties.name}, {state})"
+
+
+@note_and_log
+class COVRenewal(Task):
+    """
+    Renew the subscriptions of a COVManager that are due
+    """
+
+    def __init__(self, manager, delay: int = 5):
+        self._manager = weakref.ref(manager)
+        Task.__init__(self, name="cov_renewal", delay=delay)
+
+    async def task(self) -> None:
+        manager = self._manager()
+        if manager is not None:
+            manager.renew_due()
+
+
+@note_and_log
+class COVManager(object):
+    """
+    COV subscriptions of a network
+
+    :param network: the network (Lite)
+    :param max_per_device: (int) maximum number of subscriptions to a device,
+        the next ones fail with COVSubscriptionLimit
+    :param max_requests_per_device: (int) requests sent to a device at the
+        same time
+    :param batch_size: (int) objects in a SubscribeCOVPropertyMultiple request
+    :param window: (int) seconds of notifications kept to compute the rates
+    """
+
+    def __init__(
+        self,
+        network=None,
+        *,
+        max_per_device: int = 100,
+        max_requests_per_device: int = 2,
+        batch_size: int = 16,
+        window: int = 60,
+    ):
+        self._network = weakref.ref(network) if network is not None else lambda: None
+        self.max_per_device = max_per_device
+        self.max_requests_per_device = max_requests_per_device
+        self.batch_size = batch_size
+        self.window = window
+        # device address -> subscriptions
+        self._by_device: t.Dict[str, t.Set[COVSubscription]] = {}
+        # (address, process identifier) -> {object identifier: subscription}
+        self._multiple: t.Dict[tuple, t.Dict[ObjectIdentifier, COVSubscription]] = {}
+        self._multiple_identifiers: t.Dict[str, int] = {}
+        self._multiple_refused: t.Set[str] = set()
+        # device address -> requests waiting ("subscribe" or "cancel", subscription)
+        self._pending: t.Dict[str, deque] = {}
+        self._senders: t.Dict[str, asyncio.Task] = {}
+        self._renewals: t.List[t.Tuple[float, int, COVSubscription]] = []
+        self._counter = itertools.count(1)
+        self._next_identifier = 1
+        # device address -> deque of [second, notifications]
+        self._rates: t.Dict[str, deque] = {}
+        self._app = None
+        self._renewal_task: t.Optional[COVRenewal] = None
+        self.renewals = 0
+        self.failures = 0
+
+    @property
+    def app(self):
+        network = self._network()
+        app = network.this_application.app
+        if app is not self._app:
+            # notifications of SubscribeCOVPropertyMultiple
+            app.do_ConfirmedCOVNotificationMultipleRequest = self._do_notification
+            app.do_UnconfirmedCOVNotificationMultipleRequest = self._do_notification
+            self._app = app
+        return app
+
+    def subscriptions(self, device_address: t.Optional[str] = None):
+        if device_address is not None:
+            return set(self._by_device.get(str(device_address), ()))
+        return {sub for subs in self._by_device.values() for sub in subs}
+
+    def _process_identifier(self, address: Address) -> int:
+        contexts = self.app._cov_contexts
+        while True:
+            identifier = self._next_identifier
+            self._next_identifier = self._next_identifier % ((1 << 22) - 1) + 1
+            key = (address, identifier)
+            if key not in contexts and key not in self._multiple:
+                return identifier
+
+    def subscribe(
+        self, point, *, confirmed: bool = False, lifetime: int = 900
+    ) -> COVSubscription:
+        """
+        Subscribe the present value of a point. The request is sent in the
+        background, check subscription.active or subscription.error.
+
+        :param lifetime: (int) seconds, 0 for a subscription without expiry
+        """
+        device = point.properties.device
+        key = str(device.properties.address)
+        address = Address(key)
+        subscriptions = self._by_device.setdefault(key, set())
+        use_multiple = key not in self._multiple_refused and services_supported(
+            device, "subscribeCOVPropertyMultiple"
+        )
+        if use_multiple:
+            identifier = self._multiple_identifiers.get(key)
+            if identifier is None:
+                identifier = self._multiple_identifiers[key] = self._process_identifier(
+                    address
+                )
+        else:
+            identifier = self._process_identifier(address)
+        sub = COVSubscription(self, point, identifier, confirmed, lifetime)
+        if len(subscriptions) >= self.max_per_device:
+            sub.error = COVSubscriptionLimit(
+                f"{device.properties.name} : {self.max_per_device} COV subscriptions"
+            )
+            self.failures += 1
+            return sub
+        subscriptions.add(sub)
+        point.cov_registered = True
+        if use_multiple:
+            sub.multiple = True
+            self._multiple.setdefault((address, identifier), {})[
+                sub.monitored_object_identifier
+            ] = sub
+        else:
+            self.app._cov_contexts[(address, identifier)] = sub
+        self._queue(key, "subscribe", sub)
+        if self._renewal_task is None or self._renewal_task.id not in Task.tasks:
+            self._renewal_task = COVRenewal(self)
+            self._renewal_task.start()
+        return sub
+
+    def cancel(self, sub: COVSubscription) -> None:
+        """
+        Cancel a subscription, the device is told in the background
+        """
+        if sub.cancelled:
+            return
+        sub.cancelled = True
+        sub._renew_seq = None
+        was_active = sub.active
+        sub.active = False
+        sub.point.cov_registered = False
+        self._forget(sub)
+        if was_active:
+            self._queue_cancel(sub)
+
+    def _queue_cancel(self, sub: COVSubscription) -> None:
+        if not sub._cancel_queued and self._network() is not None:
+            sub._cancel_queued = True
+            self._queue(sub.device_address, "cancel", sub)
+
+    def _forget(self, sub: COVSubscription) -> None:
+        self._by_device.get(sub.device_address, set()).discard(sub)
+        if sub.multiple:
+            key = (sub.address, sub.process_identifier)
+            subs = self._multiple.get(key, {})
+            if subs.get(sub.monitored_object_identifier) is sub:
+                del subs[sub.monitored_object_identifier]
+        elif self._app is not None:
+            key = (sub.address, sub.process_identifier)
+            if self._app._cov_contexts.get(key) is sub:
+                del self._app._cov_contexts[key]
+
+    def _fail(self, sub: COVSubscription, error: BaseException) -> None:
+        self.failures += 1
+        sub.error = error
+        sub.active = False
+        sub.point.cov_registered = False
+        sub._renew_seq = None
+        self._forget(sub)
+        sub.point.log(f"Error in COV subscription : {error}", level="error")
+
+    def _queue(self, key: str, operation: str, sub: COVSubscription) -> None:
+        self._pending.setdefault(key, deque()).append((operation, sub))
+        sender = self._senders.get(key)
+        if sender is None or sender.done():
+            self._senders[key] = asyncio.create_task(
+                self._send(key), name=f"BAC0_cov_{key}"
+            )
+
+    def _next_batch(self, queue: deque):
+        """
+        Requests that can be sent together : same operation, and for
+        SubscribeCOVPropertyMultiple same lifetime and confirmation
+        """
+        operation, first = queue.popleft()
+        batch = [first]
+        size = self.batch_size if first.multiple else self.max_requests_per_device
+        while queue and len(batch) < size:
+            next_operation, sub = queue[0]
+            if next_operation != operation or sub.multiple != first.multiple:
+                break
+            if first.multiple and (sub.lifetime, sub.confirmed) != (
+                first.lifetime,
+                first.confirmed,
+            ):
+                break
+            batch.append(queue.popleft()[1])
+        return operation, batch
+
+    async def _send(self, key: str) -> None:
+        queue = self._pending[key]
+        while queue:
+            operation, batch = self._next_batch(queue)
+            if operation == "subscribe":
+                # cancelled while waiting
+                batch = [sub for sub in batch if not sub.cancelled]
+                if not batch:
+                    continue
+            if batch[0].multiple:
+                await self._send_multiple(operation, batch)
+            else:
+                await asyncio.gather(
+                    *(self._send_single(operation, sub) for sub in batch)
+                )
+        del self._pending[key]
+
+    async def _request(self, request):
+        response = await self.app.request(request)
+        if isinstance(response, ErrorRejectAbortNack):
+            raise response
+        return response
+
+    async def _send_single(self, operation: str, sub: COVSubscription) -> None:
+        request = SubscribeCOVRequest(
+            subscriberProcessIdentifier=sub.process_identifier,
+            monitoredObjectIdentifier=sub.monitored_object_identifier,
+            destination=sub.address,
+        )
+        if operation == "subscribe":
+            request.issueConfirmedNotifications = sub.confirmed
+            request.lifetime = sub.lifetime
+        try:
+            await self._request(request)
+        except (Exception, ErrorRejectAbortNack) as error:
+            # a refused request is raised as ErrorRejectAbortNack
+            if operation == "subscribe" and not sub.cancelled:
+                self._fail(sub, error)
+            return
+        if operation == "subscribe":
+            self._subscribed(sub)
+
+    async def _send_multiple(self, operation: str, batch) -> None:
+        first = batch[0]
+        request = SubscribeCOVPropertyMultipleRequest(
+            subscriberProcessIdentifier=first.process_identifier,
+            listOfCOVSubscriptionSpecifications=[
+                COVMultipleSubscriptionList(
+                    monitoredObjectIdentifier=sub.monitored_object_identifier,
+                    listOfCOVReferences=[
+                        COVMultipleSubscriptionListOfCOVReference(
+                            monitoredProperty=prop, timestamped=False
+                        )
+                        for prop in COV_PROPERTIES
+                    ],
+                )
+                for sub in batch
+            ],
+            destination=first.address,
+        )
+        if operation == "subscribe":
+            request.issueConfirmedNotifications = first.confirmed
+            request.lifetime = first.lifetime
+        try:
+            await self._request(request)
+        except (Exception, ErrorRejectAbortNack) as error:
+            if operation == "cancel":
+                return
+            # use SubscribeCOV for this device from now on
+            self.log(
+                f"{first.device_address} | SubscribeCOVPropertyMultiple failed ({error}), using SubscribeCOV",
+                level="warning",
+            )
+            self._multiple_refused.add(first.device_address)
+            for sub in batch:
+                if sub.cancelled:
+                    continue
+                self._forget(sub)
+                sub.multiple = False
+                sub.process_identifier = self._process_identifier(sub.address)
+                self._by_device[sub.device_address].add(sub)
+                self.app._cov_contexts[(sub.address, sub.process_identifier)] = sub
+                self._queue(sub.device_address, "subscribe", sub)
+            return
+        if operation == "subscribe":
+            for sub in batch:
+                self._subscribed(sub)
+
+    def _subscribed(self, sub: COVSubscription) -> None:
+        if sub.cancelled:
+            # cancelled while the request was sent, the device has it now
+            self._queue_cancel(sub)
+            return
+        now = time.monotonic()
+        if sub.active:
+            sub.renewals += 1
+        sub.active = True
+        sub.error = None
+        if sub.last_notification is None:
+            sub.last_notification = now
+        if sub.lifetime:
+            # spread the renewals : golden ratio sequence over the window
+            seq = next(self._counter)
+            spread = (seq * GOLDEN_RATIO) % 1
+            when = now + sub.lifetime * (RENEW_FROM + (RENEW_TO - RENEW_FROM) * spread)
+            sub._renew_seq = seq
+            heapq.heappush(self._renewals, (when, seq, sub))
+
+    def renew_due(self, now: t.Optional[float] = None) -> int:
+        """
+        Send the renewals that are due
+
+        :returns: (int) number of renewals queued
+        """
+        now = time.monotonic() if now is None else now
+        count = 0
+        while self._renewals and self._renewals[0][0] <= now:
+            _, seq, sub = heapq.heappop(self._renewals)
+            if sub._renew_seq != seq or sub.cancelled:
+                continue
+            sub._renew_seq = None
+            self._queue(sub.device_address, "subscribe", sub)
+            count += 1
+        self.renewals += count
+        return count
+
+    def _notify(self, sub: COVSubscription, property_identifier, array_index, value):
+        if sub.cancelled:
+            return
+        point = sub.point
+        try:
+            vendor_info = get_vendor_info(point.properties.device.properties.vendor_id)
+            object_class = vendor_info.get_object_class(
+                sub.monitored_object_identifier[0]
+            )
+            property_type = object_class.get_property_type(property_identifier)
+            if issubclass(property_type, Array) and array_index is not None:
+                property_type = Unsigned if array_index == 0 else property_type._subtype
+            value = value.cast_out(property_type)
+        except (AttributeError, TypeError, ValueError) as error:
+            point.log(f"COV notification not decoded : {error}", level="warning")
+            return
+        sub.last_notification = time.monotonic()
+        point.log(
+            f"COV notification received for {point.properties.name} | {property_identifier} : {value}",
+            level="debug",
+        )
+        if property_identifier == PropertyIdentifier.presentValue:
+            sub.notifications += 1
+            self._record(sub.device_address)
+            point._trend(extract_value_from_primitive_data(value))
+        elif property_identifier == PropertyIdentifier.statusFlags:
+            point.properties.status_flags = value
+        else:
+            point._log.warning(
+                f"Unsupported COV property identifier {property_identifier}"
+            )
+
+    async def _do_notification(self, apdu) -> None:
+        """
+        Confirmed and unconfirmed COVNotificationMultiple
+        """
+        confirmed = isinstance(apdu, ConfirmedCOVNotificationMultipleRequest)
+        subs = self._multiple.get((apdu.pduSource, apdu.subscriberProcessIdentifier))
+        if subs is None:
+            if confirmed:
+                raise ServicesError(errorCode="unknownSubscription")
+            return
+        for notification in apdu.listOfCOVNotifications:
+            sub = subs.get(notification.monitoredObjectIdentifier)
+            if sub is None:
+                continue
+            for value in notification.listOfValues:
+                self._notify(
+                    sub, value.propertyIdentifier, value.propertyArrayIndex, value.value
+                )
+        if confirmed:
+            await self.app.response(SimpleAckPDU(context=apdu))
+
+    def _record(self, key: str) -> None:
+        second = int(time.monotonic())
+        counts = self._rates.get(key)
+        if counts is None:
+            counts = self._rates[key] = deque()
+        if counts and counts[-1][0] == second:
+            counts[-1][1] += 1
+        else:
+            counts.append([second, 1])
+            while counts[0][0] <= second - self.window:
+                counts.popleft()
+
+    def notification_rates(self) -> t.Dict[str, float]:
+        """
+        Notifications of present values per second, for each device, over
+        the last window seconds
+        """
+        oldest = int(time.monotonic()) - self.window
+        return {
+            key: sum(count for second, count in counts if second > oldest) / self.window
+            for key, counts in self._rates.items()
+        }
+
+    @property
+    def metrics(self) -> t.Dict[str, t.Any]:
+        subscriptions = self.subscriptions()
+        rates = self.notification_rates()
+        devices = {}
+        for key, subs in self._by_device.items():
+            if subs:
+                devices[key] = {
+                    "subscriptions": len(subs),
+                    "active": sum(sub.active for sub in subs),
+                    "multiple": key not in self._multiple_refused
+                    and any(sub.multiple for sub in subs),
+                    "notifications_per_second": rates.get(key, 0.0),
+                }
+        return {
+            "subscriptions": len(subscriptions),
+            "active": sum(sub.active for sub in subscriptions),
+            "pending": sum(not sub.active for sub in subscriptions),
+            "renewals": self.renewals,
+            "failures": self.failures,
+            "notifications": sum(sub.notifications for sub in subscriptions),
+            "notifications_per_second": sum(rates.values()),
+            "devices": devices,
+        }
+
+    async def close(self, timeout: float = 2.0) -> None:
+        """
+        Cancel every subscription. The devices are told, requests not
+        answered after timeout seconds are abandoned.
+        """
+        if self._renewal_task is not None:
+            self._renewal_task.stop()
+            self._renewal_task = None
+        for sub in self.subscriptions():
+            self.cancel(sub)
+        deadline = time.monotonic() + timeout
+        while True:
+            senders = [sender for sender in self._senders.values() if not sender.done()]
+            remaining = deadline - time.monotonic()
+            if not senders or remaining <= 0:
+                break
+            # a subscription answered meanwhile queues its cancel
+            await asyncio.wait(senders, timeout=remaining)
+        for sender in self._senders.values():
+            sender.cancel()
+        self._senders.clear()
+        self._pending.clear()
+        self._renewals = []
@@ -8,6 +8,7 @@
 Poll.py - create a Polling task to repeatedly read a point.
 """
 
+import math
 import typing as t
 
 # --- standard Python modules ---
@@ -85,6 +86,12 @@ class DevicePoll(Task):
         self.failures = 0
         self.MAX_FAILURES = 3
         self._device = weakref.ref(device)
+        # delay of the points in no poll group, the task runs often enough
+        # for every group
+        self.period = delay
+        groups = getattr(device, "poll_groups", None)
+        if groups and delay > 0:
+            delay = groups.tick(delay)
         Task.__init__(self, name=f"{prefix}_{name}", delay=delay)
         self._counter = 0
 
@@ -92,6 +99,39 @@ class DevicePoll(Task):
     def device(self) -> t.Union["RPMDeviceConnected", "RPDeviceConnected", None]:
         return self._device()
 
+    def _requests_per_poll(self) -> int:
+        groups = self.device.poll_groups
+        if groups and self.delay > 0:
+            # average number of points read by each run of the task
+            points = sum(
+                len(names) * self.delay / groups.delay(name, self.period)
+                for name, names in groups.members(self.device).items()
+            )
+        else:
+            points = len(list(self.device.pollable_points_name))
+        if not self.device.properties.pss["readPropertyMultiple"]:
+            return max(points, 1)
+        sizer = getattr(self.device, "_rpm_batch_sizer", None)
+        size = sizer.size if sizer is not None else 25
+        return max(math.ceil(points / size), 1)
+
+    def start(self) -> None:
+        # polls sharing a router or a network are spread over the period
+        planner = getattr(self.device.properties.network, "poll_planner", None)
+        if planner is not None and self.delay > 0:
+            self.offset = planner.plan(
+                self.id, self.device, self.delay, weight=self._requests_per_poll()
+            )
+        Task.start(self)
+
+    def stop(self):
+        if self.device is not None:
+            network = self.device.properties.network
+            planner = getattr(network, "poll_planner", None)
+            if planner is not None:
+                planner.release(self.id)
+        return Task.stop(self)
+
     async def task(self) -> None:
         if self.device.properties.ping_failures > 0:
             self.device._log.warning(
@@ -108,14 +148,22 @@ class DevicePoll(Task):
                         self.device.properties.name, self.device.properties.address
                     )
                 )
-            await self.device.read_multiple(
-                list(self.device.pollable_points_name), points_per_request=25
-            )
+            groups = self.device.poll_groups
+            if groups and self.delay > 0:
+                points = groups.due(self.device, self.period, self.delay)
+                if points:
+                    await self.device.read_multiple(points)
+                if None not in groups.last_due:
+                    self.failures = 0
+                    return
+            else:
+                await self.device.read_multiple(list(self.device.pollable_points_name))
             self._counter += 1
             if self._counter == self.device.properties.auto_save:
-                self.device.save(resampling=self.device.properties.save_resampling)
-                if self.device.properties.clear_history_on_save:
-                    self.device.clear_histories()
+                # Snapshot queued, written by the persistence writer
+                self.device.save_in_background(
+                    resampling=self.device.properties.save_resampling
+                )
                 self._counter = 0
             self.failures = 0
         except AttributeError as e:
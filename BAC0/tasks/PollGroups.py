@@ -0,0 +1,187 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+#
+# Copyright (C) 2015 by Christian Tremblay, P.Eng <christian.tremblay@servisys.com>
+# Licensed under LGPLv3, see file LICENSE in this source tree.
+#
+"""
+PollGroups.py - points of a device polled at different rates.
+
+A device is still polled by one task. The task runs at the greatest common
+divisor of the periods and, on each run, reads the points of every group
+that is due in one read_multiple call, so groups due at the same time share
+the same ReadPropertyMultiple requests.
+"""
+
+import math
+import re
+import time
+import typing as t
+
+from bacpypes3.basetypes import ObjectType
+
+# --- this application's modules ---
+from ..core.io.IOExceptions import WrongParameter
+
+# ------------------------------------------------------------------------------
+
+
+class PollGroup(object):
+    """
+    Points read every delay seconds. A point belongs to the first group it
+    matches (all the filters given), points matching no group are read at
+    the device polling delay.
+
+    :param name: (str) name of the group
+    :param delay: (float) seconds between reads
+    :param types: (list) object types (ex. ["analogInput", "analogValue"])
+    :param names: (str) regular expression searched in the point names
+    :param tags: (list) tag ids, or (tag id, value) tuples, the points must have
+    """
+
+    def __init__(
+        self,
+        name: str,
+        delay: float,
+        *,
+        types: t.Optional[t.Iterable[str]] = None,
+        names: t.Optional[str] = None,
+        tags: t.Optional[t.Iterable[t.Union[str, t.Tuple[str, t.Any]]]] = None,
+    ):
+        if delay <= 0:
+            raise WrongParameter(f"Poll group {name} : delay must be > 0")
+        self.name = name
+        self.delay = delay
+        try:
+            # "analogInput" and "analog-input" are both accepted
+            self.types = {str(ObjectType(each)) for each in types} if types else None
+        except ValueError as error:
+            raise WrongParameter(f"Poll group {name} : unknown object type {error}")
+        self.names = re.compile(names) if names else None
+        self.tags = [tag if isinstance(tag, str) else tuple(tag) for tag in tags or []]
+
+    def matches(self, point) -> bool:
+        if (
+            self.types is not None
+            and str(ObjectType(point.properties.type)) not in self.types
+        ):
+            return False
+        if self.names is not None and not self.names.search(point.properties.name):
+            return False
+        for tag in self.tags:
+            if isinstance(tag, str):
+                if not any(tag_id == tag for tag_id, _ in point.tags):
+                    return False
+            elif tag not in point.tags:
+                return False
+        return True
+
+    def __repr__(self):
+        return f"PollGroup({self.name!r}, delay={self.delay})"
+
+
+class PollGroups(object):
+    """
+    Poll groups of a device and when each one is due
+    """
+
+    def __init__(self):
+        self._groups: t.Dict[str, PollGroup] = {}
+        # group name (None for the device delay) -> monotonic time of next read
+        self._next_due: t.Dict[t.Optional[str], float] = {}
+        self._members: t.Dict[t.Optional[str], t.List[str]] = {}
+        self._members_key = None
+        self.last_due: t.List[t.Optional[str]] = []
+
+    def add(self, group: PollGroup) -> None:
+        self._groups[group.name] = group
+        self._next_due.pop(group.name, None)
+        self._members_key = None
+
+    def remove(self, name: str) -> PollGroup:
+        try:
+            group = self._groups.pop(name)
+        except KeyError:
+            raise WrongParameter(f"Unknown poll group : {name}")
+        self._next_due.pop(name, None)
+        self._members_key = None
+        return group
+
+    def __getitem__(self, name: str) -> PollGroup:
+        return self._groups[name]
+
+    def __contains__(self, name: str) -> bool:
+        return name in self._groups
+
+    def __iter__(self) -> t.Iterator[PollGroup]:
+        return iter(self._groups.values())
+
+    def __len__(self) -> int:
+        return len(self._groups)
+
+    def members(self, device) -> t.Dict[t.Optional[str], t.List[str]]:
+        """
+        Names of the pollable points of each group, None being the points
+        read at the device delay. Evaluated again when the pollable points
+        (ex. points read by COV) or the groups change.
+        """
+        pollable = tuple(device.pollable_points_name)
+        key = (id(device.points), pollable)
+        if key != self._members_key:
+            members: t.Dict[t.Optional[str], t.List[str]] = {
+                name: [] for name in self._groups
+            }
+            members[None] = []
+            pollable = set(pollable)
+            for point in device.points:
+                name = point.properties.name
+                if name not in pollable:
+                    continue
+                group = next(
+                    (g.name for g in self._groups.values() if g.matches(point)), None
+                )
+                members[group].append(name)
+            self._members = members
+            self._members_key = key
+        return self._members
+
+    def tick(self, delay: float) -> float:
+        """
+        Delay of the polling task : greatest common divisor of the periods
+        (the shortest one if some are not whole seconds)
+        """
+        periods = [delay] + [group.delay for group in self._groups.values()]
+        if all(float(period).is_integer() for period in periods):
+            return math.gcd(*(int(period) for period in periods))
+        return min(periods)
+
+    def delay(self, name: t.Optional[str], default: float) -> float:
+        return default if name is None else self._groups[name].delay
+
+    def due(
+        self, device, delay: float, tick: float, now: t.Optional[float] = None
+    ) -> t.List[str]:
+        """
+        Names of the points to read now. Groups are read on the first call
+        then every delay seconds ; a group is due if it would be late on the
+        next tick.
+
+        :param delay: (float) device polling delay (points in no group)
+        :param tick: (float) delay of the polling task
+        """
+        now = time.monotonic() if now is None else now
+        limit = now + tick / 2
+        names = []
+        self.last_due = []
+        for name, points in self.members(device).items():
+            next_due = self._next_due.get(name, now)
+            if next_due > limit:
+                continue
+            period = self.delay(name, delay)
+            # fixed rate, missed reads are not made up
+            while next_due <= limit:
+                next_due += period
+            self._next_due[name] = next_due
+            self.last_due.append(name)
+            names.extend(points)
+        return names
@@ -0,0 +1,196 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+#
+# Copyright (C) 2015 by Christian Tremblay, P.Eng <christian.tremblay@servisys.com>
+# Licensed under LGPLv3, see file LICENSE in this source tree.
+#
+"""
+PollPlanner.py - spread the device polls sharing a trunk over their period.
+
+Devices created together would otherwise be polled together, every delay
+seconds, and flood the MS/TP trunk behind their router. The planner groups
+the polls by trunk (the router used to reach the network, or the network
+number) and starts each new poll where its trunk is the least busy.
+"""
+
+import math
+import time
+import typing as t
+import weakref
+from collections import deque
+
+from bacpypes3.pdu import Address
+
+# --- this application's modules ---
+from ..core.utils.notes import note_and_log
+
+# ------------------------------------------------------------------------------
+
+
+@note_and_log
+class PollPlanner(object):
+    """
+    Phase of the device polls and request rate of each network
+
+    :param network: the network (Lite), used to find the router and network
+        number of the devices
+    :param resolution: (float) seconds, precision of the phases
+    :param window: (int) seconds of requests kept to compute the peak rate
+    """
+
+    def __init__(self, network=None, resolution: float = 0.5, window: int = 60):
+        self._network = weakref.ref(network) if network is not None else lambda: None
+        self.resolution = resolution
+        self.window = window
+        self._epoch = time.monotonic()
+        # trunk -> {key: (phase, period, weight)}
+        self._plans: t.Dict[tuple, t.Dict[t.Any, t.Tuple[float, float, float]]] = {}
+        self._trunks: t.Dict[t.Any, tuple] = {}
+        # network number -> deque of [second, requests]
+        self._requests: t.Dict[t.Optional[int], deque] = {}
+
+    def trunk(self, device) -> tuple:
+        """
+        ("router", router address) if the network of the device is reached
+        through a known router, else ("network", network number)
+        """
+        address = Address(str(device.properties.address))
+        network_number = address.addrNet
+        network = self._network()
+        if network_number is None and network is not None:
+            discovered = getattr(network, "discoveredDevices", None) or {}
+            info = discovered.get(f"device,{device.properties.device_id}")
+            if info and info["network_number"]:
+                # the set can hold None (heard on the local network)
+                network_number = min(
+                    (number for number in info["network_number"] if number is not None),
+                    default=None,
+                )
+        try:
+            return network._trunk(address, network_number)
+        except AttributeError:
+            return ("network", network_number)
+
+    def plan(self, key, device, period: float, weight: float = 1) -> float:
+        """
+        Choose the phase of a poll : the least busy moment of its trunk.
+        The first poll of a trunk starts right away (on the next resolution
+        step).
+
+        :param key: identifies the poll (released with release(key))
+        :param period: (float) seconds between polls
+        :param weight: (float) requests sent by each poll
+        :returns: (float) seconds to wait before the first poll
+        """
+        self.release(key)
+        trunk = self.trunk(device)
+        plans = self._plans.setdefault(trunk, {})
+        now = time.monotonic()
+        # phases are on a grid (resolution) so they can be compared exactly
+        start = self._epoch + self.resolution * math.ceil(
+            (now - self._epoch) / self.resolution
+        )
+        slots = max(1, min(round(period / self.resolution), 3600))
+        slot = 0
+        if plans:
+            slot = self._quietest(self._load(plans.values(), start, period, slots))
+        phase = start + slot * period / slots
+        plans[key] = (phase, period, weight)
+        self._trunks[key] = trunk
+        offset = phase - now
+        self.log(
+            f"{device.properties.name} | Poll planned on {trunk}, first in {offset:.1f} sec",
+            level="debug",
+        )
+        return offset
+
+    def release(self, key) -> None:
+        trunk = self._trunks.pop(key, None)
+        if trunk is not None:
+            self._plans[trunk].pop(key, None)
+            if not self._plans[trunk]:
+                del self._plans[trunk]
+
+    @staticmethod
+    def _load(plans, start: float, length: float, slots: int) -> t.List[float]:
+        """
+        Requests of the polls in each slot of [start, start + length)
+        """
+        load = [0.0] * slots
+        for phase, period, weight in plans:
+            fire = start + (phase - start) % period
+            while fire < start + length:
+                load[round((fire - start) / length * slots) % slots] += weight
+                fire += period
+        return load
+
+    @staticmethod
+    def _quietest(load: t.List[float]) -> int:
+        """
+        Middle of the longest run of the least loaded slots (circular)
+        """
+        lowest = min(load)
+        slots = len(load)
+        if all(value == lowest for value in load):
+            return 0
+        # start scanning after a busy slot so runs don't wrap around
+        begin = next(i for i in range(slots) if load[i] != lowest) + 1
+        best_start, best_length = 0, 0
+        run_start, run_length = None, 0
+        for step in range(slots):
+            i = (begin + step) % slots
+            if load[i] == lowest:
+                if run_start is None:
+                    run_start, run_length = i, 0
+                run_length += 1
+                if run_length > best_length:
+                    best_start, best_length = run_start, run_length
+            else:
+                run_start = None
+        return (best_start + best_length // 2) % slots
+
+    def record(self, network_number: t.Optional[int], requests: int = 1) -> None:
+        """
+        Count requests sent to a network (None is the local network)
+        """
+        second = int(time.monotonic())
+        counts = self._requests.get(network_number)
+        if counts is None:
+            counts = self._requests[network_number] = deque()
+        if counts and counts[-1][0] == second:
+            counts[-1][1] += requests
+        else:
+            counts.append([second, requests])
+            while counts[0][0] <= second - self.window:
+                counts.popleft()
+
+    @property
+    def peak_requests_per_second(self) -> t.Dict[t.Optional[int], int]:
+        """
+        Highest number of requests sent in one second to each network during
+        the last window seconds
+        """
+        oldest = int(time.monotonic()) - self.window
+        return {
+            network: max(
+                (count for second, count in counts if second > oldest), default=0
+            )
+            for network, counts in self._requests.items()
+        }
+
+    @property
+    def metrics(self) -> t.Dict[str, t.Any]:
+        """
+        Measured peak rate of each network, and planned peak (requests in
+        the busiest second of the longest period) of each trunk
+        """
+        trunks = {}
+        now = time.monotonic()
+        for trunk, plans in self._plans.items():
+            length = max(period for _, period, _ in plans.values())
+            load = self._load(plans.values(), now, length, max(1, math.ceil(length)))
+            trunks[trunk] = {"polls": len(plans), "planned_peak": max(load)}
+        return {
+            "peak_requests_per_second": self.peak_requests_per_second,
+            "trunks": trunks,
+        }
@@ -60,4 +60,3 @@ class RecurringTask(Task):
             else:
                 await loop.run_in_executor(executor, self.func)
                 #self.func()
-        await asyncio.sleep(self.delay)
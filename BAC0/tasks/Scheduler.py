@@ -0,0 +1,186 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+#
+# Copyright (C) 2015 by Christian Tremblay, P.Eng <christian.tremblay@servisys.com>
+# Licensed under LGPLv3, see file LICENSE in this source tree.
+#
+"""
+Scheduler.py - one loop running every recurring task.
+
+Next executions are kept in a heap. A task is scheduled again when its body
+is over, at a fixed rate (previous planned time + delay). Executions that
+would already be late are skipped, so a slow task never runs twice in a row
+to catch up and its phase doesn't drift.
+"""
+
+import asyncio
+import contextlib
+import heapq
+import itertools
+import time
+import typing as t
+
+# --- this application's modules ---
+from ..core.utils.notes import note_and_log
+
+# ------------------------------------------------------------------------------
+
+
+@note_and_log
+class Scheduler(object):
+    """
+    Run recurring tasks (Task with a delay) from a single coroutine
+
+    :param max_concurrency: (int) maximum number of task bodies running at
+        the same time, None for no limit. Tasks due while the limit is
+        reached wait for a free slot, in order.
+    """
+
+    def __init__(self, max_concurrency: t.Optional[int] = None):
+        self._max_concurrency = max_concurrency
+        self._heap: t.List[t.Tuple[float, int, t.Any]] = []
+        self._counter = itertools.count()
+        self._tasks: t.Dict[int, t.Any] = {}
+        # task id -> sequence number of its entry in the heap
+        self._scheduled: t.Dict[int, int] = {}
+        self._semaphore: t.Optional[asyncio.Semaphore] = None
+        self._wakeup: t.Optional[asyncio.Event] = None
+        self._runner: t.Optional[asyncio.Task] = None
+        self._loop = None
+        self.running = 0
+        self.skipped = 0
+
+    @property
+    def max_concurrency(self) -> t.Optional[int]:
+        return self._max_concurrency
+
+    @max_concurrency.setter
+    def max_concurrency(self, value: t.Optional[int]) -> None:
+        # bodies already running release the semaphore they acquired
+        self._max_concurrency = value
+        self._semaphore = asyncio.Semaphore(value) if value else None
+
+    def __contains__(self, task_id: int) -> bool:
+        return task_id in self._tasks
+
+    def __len__(self) -> int:
+        return len(self._tasks)
+
+    @property
+    def metrics(self) -> t.Dict[str, t.Any]:
+        return {
+            "tasks": len(self._tasks),
+            "running": self.running,
+            "max_concurrency": self._max_concurrency,
+            "skipped": self.skipped,
+            "heap": len(self._heap),
+        }
+
+    def _ensure_running(self) -> None:
+        loop = asyncio.get_running_loop()
+        if self._loop is not loop:
+            # new event loop (ex. asyncio.run called again), start over
+            self._heap = []
+            self._scheduled = {}
+            self._tasks = {}
+            self._loop = loop
+            self._wakeup = asyncio.Event()
+            self.max_concurrency = self._max_concurrency
+            self._runner = None
+        if self._runner is None or self._runner.done():
+            self._runner = asyncio.create_task(self._run(), name="BAC0_scheduler")
+
+    def add(self, task, after: float = 0.0) -> None:
+        """
+        Schedule a recurring task
+
+        :param after: (float) seconds before the first execution
+        """
+        self._ensure_running()
+        self._tasks[task.id] = task
+        self._push(task, self._loop.time() + after)
+
+    def cancel(self, task_id: int) -> bool:
+        """
+        Remove a task, its entry in the heap is dropped when reached.
+        A running body is not cancelled here.
+
+        :returns: (bool) False if the task was not scheduled
+        """
+        if self._tasks.pop(task_id, None) is None:
+            return False
+        self._scheduled.pop(task_id, None)
+        if len(self._heap) > 2 * len(self._scheduled) + 64:
+            self._heap = [
+                entry
+                for entry in self._heap
+                if self._scheduled.get(entry[2].id) == entry[1]
+            ]
+            heapq.heapify(self._heap)
+        return True
+
+    async def stop(self) -> None:
+        """
+        Stop the scheduler loop and forget every task
+        """
+        runner, self._runner = self._runner, None
+        if runner is not None and runner.get_loop() is asyncio.get_running_loop():
+            runner.cancel()
+            with contextlib.suppress(asyncio.CancelledError):
+                await runner
+        self._heap = []
+        self._scheduled = {}
+        self._tasks = {}
+
+    def _push(self, task, when: float) -> None:
+        seq = next(self._counter)
+        self._scheduled[task.id] = seq
+        heapq.heappush(self._heap, (when, seq, task))
+        task.next_execution = time.time() + (when - self._loop.time())
+        if self._heap[0][1] == seq:
+            # sooner than what the loop is waiting for
+            self._wakeup.set()
+
+    async def _run(self) -> None:
+        loop = asyncio.get_running_loop()
+        while True:
+            self._wakeup.clear()
+            while self._heap and self._heap[0][0] <= loop.time():
+                when, seq, task = heapq.heappop(self._heap)
+                if self._scheduled.get(task.id) != seq:
+                    # cancelled
+                    continue
+                del self._scheduled[task.id]
+                semaphore = self._semaphore
+                if semaphore is not None:
+                    await semaphore.acquire()
+                    if task.id not in self._tasks:
+                        # stopped while waiting for a slot
+                        semaphore.release()
+                        continue
+                task.aio_task = asyncio.create_task(
+                    self._execute(task, when, semaphore), name=f"aio{task.name}"
+                )
+            timeout = self._heap[0][0] - loop.time() if self._heap else None
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), timeout)
+            except asyncio.TimeoutError:
+                pass
+
+    async def _execute(self, task, when: float, semaphore) -> None:
+        self.running += 1
+        try:
+            await task._run_once()
+        finally:
+            self.running -= 1
+            if semaphore is not None:
+                semaphore.release()
+            task.aio_task = None
+            if task.id in self._tasks:
+                next_when = when + task.delay
+                now = self._loop.time()
+                if next_when <= now:
+                    missed = int((now - when) // task.delay)
+                    self.skipped += missed
+                    next_when = when + (missed + 1) * task.delay
+                self._push(task, next_when)
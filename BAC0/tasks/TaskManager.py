@@ -8,23 +8,32 @@
 TaskManager.py - creation of threads used for repetitive tasks.
 
 A key building block for point simulation.
+Recurring tasks are run by a single Scheduler (see Scheduler.py).
 """
+
 import asyncio
 import time
-from random import random
-
 
 # --- 3rd party modules ---
 # --- this application's modules ---
 from ..core.utils.notes import note_and_log
+from .Scheduler import Scheduler
 
 # ------------------------------------------------------------------------------
 
 
 async def stopAllTasks():
     Task._log.info("Stopping all tasks")
-    for each in Task.tasks:
-        each.aio_task.cancel()
+    current = asyncio.current_task()
+    aio_tasks = [
+        each.aio_task
+        for each in list(Task.tasks.values())
+        if each.aio_task is not None and each.aio_task is not current
+    ]
+    for aio_task in aio_tasks:
+        aio_task.cancel()
+    await asyncio.gather(*aio_tasks, return_exceptions=True)
+    await Task.scheduler.stop()
     Task._log.info("Ok all tasks stopped")
     Task.clean_tasklist()
     return True
@@ -32,13 +41,15 @@ async def stopAllTasks():
 
 @note_and_log
 class Task(object):
-    tasks = []
+    # task id -> task
+    tasks = {}
     high_latency = 60
+    scheduler = Scheduler()
 
     @classmethod
     def clean_tasklist(cls):
         cls._log.debug("Cleaning tasks list")
-        cls.tasks = []
+        cls.tasks = {}
 
     @classmethod
     def number_of_tasks(cls):
@@ -61,7 +72,9 @@ class Task(object):
         self.previous_execution = None
         self.average_execution_delay = 0
         self.average_latency = 0
-        self.next_execution = time.time() + delay + (random() * 10)
+        self.next_execution = time.time()
+        # seconds before the first execution of a recurring task
+        self.offset = 0.0
         self.execution_time = 0.0
         self.count = 0
 
@@ -72,59 +85,63 @@ class Task(object):
     async def task(self):
         raise NotImplementedError("Must be implemented")
 
-    async def execute(self):
-        if self.delay > 0:
+    async def _run_once(self):
+        """
+        One execution of a recurring task, called by the scheduler
+        """
+        self.count += 1
+        _start_time = time.time()
+        self.log("Executing : %s | Count : %s", self.name, self.count, level="debug")
+        self.log("Start Time : %s", _start_time, level="debug")
+        if self.previous_execution:
             self.log(
-                f"Installing recurring task {self.name} (id:{self.id})", level="info"
+                "Previous execution : %s",
+                self.previous_execution,
+                level="debug",
             )
-            while True:
-                self.count += 1
-                _start_time = time.time()
-                self.log(
-                    f"Executing : {self.name} | Count : {self.count}", level="debug"
-                )
-                self.log(f"Start Time : {_start_time}", level="debug")
-                if self.previous_execution:
-                    self.log(
-                        f"Previous execution : {self.previous_execution}", level="debug"
-                    )
-                else:
-                    self.log("First Run", level="debug")
-
-                self.average_latency = (
-                    self.average_latency + (_start_time - self.next_execution)
-                ) / 2
-                try:
-                    if self.fn and self.args is not None:
-                        await self.fn(self.args)
-                    elif self.fn:
-                        await self.fn()
-                    else:
-                        if self._kwargs is not None:
-                            await self.task(**self._kwargs)
-                        else:
-                            await self.task()
-                except Exception as error:
-                    self.log(
-                        f"An exception occured while running the task {self.name} (id:{self.id}) : {error}",
-                        level="error",
-                    )
-                if self.previous_execution:
-                    _total = self.average_execution_delay + (
-                        _start_time - self.previous_execution
-                    )
-                    self.average_execution_delay = _total / 2
+        else:
+            self.log("First Run", level="debug")
+
+        self.average_latency = (
+            self.average_latency + (_start_time - self.next_execution)
+        ) / 2
+        try:
+            if self.fn and self.args is not None:
+                await self.fn(self.args)
+            elif self.fn:
+                await self.fn()
+            else:
+                if self._kwargs is not None:
+                    await self.task(**self._kwargs)
                 else:
-                    self.average_execution_delay = self.delay
+                    await self.task()
+        except Exception as error:
+            self.log(
+                f"An exception occured while running the task {self.name} (id:{self.id}) : {error}",
+                level="error",
+            )
+        if self.previous_execution:
+            _total = self.average_execution_delay + (
+                _start_time - self.previous_execution
+            )
+            self.average_execution_delay = _total / 2
+        else:
+            self.average_execution_delay = self.delay
+
+        # self.log('Stat for task {}'.format(self), level='info')
+        if self.average_latency > Task.high_latency:
+            self.log(f"High latency for {self.name}", level="warning")
+            self.log(f"Stats : {self}", level="warning")
 
-                # self.log('Stat for task {}'.format(self), level='info')
-                if self.average_latency > Task.high_latency:
-                    self.log(f"High latency for {self.name}", level="warning")
-                    self.log(f"Stats : {self}", level="warning")
+        self.execution_time = time.time() - _start_time
+        self.log("Execution Time : %s", self.execution_time, level="debug")
+        self.previous_execution = _start_time
 
-                self.execution_time = time.time() - _start_time
-                self.log(f"Execution Time : {self.execution_time}", level="debug")
-                self.previous_execution = _start_time
+    async def execute(self):
+        if self.delay > 0:
+            # Without the scheduler (start() uses it)
+            while True:
+                await self._run_once()
                 self.next_execution = time.time() + self.delay
                 await asyncio.sleep(self.delay)
         else:  # one shot
@@ -140,18 +157,28 @@ class Task(object):
                     await self.task()
 
     def start(self):
-        self.aio_task = asyncio.create_task(self.execute(), name=f"aio{self.name}")
-        Task.tasks.append(self)
+        Task.tasks[self.id] = self
+        if self.delay > 0:
+            self.log(
+                f"Installing recurring task {self.name} (id:{self.id})", level="info"
+            )
+            Task.scheduler.add(self, after=self.offset)
+        else:
+            self.aio_task = asyncio.create_task(self.execute(), name=f"aio{self.name}")
+            self.aio_task.add_done_callback(lambda _: Task.tasks.pop(self.id, None))
 
     def stop(self):
-        for each in Task.tasks:
-            if each.id == self.id:
-                each.aio_task.cancel()
-                Task.tasks.remove(each)
-                return True
+        if Task.tasks.pop(self.id, None) is None:
+            return None
+        Task.scheduler.cancel(self.id)
+        if self.aio_task is not None:
+            self.aio_task.cancel()
+        return True
 
     @property
     def done(self):
+        if self.delay > 0:
+            return self.previous_execution is not None and self.id not in Task.tasks
         if self.aio_task is not None:
             return self.aio_task.done()
         else:
@@ -11,6 +11,8 @@ import os
 import pytest
 
 import BAC0
+from BAC0.core.devices.Points import EnumPoint
+from BAC0.core.devices.Virtuals import VirtualDevice, VirtualPoint
 from BAC0.core.devices.local.factory import (
     ObjectFactory,
     analog_input,
@@ -77,6 +79,74 @@ def add_points(qty_per_type, device):
     _new_objects.add_objects_to_application(device)
 
 
+class FakeDevice(VirtualDevice):
+    """
+    Device without network holding its points, for the tests that don't
+    need the test devices (sinks, poll planning, COV manager...)
+    """
+
+    def __init__(self, name="dev", device_id=5, **properties):
+        super().__init__()
+        self.properties.name = name
+        self.properties.device_id = device_id
+        for key, value in properties.items():
+            setattr(self.properties, key, value)
+        self.points = []
+
+    @property
+    def pollable_points_name(self):
+        for point in self.points:
+            yield point.properties.name
+
+    def point(
+        self,
+        name,
+        object_type="analogVirtual",
+        address=None,
+        tags=(),
+        units="degreesCelsius",
+    ):
+        point = VirtualPoint(
+            name,
+            device=self,
+            object_type=object_type,
+            description=name,
+            units=units,
+            tags=list(tags),
+        )
+        if address is not None:
+            point.properties.address = address
+        self.points.append(point)
+        return point
+
+
+@pytest.fixture
+def fake_device():
+    """
+    FakeDevice(name="dev", device_id=5, **properties)
+    """
+    return FakeDevice
+
+
+@pytest.fixture
+def fake_points(fake_device):
+    """
+    Temperature (analog) and mode (multistate) points of a FakeDevice
+    """
+    device = fake_device()
+    temp = device.point("Temp")
+    mode = EnumPoint(
+        device=device,
+        pointType="multiStateValue",
+        pointAddress=1,
+        pointName="Mode",
+        description="Mode",
+        units_state=["Off", "On"],
+    )
+    device.points.append(mode)
+    return temp, mode
+
+
 class NetworkAndDevices:
     def __init__(
         self, loop, bacnet, device_app, device30_app, test_device, test_device_30
@@ -0,0 +1,87 @@
+#!/usr/bin/env python
+# -*- coding utf-8 -*-
+
+"""
+Micro-benchmark : cost of logging per read()
+
+Two BAC0 instances are started on loopback (like tests/conftest.py) and the
+same ReadProperty is repeated using :
+
+    * legacy  : log() rebuilt like it was before (inspect.stack() and string
+                formatting for every non-INFO message, even if discarded)
+    * lazy    : current log(), level checked before anything else
+    * lazy, no caller capture : same, with set_caller_capture(False)
+
+DEBUG is not enabled on any handler, so every debug message is discarded.
+
+    python tests/manual_benchmark_logging.py
+"""
+
+import asyncio
+import inspect
+import logging
+import time
+
+import BAC0
+from BAC0.core.devices.local.factory import ObjectFactory, analog_value
+from BAC0.core.utils.notes import convert_level, set_caller_capture
+from BAC0.scripts.Lite import Lite
+
+READS = 500
+
+
+def legacy_log(self, note, *args, level=logging.DEBUG):
+    if not note:
+        raise ValueError("Provide something to log")
+    if isinstance(level, str):
+        level = convert_level(level)
+    if args:
+        note = note % args
+    if level == logging.INFO:
+        note = f"{note}"
+    else:
+        caller_frame = inspect.stack()[1]
+        module = inspect.getmodule(caller_frame[0])
+        module_name = module.__name__ if module else "unknown"
+        note = f"{Lite.logname} | {module_name} | {note}"
+    Lite._log.log(level, note)
+
+
+async def time_reads(bacnet, request, reads=READS):
+    start = time.perf_counter()
+    for _ in range(reads):
+        await bacnet.read(request)
+    return (time.perf_counter() - start) / reads
+
+
+async def main():
+    BAC0.log_level("default")
+    ip = "127.0.0.1/24"
+    async with BAC0.start(ip=ip, localObjName="bacnet") as bacnet:
+        async with BAC0.start(ip=ip, port=47809, localObjName="device_app") as dev:
+            ObjectFactory.clear_objects()
+            _new_objects = analog_value(presentValue=12.3)
+            _new_objects.add_objects_to_application(dev)
+            request = f"{dev.localIPAddr.addrTuple[0]}:47809 analogValue 0 presentValue"
+            # warm up (device info cache, vendor info...)
+            await time_reads(bacnet, request, reads=20)
+
+            lazy_log = Lite.log
+            Lite.log = legacy_log
+            legacy = await time_reads(bacnet, request)
+            Lite.log = lazy_log
+
+            lazy = await time_reads(bacnet, request)
+            set_caller_capture(False)
+            no_capture = await time_reads(bacnet, request)
+            set_caller_capture(True)
+
+            print(f"{'legacy':<30} {legacy * 1e6:10.1f} us / read()")
+            print(f"{'lazy':<30} {lazy * 1e6:10.1f} us / read()")
+            print(
+                f"{'lazy, no caller capture':<30} {no_capture * 1e6:10.1f} us / read()"
+            )
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,97 @@
+#!/usr/bin/env python
+# -*- coding utf-8 -*-
+
+"""
+Benchmark : open a saved device (DeviceFromDB) and go through its points
+
+A backup of a device with 500 analog points (one day of 1 minute records)
+is written in a temporary folder, then loaded offline. For each point,
+history and lastValue are used like a notebook would do.
+
+    python tests/manual_benchmark_offline_db.py [points] [rows]
+"""
+
+import asyncio
+import os
+import json
+import sqlite3
+import sys
+import tempfile
+import time
+
+import numpy as np
+import pandas as pd
+
+import BAC0
+from BAC0.core.devices.Device import Device, DeviceFromDB
+from BAC0.db.sql import PROPERTIES_SCHEMA, PROPERTIES_VERSION
+
+
+def write_backup(db_name, points, rows):
+    index = pd.date_range("2024-01-01", periods=rows, freq="1min", tz="UTC")
+    names = [f"AV-{i}" for i in range(points)]
+    df = pd.DataFrame(np.random.rand(rows, points) * 100, index=index, columns=names)
+    device = {
+        "name": "benchmark",
+        "address": "2:5",
+        "device_id": 5,
+        "pollDelay": 10,
+        "objects_list": [],
+        "multistates": {},
+        "auto_save": False,
+        "save_resampling": "1s",
+        "clear_history_on_save": False,
+        "history_size": None,
+    }
+    props = [
+        (
+            name,
+            json.dumps(
+                {
+                    "name": name,
+                    "type": "analogValue",
+                    "address": i,
+                    "description": name,
+                    "units_state": "degreesCelsius",
+                }
+            ),
+        )
+        for i, name in enumerate(names)
+    ]
+    with sqlite3.connect(f"{db_name}.db") as con:
+        df.index = df.index.map(lambda ts: ts.isoformat(sep=" "))
+        df.to_sql("history", con, index_label="index")
+        con.executescript(PROPERTIES_SCHEMA)
+        con.executemany(
+            "INSERT INTO metadata (name, value) VALUES (?, ?)",
+            [
+                ("properties_version", PROPERTIES_VERSION),
+                ("device", json.dumps(device)),
+            ],
+        )
+        con.executemany("INSERT INTO point_properties VALUES (?, ?)", props)
+
+
+async def main(points, rows):
+    BAC0.log_level("error")
+    with tempfile.TemporaryDirectory() as folder:
+        db_name = os.path.join(folder, "benchmark")
+        write_backup(db_name, points, rows)
+
+        start = time.perf_counter()
+        device = Device(from_backup=f"{db_name}.db")
+        await device.new_state(DeviceFromDB)
+        loaded = time.perf_counter()
+        for point in device.points:
+            point.history.mean()
+            point.lastValue
+        done = time.perf_counter()
+
+    print(f"{len(device.points)} points, {rows} records")
+    print(f"{'load':<30} {loaded - start:10.2f} s")
+    print(f"{'history + lastValue':<30} {done - loaded:10.2f} s")
+
+
+if __name__ == "__main__":
+    args = [int(arg) for arg in sys.argv[1:3]]
+    asyncio.run(main(*(args + [500, 1440][len(args) :])))
@@ -0,0 +1,76 @@
+#!/usr/bin/env python
+# -*- coding utf-8 -*-
+
+"""
+Benchmark : poll cycle time against the ReadPropertyMultiple in-flight window
+
+Two BAC0 instances are started on loopback (like tests/conftest.py). The
+second one holds a few hundred objects and is defined as a BAC0.device on the
+first one. The same read_multiple() of all points is then timed using
+different values of device.properties.rpm_window.
+
+On loopback the round trip is almost free so a delay can be added to each
+ReadPropertyMultiple to mimic a slow router (default 20 ms).
+
+    python tests/manual_benchmark_rpm_window.py [latency_in_seconds]
+"""
+
+import asyncio
+import sys
+import time
+
+import BAC0
+from BAC0.core.devices.local.factory import ObjectFactory, analog_value, binary_value
+
+OBJECTS = 200
+POINTS_PER_REQUEST = 10
+CYCLES = 5
+WINDOWS = (1, 2, 4, 8)
+
+
+async def time_cycles(device, points, cycles=CYCLES):
+    start = time.perf_counter()
+    for _ in range(cycles):
+        await device.read_multiple(points, points_per_request=POINTS_PER_REQUEST)
+    return (time.perf_counter() - start) / cycles
+
+
+async def main(latency):
+    BAC0.log_level("error")
+    ip = "127.0.0.1/24"
+    async with BAC0.start(ip=ip, localObjName="bacnet") as bacnet:
+        async with BAC0.start(ip=ip, port=47809, localObjName="device_app") as dev:
+            ObjectFactory.clear_objects()
+            for _ in range(OBJECTS // 2):
+                _new_objects = analog_value(presentValue=12.3)
+                _new_objects = binary_value()
+            _new_objects.add_objects_to_application(dev)
+
+            device = await BAC0.device(
+                f"{dev.localIPAddr.addrTuple[0]}:47809", dev.Boid, bacnet, poll=0
+            )
+            points = list(device.pollable_points_name)
+
+            read_property_multiple = bacnet.readPropertyMultiple
+
+            async def slow_router(*args, **kwargs):
+                await asyncio.sleep(latency)
+                return await read_property_multiple(*args, **kwargs)
+
+            bacnet.readPropertyMultiple = slow_router
+
+            print(
+                f"{len(points)} points, {POINTS_PER_REQUEST} points per request, "
+                f"{latency * 1000:.0f} ms added per request"
+            )
+            for window in WINDOWS:
+                device.properties.rpm_window = window
+                cycle = await time_cycles(device, points)
+                print(f"window {window:<3} {cycle * 1000:10.1f} ms / poll cycle")
+
+            del bacnet.readPropertyMultiple
+            await device._disconnect(save_on_disconnect=False)
+
+
+if __name__ == "__main__":
+    asyncio.run(main(float(sys.argv[1]) if len(sys.argv) > 1 else 0.02))
@@ -0,0 +1,91 @@
+#!/usr/bin/env python
+# -*- coding utf-8 -*-
+import asyncio
+from typing import AsyncGenerator
+
+import pytest
+from bacpypes3.primitivedata import Real
+
+"""
+Test the COV first acquisition of a device
+"""
+
+# binary and multistate objects of the test devices refuse COV subscriptions
+REFUSED = {
+    "BI",
+    "BO",
+    "BV",
+    "BI-1",
+    "BO-1",
+    "BV-1",
+    "MSV",
+    "BIG-ALARM",
+    "MSI",
+    "MSO",
+    "MSI-1",
+    "MSO-1",
+}
+
+
+async def _until(condition):
+    """
+    Wait for condition() to be true, 5 sec at most (slow test machines)
+    """
+    for _ in range(100):
+        if condition():
+            return True
+        await asyncio.sleep(0.05)
+    return condition()
+
+
+@pytest.mark.asyncio
+async def test_cov_acquisition(network_and_devices: AsyncGenerator):
+    async for resources in network_and_devices:
+        loop, bacnet, device_app, device30_app, test_device, test_device_30 = resources
+        acquisition = test_device.acquire_by_cov(lifetime=60)
+        assert test_device.properties.acquisition == "cov"
+        # check the subscriptions faster than Task allows
+        acquisition.delay = 0.2
+        assert await _until(
+            lambda: "AV" in acquisition.covered and acquisition.metrics["pending"] == 0
+        )
+
+        pollable = set(test_device.pollable_points_name)
+        covered = acquisition.covered
+        assert "AV" in covered and "AV" not in pollable
+        assert covered.isdisjoint(pollable)
+        # subscriptions refused by the device : polled
+        assert set(acquisition.fallback) == REFUSED
+        assert REFUSED <= pollable
+        for reason in acquisition.fallback.values():
+            assert "subscription failed" in reason
+        # not a COV object type
+        assert "DATETIME_VALUE" in pollable
+
+        notifications = acquisition.metrics["notifications"]
+        # changed on the device side, only a notification brings it
+        local_av = device_app.this_application.app.get_object_name("AV")
+        local_av.presentValue = Real(42.5)
+        assert await _until(
+            lambda: acquisition.metrics["notifications"] > notifications
+        )
+        assert test_device["AV"].lastValue == pytest.approx(42.5)
+
+        # no notification for too long : polled again
+        av = test_device._findPoint("AV", force_read=False)
+        acquisition.check(now=av.cov_task.last_notification + 91)
+        assert "AV" in acquisition.fallback
+        assert "AV" in set(test_device.pollable_points_name)
+        assert not av.cov_registered
+
+        test_device.stop_cov_acquisition()
+        assert test_device.properties.acquisition == "poll"
+        assert test_device.cov_acquisition is None
+        assert len(list(test_device.pollable_points_name)) == len(
+            [p for p in test_device.points if p.properties.name in pollable | covered]
+        )
+        # the cancellations are sent
+        manager = bacnet.cov_manager
+        address = str(test_device.properties.address)
+        assert not manager.subscriptions(address)
+        assert await _until(lambda: address not in manager._pending)
@@ -0,0 +1,274 @@
+#!/usr/bin/env python
+# -*- coding utf-8 -*-
+import asyncio
+from types import SimpleNamespace
+from typing import AsyncGenerator
+
+import pytest
+from bacpypes3.apdu import APDU, APCISequence, SubscribeCOVRequest
+from bacpypes3.basetypes import PropertyIdentifier, ServicesSupported
+from bacpypes3.constructeddata import Any
+from bacpypes3.errors import ServicesError
+from bacpypes3.pdu import Address
+from bacpypes3.primitivedata import ObjectIdentifier, Real
+
+from BAC0.core.io.COVMultiple import (
+    COVNotificationMultipleList,
+    COVNotificationMultipleValue,
+    ConfirmedCOVNotificationMultipleRequest,
+    SubscribeCOVPropertyMultipleRequest,
+    UnconfirmedCOVNotificationMultipleRequest,
+)
+from BAC0.core.io.IOExceptions import COVSubscriptionLimit
+from BAC0.tasks.COVManager import COVManager
+
+"""
+Test the COV subscriptions manager
+"""
+
+
+def _round_trip(request):
+    request.apduInvokeID = 1
+    request.apduSeg = False
+    request.apduMor = False
+    request.apduSA = True
+    request.apduMaxSegs = 0
+    request.apduMaxResp = 5
+    return APCISequence.decode(APDU.decode(request.encode().encode()))
+
+
+class App:
+    """
+    Application answering the requests, SubscribeCOVPropertyMultiple refused
+    if refuse_multiple
+    """
+
+    def __init__(self, refuse_multiple=False):
+        self._cov_contexts = {}
+        self.requests = []
+        self.refuse_multiple = refuse_multiple
+        # set by default, clear it to hold the answers
+        self.answer = asyncio.Event()
+        self.answer.set()
+
+    async def request(self, request):
+        self.requests.append(request)
+        await self.answer.wait()
+        if self.refuse_multiple and isinstance(
+            request, SubscribeCOVPropertyMultipleRequest
+        ):
+            raise ServicesError(errorCode="serviceRequestDenied")
+
+
+class Network:
+    database = None
+
+    def __init__(self, app):
+        self.this_application = SimpleNamespace(app=app)
+
+
+@pytest.fixture
+def device(fake_device):
+    """
+    Device 2:5 supporting SubscribeCOVPropertyMultiple, its application is
+    device.properties.network.this_application.app
+    """
+    services = [0] * 48
+    services[ServicesSupported.subscribeCOV] = 1
+    services[ServicesSupported.subscribeCOVPropertyMultiple] = 1
+    return fake_device(
+        name="fake",
+        address="2:5",
+        vendor_id=0,
+        network=Network(App()),
+        pss=SimpleNamespace(value=services),
+    )
+
+
+def _av(device, instance):
+    return device.point(f"AV-{instance}", "analogValue", address=instance)
+
+
+async def _requests(app, count):
+    """
+    Wait for the manager to send count requests (the test machine can be slow)
+    """
+    for _ in range(100):
+        if len(app.requests) >= count:
+            break
+        await asyncio.sleep(0.05)
+    await asyncio.sleep(0.05)
+
+
+def test_cov_multiple_requests_encoding():
+    request = _round_trip(
+        SubscribeCOVPropertyMultipleRequest(
+            subscriberProcessIdentifier=7,
+            issueConfirmedNotifications=False,
+            lifetime=300,
+            listOfCOVSubscriptionSpecifications=[],
+        )
+    )
+    assert isinstance(request, SubscribeCOVPropertyMultipleRequest)
+    assert request.lifetime == 300
+
+    notification = _round_trip(
+        ConfirmedCOVNotificationMultipleRequest(
+            subscriberProcessIdentifier=7,
+            initiatingDeviceIdentifier=ObjectIdentifier("device:5"),
+            timeRemaining=120,
+            listOfCOVNotifications=[
+                COVNotificationMultipleList(
+                    monitoredObjectIdentifier=ObjectIdentifier("analogValue:1"),
+                    listOfValues=[
+                        COVNotificationMultipleValue(
+                            propertyIdentifier=PropertyIdentifier.presentValue,
+                            value=Any(Real(21.5)),
+                        )
+                    ],
+                )
+            ],
+        )
+    )
+    assert isinstance(notification, ConfirmedCOVNotificationMultipleRequest)
+    values = notification.listOfCOVNotifications[0].listOfValues
+    assert values[0].value.cast_out(Real) == 21.5
+
+
+@pytest.mark.asyncio
+async def test_cov_manager_batches_and_limits(device):
+    network = device.properties.network
+    app = network.this_application.app
+    manager = COVManager(network, max_per_device=20, batch_size=16)
+    points = [_av(device, instance) for instance in range(21)]
+    subs = [manager.subscribe(point, lifetime=300) for point in points]
+    # over the limit
+    assert isinstance(subs[-1].error, COVSubscriptionLimit)
+    await _requests(app, 2)
+    # 20 subscriptions in 2 SubscribeCOVPropertyMultiple requests
+    assert len(app.requests) == 2
+    assert all(sub.active for sub in subs[:20])
+    assert len({sub.process_identifier for sub in subs[:20]}) == 1
+
+    # notifications for several objects in one request
+    apdu = UnconfirmedCOVNotificationMultipleRequest(
+        subscriberProcessIdentifier=subs[0].process_identifier,
+        initiatingDeviceIdentifier=ObjectIdentifier("device:5"),
+        timeRemaining=300,
+        listOfCOVNotifications=[
+            COVNotificationMultipleList(
+                monitoredObjectIdentifier=sub.monitored_object_identifier,
+                listOfValues=[
+                    COVNotificationMultipleValue(
+                        propertyIdentifier=PropertyIdentifier.presentValue,
+                        value=Any(Real(20.0 + index)),
+                    )
+                ],
+            )
+            for index, sub in enumerate(subs[:3])
+        ],
+    )
+    apdu.pduSource = Address("2:5")
+    await app.do_UnconfirmedCOVNotificationMultipleRequest(apdu)
+    assert [point.lastValue for point in points[:4]] == [20.0, 21.0, 22.0, None]
+    metrics = manager.metrics
+    assert metrics["active"] == 20
+    assert metrics["notifications"] == 3
+    assert metrics["devices"]["2:5"]["multiple"]
+    assert metrics["notifications_per_second"] == 3 / manager.window
+
+    # renewals spread between 50 % and 80 % of the lifetime
+    renew_at = sorted(when for when, _, _ in manager._renewals)
+    now = renew_at[0] - 0.5 * 300
+    assert renew_at[-1] - now <= 0.8 * 300 + 1
+    assert renew_at[-1] - renew_at[0] > 60
+    assert manager.renew_due(now + 0.65 * 300) < 20
+    assert manager.renew_due(now + 300) > 0
+    await _requests(app, 4)
+    assert len(app.requests) == 4
+    assert manager.renewals == 20
+    assert manager._renewals
+
+    subs[0].stop()
+    assert not points[0].cov_registered
+    await manager.close()
+    assert manager.metrics["subscriptions"] == 0
+
+
+@pytest.mark.asyncio
+async def test_cov_manager_multiple_refused(device):
+    network = device.properties.network
+    app = network.this_application.app
+    app.refuse_multiple = True
+    manager = COVManager(network, max_requests_per_device=2)
+    subs = [manager.subscribe(_av(device, instance)) for instance in range(5)]
+    await _requests(app, 6)
+    # one refused request then one SubscribeCOV per point
+    assert isinstance(app.requests[0], SubscribeCOVPropertyMultipleRequest)
+    assert all(isinstance(each, SubscribeCOVRequest) for each in app.requests[1:])
+    assert len(app.requests) == 6
+    assert all(sub.active and not sub.multiple for sub in subs)
+    assert len(app._cov_contexts) == 5
+    await manager.close()
+    assert not app._cov_contexts
+    # the devices are told
+    cancels = app.requests[6:]
+    assert len(cancels) == 5
+    assert all(isinstance(each, SubscribeCOVRequest) for each in cancels)
+    assert all(each.lifetime is None for each in cancels)
+
+    # a device that doesn't answer doesn't block close()
+    manager = COVManager(network)
+    app.answer.clear()
+    sub = manager.subscribe(_av(device, 5))
+    await asyncio.wait_for(manager.close(timeout=0.1), 1)
+    assert sub.cancelled and not manager._senders
+
+
+@pytest.mark.asyncio
+async def test_cov_manager_cancel_while_subscribing(device):
+    network = device.properties.network
+    app = network.this_application.app
+    manager = COVManager(network)
+    app.answer.clear()
+    sub = manager.subscribe(_av(device, 1), lifetime=0)
+    await _requests(app, 1)
+    sub.stop()
+    app.answer.set()
+    # the device accepted the subscription, it is cancelled right away
+    await _requests(app, 2)
+    assert len(app.requests) == 2
+    assert app.requests[1].lifetime is None
+    assert not sub.active
+    await manager.close()
+    assert len(app.requests) == 2
+
+
+@pytest.mark.asyncio
+async def test_cov_manager_subscriptions(network_and_devices: AsyncGenerator):
+    async for resources in network_and_devices:
+        loop, bacnet, device_app, device30_app, test_device, test_device_30 = resources
+        manager = bacnet.cov_manager
+        av = test_device["AV"]
+        await av.subscribe_cov(lifetime=60)
+        for _ in range(50):
+            if av.cov_task.active:
+                break
+            await asyncio.sleep(0.1)
+        assert av.cov_task.active
+        assert av in [sub.point for sub in manager.subscriptions()]
+        await asyncio.sleep(0.2)
+        # the device notifies the value when the subscription is made
+        notifications = av.cov_task.notifications
+
+        device_app.this_application.app.get_object_name("AV").presentValue = Real(42.5)
+        for _ in range(50):
+            if av.cov_task.notifications > notifications:
+                break
+            await asyncio.sleep(0.1)
+        assert av.lastValue == 42.5
+        assert manager.metrics["notifications_per_second"] > 0
+
+        await av.cancel_cov()
+        assert not av.cov_registered
+        device_app.this_application.app.get_object_name("AV").presentValue = Real(79.9)
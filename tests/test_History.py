@@ -0,0 +1,118 @@
+#!/usr/bin/env python
+# -*- coding utf-8 -*-
+import math
+
+import pytest
+
+from BAC0.core.devices.History import HistoryBuffer, HistorySeries
+
+"""
+Test the history buffer of points
+"""
+
+
+def test_HistoryBuffer_ring():
+    history = HistoryBuffer(kind="float", size=3)
+    for i in range(5):
+        history.append(i, timestamp=i)
+    assert len(history) == 3
+    assert list(history.timestamps()) == [2, 3, 4]
+    assert history.values() == [2.0, 3.0, 4.0]
+    assert history.last_value() == 4.0
+    assert history.last_timestamp() == 4
+
+    history.resize(2)
+    assert history.values() == [3.0, 4.0]
+    history.resize(None)
+    history.append(None, timestamp=5)
+    assert history.last_value() is None
+    assert math.isnan(history.values()[-1])
+
+
+def test_HistoryBuffer_typed_values():
+    history = HistoryBuffer(kind="int", size=10)
+    history.append(1, timestamp=1)
+    history.append(None, timestamp=2)
+    assert history.values() == [1, None]
+    assert history.last_value() is None
+
+    history.append("not a number", timestamp=3)
+    assert history.kind == "object"
+    assert history.values() == [1, None, "not a number"]
+
+
+def test_HistoryBuffer_last_valid():
+    history = HistoryBuffer(kind="float", size=2)
+    assert history.last_valid() == (None, None)
+    history.append(1.5, timestamp=1)
+    history.append(None, timestamp=2)
+    assert history.last_valid() == (1, 1.5)
+    history.append(None, timestamp=3)
+    assert history.last_valid() == (None, None)
+
+
+def test_HistorySeries_incremental():
+    history = HistoryBuffer(kind="float", size=3)
+    view = HistorySeries(history)
+    history.append(1, timestamp=1)
+    series = view.get()
+    assert view.get().tolist() == [1.0]
+    history.append(2, timestamp=2)
+    history.append(3, timestamp=3)
+    history.append(4, timestamp=4)
+    assert view.get().tolist() == [2.0, 3.0, 4.0]
+    # series handed out before are not changed, and can't change the cache
+    assert series.tolist() == [1.0]
+    with pytest.raises(ValueError):
+        series.iloc[0] = 10.0
+    history.resize(2)
+    assert view.get().tolist() == [3.0, 4.0]
+    history.clear()
+    history.append(5, timestamp=5)
+    assert view.get().tolist() == [5.0]
+
+
+def test_HistorySeries_views():
+    history = HistoryBuffer(kind="float", size=100)
+    view = HistorySeries(history)
+    rebuilds = []
+    rebuild = view._rebuild
+    view._rebuild = lambda: rebuilds.append(1) or rebuild()
+    for i in range(1000):
+        history.append(i, timestamp=i)
+        series = view.get()
+        assert len(series) == min(i + 1, 100)
+        assert series.iloc[-1] == i
+        assert series.index[-1].value == i
+    # the arrays are rebuilt once every len(history) samples at most, other
+    # calls only write the new samples and slice
+    assert len(rebuilds) <= 12
+    assert view.get().to_numpy().base is not None
+    # a state text history keeps the converted values
+    states = HistoryBuffer(kind="int", size=10)
+    texts = HistorySeries(states, convert=lambda code: f"state{code}")
+    states.append(1, timestamp=1)
+    states.append(2, timestamp=2)
+    assert texts.get().tolist() == ["state1", "state2"]
+    states.append(None, timestamp=3)
+    assert texts.get().tolist() == ["state1", "state2", "stateNone"]
+
+
+@pytest.mark.asyncio
+async def test_point_history(network_and_devices):
+    async for resources in network_and_devices:
+        loop, bacnet, device_app, device30_app, test_device, test_device_30 = resources
+        for name in ("AV", "BO", "MSV"):
+            point = test_device[name]
+            point.clear_history()
+            point.properties.history_size = 2
+            for _ in range(3):
+                await point.value
+                point._cache["_previous_read"] = (None, None)
+            history = point.history
+            assert len(history) == 2
+            assert history.index.is_monotonic_increasing
+            assert history.iloc[-1] == point.lastValue
+            point.properties.history_size = None
+        assert test_device["BO"].lastValue in ("0: inactive", "1: active")
+        assert test_device["MSV"].lastValue.startswith("1: ")
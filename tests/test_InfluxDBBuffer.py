@@ -0,0 +1,112 @@
+#!/usr/bin/env python
+# -*- coding utf-8 -*-
+import asyncio
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+
+influxdb = pytest.importorskip("BAC0.db.influxdb")
+
+"""
+Test the InfluxDB write buffer against a local HTTP stand-in
+"""
+
+
+class StandIn(BaseHTTPRequestHandler):
+    def do_POST(self):
+        body = self.rfile.read(int(self.headers["Content-Length"]))
+        if self.server.up:
+            self.server.lines.extend(body.decode().split("\n"))
+            self.send_response(204)
+        else:
+            self.send_response(503)
+        self.send_header("Content-Length", "0")
+        self.end_headers()
+
+    def log_message(self, *args):
+        pass
+
+
+@pytest.fixture
+def server(monkeypatch):
+    server = ThreadingHTTPServer(("127.0.0.1", 0), StandIn)
+    server.up = False
+    server.lines = []
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    monkeypatch.setenv("INFLUXDB_V2_URL", f"http://127.0.0.1:{server.server_port}")
+    monkeypatch.setenv("INFLUXDB_V2_ORG", "BAC0")
+    monkeypatch.setenv("INFLUXDB_V2_TOKEN", "token")
+    yield server
+    server.shutdown()
+    server.server_close()
+
+
+def test_influxdb_buffer_drop_and_backoff(server, fake_device):
+    db = influxdb.InfluxDB(
+        {"bucket": "test", "buffer_size": 10, "retry_interval": 1_000}
+    )
+    point = fake_device().point("Temp")
+    for i in range(25):
+        db.add_sample(point, float(i), i)
+    assert len(db.buffer) <= 10
+    assert db.dropped == 25 - len(db.buffer)
+
+    assert asyncio.run(db.write_points_lastvalue_to_db([])) is False
+    assert db.failures == 1
+    assert 0 < db.metrics["next_attempt_in"] <= 1
+    # delayed, no request sent
+    server.up = True
+    assert asyncio.run(db.write_points_lastvalue_to_db([])) is False
+    assert db.failures == 1
+
+    db._next_attempt = 0
+    assert asyncio.run(db.write_points_lastvalue_to_db([])) is True
+    assert db.failures == 0
+    assert len(db.buffer) == 0
+    assert len(server.lines) == 25 - db.dropped
+    assert server.lines[-1].endswith(" 24")
+
+
+def test_influxdb_buffer_spool_replay(server, tmp_path, fake_device):
+    spool = tmp_path / "spool.lp"
+    db = influxdb.InfluxDB(
+        {
+            "bucket": "test",
+            "buffer_size": 10,
+            "overflow": "spool",
+            "spool_file": str(spool),
+            "replay_batch_size": 4,
+        }
+    )
+    point = fake_device().point("Temp")
+    for i in range(25):
+        db.add_sample(point, float(i), i)
+    assert db.dropped == 0
+    assert db.spooled + len(db.buffer) == 25
+    assert spool.exists()
+
+    server.up = True
+    assert asyncio.run(db.write_points_lastvalue_to_db([])) is True
+    assert not spool.exists()
+    assert db.metrics["spool_bytes"] == 0
+    assert sorted(int(line.rsplit(" ", 1)[1]) for line in server.lines) == list(
+        range(25)
+    )
+
+
+def test_influxdb_buffer_bad_sample(server, fake_device):
+    db = influxdb.InfluxDB({"bucket": "test", "buffer_size": 10})
+    point = fake_device().point("Temp")
+    db.add_sample(point, 1.0, 1)
+    db.add_sample(point, "not a number", 2)
+    db.add_sample(point, 3.0, 3)
+
+    server.up = True
+    assert asyncio.run(db.write_points_lastvalue_to_db([])) is True
+    assert len(db.buffer) == 0
+    assert [line.rsplit(" ", 1)[1] for line in server.lines] == ["1", "3"]
+    db.add_sample(point, 4.0, 4)
+    assert asyncio.run(db.write_points_lastvalue_to_db([])) is True
+    assert server.lines[-1].endswith(" 4")
@@ -0,0 +1,77 @@
+#!/usr/bin/env python
+# -*- coding utf-8 -*-
+from BAC0.core.devices.Points import BooleanPoint, EnumPoint
+from BAC0.core.devices.Virtuals import VirtualPoint
+from BAC0.db.lineprotocol import LineProtocolBuffer, PointSeries
+
+"""
+Test the InfluxDB line protocol buffer
+"""
+
+
+def test_line_protocol_encoding(fake_device):
+    device = fake_device(name="My device")
+    temp = VirtualPoint(
+        "Room temp", device=device, description="Temp, room", units="degreesCelsius"
+    )
+    mode = EnumPoint(
+        device=device,
+        pointType="multiStateValue",
+        pointAddress=1,
+        pointName="Mode",
+        description="Mode",
+        units_state=["Off", "On"],
+    )
+    buffer = LineProtocolBuffer()
+    buffer.append(temp, 21.5, 1_000)
+    buffer.append(mode, 2, 2_000)
+    buffer.append(mode, None, 3_000)
+    assert len(buffer) == 3
+
+    lines, count = buffer.encode()
+    assert count == 3
+    temp_line, mode_line = lines.split("\n")
+    address = temp.properties.address
+    assert temp_line == (
+        f"Device_5/analogVirtual:{address},description=Temp\\,\\ room,"
+        f"device=My\\ device,device_id=5,name=My\\ device/Room\\ temp,"
+        f"object=analogVirtual:{address},object_name=Room\\ temp,"
+        "units_state=degrees-celsius "
+        'value=21.5,string_value="21.500 degrees-celsius" 1000'
+    )
+    assert mode_line.startswith("Device_5/multiStateValue:1,")
+    assert mode_line.endswith(' value=2i,string_value="On" 2000')
+
+    buffer.discard(2)
+    assert len(buffer) == 1
+    buffer.discard(count - 2)
+    assert len(buffer) == 0
+
+
+def test_line_protocol_static_tags_cached(fake_device):
+    device = fake_device(name="My device")
+    switch = BooleanPoint(
+        device=device,
+        pointType="binaryValue",
+        pointAddress=3,
+        pointName="Switch",
+        description="Switch",
+        units_state=["Off", "On"],
+    )
+    series = PointSeries.of(switch)
+    assert PointSeries.of(switch) is series
+    assert series.fields(0) == 'value=0i,string_value="inactive"'
+
+    switch.tag("site", "north")
+    assert PointSeries.of(switch) is not series
+    assert ",site=north" in PointSeries.of(switch).prefix
+    assert switch.tags == [("site", "north")]
+    other = BooleanPoint(
+        device=device,
+        pointType="binaryValue",
+        pointAddress=4,
+        pointName="Other",
+        description="Other",
+        units_state=["Off", "On"],
+    )
+    assert other.tags == []
@@ -0,0 +1,54 @@
+#!/usr/bin/env python
+# -*- coding utf-8 -*-
+import logging
+
+from BAC0.core.utils.notes import _handlers_threshold, note_and_log
+
+"""
+Test the level gating of note_and_log
+"""
+
+
+class Collect(logging.Handler):
+    def __init__(self):
+        logging.Handler.__init__(self, level=logging.DEBUG)
+        self.messages = []
+
+    def emit(self, record):
+        self.messages.append(record.getMessage())
+
+
+@note_and_log
+class Logged:
+    pass
+
+
+def test_handler_added_after_import():
+    logged = Logged()
+    parent = logging.getLogger("BAC0_Root")
+    # only the handlers of BAC0, not the ones of the test runner
+    levels = [(handler, handler.level) for handler in Logged._log.handlers]
+    propagate, parent.propagate = parent.propagate, False
+    handler = Collect()
+    try:
+        for each, level in levels:
+            each.setLevel(max(level, logging.INFO))
+        assert not logged.log_enabled("debug")
+        parent.addHandler(handler)
+        assert logged.log_enabled("debug")
+        logged.log("Read %s", "AV-1", level="debug")
+        assert any(message.endswith("Read AV-1") for message in handler.messages)
+        parent.removeHandler(handler)
+        assert not logged.log_enabled("debug")
+    finally:
+        parent.removeHandler(handler)
+        parent.propagate = propagate
+        for each, level in levels:
+            each.setLevel(level)
+
+
+def test_no_handler_uses_last_resort():
+    logger = logging.getLogger("BAC0_test_no_handler")
+    logger.propagate = False
+    assert _handlers_threshold(logger) == logging.lastResort.level
+    assert _handlers_threshold(logger) <= logging.WARNING
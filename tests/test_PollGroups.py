@@ -0,0 +1,72 @@
+#!/usr/bin/env python
+# -*- coding utf-8 -*-
+import pytest
+
+from BAC0.core.io.IOExceptions import WrongParameter
+from BAC0.tasks.PollGroups import PollGroup, PollGroups
+
+"""
+Test the poll groups of a device
+"""
+
+
+@pytest.fixture
+def device(fake_device):
+    device = fake_device()
+    device.point("ZN-T-1", "analogInput")
+    device.point("ZN-T-2", "analogInput")
+    device.point("ZN-SP-1", "analogValue")
+    device.point("ZN-SP-2", "analogValue", tags=[("static", "yes")])
+    device.point("Fan", "binaryOutput")
+    return device
+
+
+def test_poll_group_filters(fake_device):
+    point = fake_device().point("AHU-1 SAT", "analogInput", tags=[("zone", "north")])
+    assert PollGroup("a", 5, types=["analogInput"], names="SAT$").matches(point)
+    assert PollGroup("b", 5, tags=["zone"]).matches(point)
+    assert PollGroup("c", 5, tags=[("zone", "north")]).matches(point)
+    assert not PollGroup("d", 5, tags=[("zone", "south")]).matches(point)
+    assert not PollGroup("e", 5, types=["analogValue"]).matches(point)
+    assert PollGroup("f", 5, types=["analog-input"]).matches(point)
+    with pytest.raises(WrongParameter):
+        PollGroup("g", 0)
+    with pytest.raises(WrongParameter):
+        PollGroup("h", 5, types=["analogue"])
+
+
+def test_poll_groups_due_points(device):
+    groups = PollGroups()
+    groups.add(PollGroup("temperatures", 5, names="ZN-T"))
+    groups.add(PollGroup("static", 3600, types=["analogValue"]))
+    assert groups.members(device) == {
+        "temperatures": ["ZN-T-1", "ZN-T-2"],
+        "static": ["ZN-SP-1", "ZN-SP-2"],
+        None: ["Fan"],
+    }
+    # device delay 30 sec
+    tick = groups.tick(30)
+    assert tick == 5
+
+    reads = []
+    for second in range(0, 3600 + 1, tick):
+        reads.append(groups.due(device, 30, tick, now=1000.0 + second))
+    # everything on the first run, shared requests
+    assert reads[0] == ["ZN-T-1", "ZN-T-2", "ZN-SP-1", "ZN-SP-2", "Fan"]
+    assert reads[1] == ["ZN-T-1", "ZN-T-2"]
+    assert reads[6] == ["ZN-T-1", "ZN-T-2", "Fan"]
+    assert groups.last_due == ["temperatures", "static", None]
+    points_read = sum(len(names) for names in reads[:-1])
+    # 720 * 2 temperatures + 120 * 1 fan + 2 setpoints, instead of 720 * 5
+    assert points_read == 1440 + 120 + 2
+
+    # jitter of the task doesn't skip a read
+    assert groups.due(device, 30, tick, now=1000.0 + 3605.4) == ["ZN-T-1", "ZN-T-2"]
+    assert groups.due(device, 30, tick, now=1000.0 + 3609.6) == ["ZN-T-1", "ZN-T-2"]
+
+    groups.remove("static")
+    assert groups.members(device)[None] == ["ZN-SP-1", "ZN-SP-2", "Fan"]
+    assert groups.tick(30) == 5
+    with pytest.raises(WrongParameter):
+        groups.remove("static")
+    assert PollGroups().tick(7.5) == 7.5
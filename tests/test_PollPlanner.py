@@ -0,0 +1,78 @@
+#!/usr/bin/env python
+# -*- coding utf-8 -*-
+import pytest
+
+from BAC0.tasks.PollPlanner import PollPlanner
+
+"""
+Test the phase spreading of device polls
+"""
+
+
+class Network:
+    """
+    Networks 2 and 3 behind the same router
+    """
+
+    discoveredDevices = {
+        "device,10": {"network_number": {7}},
+        "device,11": {"network_number": {None, 5}},
+        "device,12": {"network_number": {None}},
+    }
+
+    def _trunk(self, address, network=None):
+        network = address.addrNet if network is None else network
+        if network in (2, 3):
+            return ("router", "10.0.0.1")
+        return ("network", network)
+
+
+def _gaps(offsets, period):
+    offsets = sorted(offsets)
+    return [b - a for a, b in zip(offsets, offsets[1:] + [offsets[0] + period])]
+
+
+def test_poll_phases_spread_by_network(fake_device):
+    planner = PollPlanner(resolution=0.5)
+    offsets = {2: [], 3: []}
+    for mac in range(8):
+        for network in (2, 3):
+            key = (network, mac)
+            device = fake_device(address=f"{network}:{mac}")
+            offsets[network].append(planner.plan(key, device, 60))
+    for network in (2, 3):
+        assert offsets[network][0] < 0.5
+        # 8 polls in 60 sec : evenly spread
+        assert min(_gaps(offsets[network], 60)) == pytest.approx(7.5, abs=0.01)
+    assert planner.metrics["trunks"][("network", 2)]["planned_peak"] == 1
+
+    # a released phase is reused
+    free = offsets[2][3]
+    planner.release((2, 3))
+    assert planner.plan((2, 3), fake_device(address="2:3"), 60) == pytest.approx(
+        free, abs=0.01
+    )
+
+
+def test_poll_phases_grouped_by_router(fake_device):
+    network = Network()
+    planner = PollPlanner(network)
+    offsets = [
+        planner.plan(i, fake_device(address=f"{2 + i % 2}:{i}"), 60, weight=2)
+        for i in range(12)
+    ]
+    # placed one at a time : at least half of the even spacing (5 sec)
+    assert min(_gaps(offsets, 60)) >= 2.5
+    assert list(planner.metrics["trunks"]) == [("router", "10.0.0.1")]
+    # network number of a local device found in discoveredDevices
+    for device_id, network_number in ((10, 7), (11, 5), (12, None)):
+        device = fake_device(address=f"192.168.1.{device_id}", device_id=device_id)
+        assert planner.trunk(device) == ("network", network_number)
+
+
+def test_peak_requests_per_second():
+    planner = PollPlanner()
+    for _ in range(5):
+        planner.record(2)
+    planner.record(None, requests=3)
+    assert planner.peak_requests_per_second == {2: 5, None: 3}
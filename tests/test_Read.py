@@ -1,7 +1,12 @@
 #!/usr/BIn/env python
 # -*- coding utf-8 -*-
+import asyncio
 from typing import AsyncGenerator
 import pytest
+from bacpypes3.basetypes import PropertyIdentifier
+from bacpypes3.primitivedata import ObjectIdentifier
+
+from BAC0.core.io.IOExceptions import SegmentationNotSupported
 
 """
 Test Bacnet communication with another device
@@ -49,3 +54,205 @@ async def test_ReadBinary(network_and_devices: AsyncGenerator):
 
         assert test_device["BO"] == BINARY_TEST_STATE_STR2
         assert test_device["BO-1"] == BINARY_TEST_STATE_BOOL
+
+
+@pytest.mark.asyncio
+async def test_ReadMultiple_uses_cached_plan(network_and_devices: AsyncGenerator):
+    async for resources in network_and_devices:
+        loop, bacnet, device_app, device30_app, test_device, test_device_30 = resources
+        points = list(test_device.pollable_points_name)
+        await test_device.read_multiple(points, points_per_request=25)
+        plan = test_device._rpm_plan
+        assert plan is not None
+        assert sum(len(batch[1]) for batch in plan.batches) == len(points)
+
+        await test_device.read_multiple(points, points_per_request=25)
+        assert test_device._rpm_plan is plan
+        assert (test_device["AV"].lastValue - CHANGE_DELTA_AV) < TOLERANCE
+
+
+@pytest.mark.asyncio
+async def test_poll_groups(network_and_devices: AsyncGenerator):
+    async for resources in network_and_devices:
+        loop, bacnet, device_app, device30_app, test_device, test_device_30 = resources
+        test_device.add_poll_group("values", 5, types=["analogValue"])
+        task = test_device._polling_task.task
+        assert (task.delay, task.period) == (5, 10)
+        values = test_device.poll_groups.members(test_device)["values"]
+        assert values and all(
+            test_device[name].properties.type == "analogValue" for name in values
+        )
+
+        # a plan for each list of points read
+        await test_device.read_multiple(values)
+        plan = test_device._rpm_plan
+        await test_device.read_multiple(list(test_device.pollable_points_name))
+        await test_device.read_multiple(values)
+        assert test_device._rpm_plan is plan
+
+        test_device.remove_poll_group("values")
+        assert test_device._polling_task.task.delay == 10
+
+
+@pytest.mark.asyncio
+async def test_ReadProperty_typed(network_and_devices: AsyncGenerator):
+    async for resources in network_and_devices:
+        loop, bacnet, device_app, device30_app, test_device, test_device_30 = resources
+        address, object_identifier = test_device["AV"]._object_reference()
+        value = await bacnet.readProperty(
+            address, object_identifier, PropertyIdentifier("presentValue")
+        )
+        assert value == await bacnet.read(
+            f"{test_device.properties.address} analogValue {object_identifier[1]} presentValue"
+        )
+        values = await bacnet.readPropertyMultiple(
+            address,
+            [
+                object_identifier,
+                [PropertyIdentifier("presentValue"), PropertyIdentifier("units")],
+            ],
+        )
+        assert values[0] == value
+        assert len(values) == 2
+
+
+@pytest.mark.asyncio
+async def test_ReadMultiple_adaptive_batch_size(network_and_devices: AsyncGenerator):
+    async for resources in network_and_devices:
+        loop, bacnet, device_app, device30_app, test_device, test_device_30 = resources
+        points = list(test_device.pollable_points_name)
+        read_property_multiple = bacnet.readPropertyMultiple
+        sizes = []
+
+        async def refuse_big_requests(address, parameter_list, **kwargs):
+            if str(address) != test_device.properties.address:
+                return await read_property_multiple(address, parameter_list, **kwargs)
+            # pretend the device can't answer more than 3 objects at once
+            sizes.append(len(parameter_list) // 2)
+            if len(parameter_list) > 6:
+                raise SegmentationNotSupported()
+            return await read_property_multiple(address, parameter_list, **kwargs)
+
+        bacnet.readPropertyMultiple = refuse_big_requests
+        try:
+            test_device["AV"].clear_history()
+            await test_device.read_multiple(points)
+            sizer = await test_device.rpm_batch_sizer()
+            assert sizer.ceiling < 25
+            assert len(test_device["AV"].history) == 1
+            # next cycle uses the reduced size, no refused request
+            sizes.clear()
+            await test_device.read_multiple(points)
+            assert max(sizes) <= 3
+            assert sizer.size > 1
+        finally:
+            del bacnet.readPropertyMultiple
+
+
+@pytest.mark.asyncio
+async def test_ReadMultiple_window(network_and_devices: AsyncGenerator):
+    async for resources in network_and_devices:
+        loop, bacnet, device_app, device30_app, test_device, test_device_30 = resources
+        points = list(test_device.pollable_points_name)
+        read_property_multiple = bacnet.readPropertyMultiple
+        in_flight = []
+        max_in_flight = []
+
+        async def slow_requests(address, parameter_list, **kwargs):
+            if str(address) != test_device.properties.address:
+                # other devices of the fixture may be polled meanwhile
+                return await read_property_multiple(address, parameter_list, **kwargs)
+            in_flight.append(1)
+            max_in_flight.append(len(in_flight))
+            await asyncio.sleep(0.01)
+            in_flight.pop()
+            return await read_property_multiple(address, parameter_list, **kwargs)
+
+        bacnet.readPropertyMultiple = slow_requests
+        test_device.properties.rpm_window = 2
+        try:
+            test_device["AV"].clear_history()
+            await test_device.read_multiple(points, points_per_request=2)
+            assert max(max_in_flight) == 2
+            assert len(test_device["AV"].history) == 1
+        finally:
+            del bacnet.readPropertyMultiple
+
+
+@pytest.mark.asyncio
+async def test_ReadPropertyMultiple_errors(network_and_devices: AsyncGenerator):
+    async for resources in network_and_devices:
+        loop, bacnet, device_app, device30_app, test_device, test_device_30 = resources
+        address, object_identifier = test_device["AV"]._object_reference()
+        errors = []
+        values = await bacnet.readPropertyMultiple(
+            address,
+            [
+                ObjectIdentifier("analogValue:9999"),
+                [PropertyIdentifier("presentValue")],
+                object_identifier,
+                [PropertyIdentifier("presentValue")],
+            ],
+            errors=errors,
+        )
+        # good value of the same response is kept
+        assert values[0] is None
+        assert values[1] == await test_device["AV"].value
+        assert len(errors) == 1
+        assert errors[0][0] == ObjectIdentifier("analogValue:9999")
+
+
+@pytest.mark.asyncio
+async def test_ReadProperty_single_who_is(network_and_devices: AsyncGenerator):
+    async for resources in network_and_devices:
+        loop, bacnet, device_app, device30_app, test_device, test_device_30 = resources
+        address, object_identifier = test_device["AV"]._object_reference()
+        app = bacnet.this_application.app
+        cache = app.device_info_cache
+        device_info = cache.address_cache.pop(address)
+        cache.instance_cache.pop(device_info.device_instance)
+        who_is = app.who_is
+        calls = []
+
+        async def counting_who_is(*args, **kwargs):
+            calls.append(kwargs.get("address"))
+            return await who_is(*args, **kwargs)
+
+        app.who_is = counting_who_is
+        try:
+            values = await asyncio.gather(
+                *(
+                    bacnet.readProperty(
+                        address, object_identifier, PropertyIdentifier("presentValue")
+                    )
+                    for _ in range(10)
+                )
+            )
+        finally:
+            del app.who_is
+        assert len(calls) == 1
+        assert len(set(values)) == 1
+
+
+@pytest.mark.asyncio
+async def test_find_point_indexes(network_and_devices: AsyncGenerator):
+    async for resources in network_and_devices:
+        loop, bacnet, device_app, device30_app, test_device, test_device_30 = resources
+        point = test_device["AV"]
+        _type, _address = point.properties.type, point.properties.address
+        assert test_device.find_point(_type, float(_address)) is point
+        assert test_device[(_type, str(_address))] is point
+        assert test_device._lookup_point(ObjectIdentifier((_type, _address))) is point
+        assert test_device._lookup_point("analog-value", _address) is point
+        assert "AV" in test_device
+
+        points = test_device.points
+        try:
+            assert test_device.remove_point("AV") is point
+            assert "AV" not in test_device
+            assert len(test_device) == len(points) - 1
+            with pytest.raises(ValueError):
+                test_device.find_point(_type, _address)
+        finally:
+            test_device.points = points
+        assert test_device._findPoint("AV") is point
@@ -4,12 +4,22 @@
 """
 Test Bacnet communication with another device
 """
+
 import asyncio
 import os.path
+import sqlite3
+import time
+from types import SimpleNamespace
 
+import aiosqlite
+import pandas as pd
 import pytest
 
 import BAC0
+from BAC0.core.devices.Device import Device, DeviceFromDB
+from BAC0.core.devices.Points import NumericPointOffline
+from BAC0.db.sql import SQLHistory, histories_to_df
+from BAC0.db.writer import PersistenceWriter
 
 
 # @pytest.mark.skip(reason="Need more work")
@@ -18,8 +28,8 @@ async def test_SaveToSQL(network_and_devices):
     async for resources in network_and_devices:
         loop, bacnet, device_app, device30_app, test_device, test_device_30 = resources
         # test_device_300 = network_and_devices.test_device_300
-        test_device.save()
-        test_device_30.save(filename="obj30.db")
+        await test_device.save()
+        await test_device_30.save(filename="obj30.db")
         await asyncio.sleep(2)
         # test_device_300.save(filename="obj300")
         assert os.path.isfile("{}.db".format(test_device.properties.db_name))
@@ -43,3 +53,314 @@ async def test_disconnection_of_device(network_and_devices):
         await test_device_30.connect(network=bacnet)
         assert isinstance(test_device, BAC0.core.devices.Device.RPMDeviceConnected)
         assert isinstance(test_device_30, BAC0.core.devices.Device.RPMDeviceConnected)
+
+
+@pytest.mark.asyncio
+async def test_SaveToSQL_incremental(network_and_devices, tmp_path):
+    async for resources in network_and_devices:
+        loop, bacnet, device_app, device30_app, test_device, test_device_30 = resources
+        db_name = str(tmp_path / "incremental")
+        await test_device["AV"].value
+        await test_device.save(filename=db_name)
+        await asyncio.sleep(1.1)
+        test_device["AV"]._cache["_previous_read"] = (None, None)
+        await test_device["AV"].value
+        await test_device.save(filename=db_name)
+
+        with sqlite3.connect(f"{db_name}.db") as con:
+            rows = con.execute('SELECT "index" FROM history').fetchall()
+            (last,) = con.execute(
+                "SELECT value FROM metadata WHERE name = 'last_timestamp'"
+            ).fetchone()
+        index = [row[0] for row in rows]
+        assert len(index) == len(set(index))
+        assert last == max(index)
+        assert test_device._sql_last_saved[db_name] is not None
+
+
+@pytest.mark.asyncio
+async def test_legacy_history_across_utc_offsets(network_and_devices, tmp_path):
+    async for resources in network_and_devices:
+        loop, bacnet, device_app, device30_app, test_device, test_device_30 = resources
+        db_name = str(tmp_path / "legacy")
+        # end of DST : the second sample is later but sorts first as text
+        with sqlite3.connect(f"{db_name}.db") as con:
+            con.execute('CREATE TABLE history ("index" TIMESTAMP, "AV" REAL)')
+            con.executemany(
+                "INSERT INTO history VALUES (?, ?)",
+                [
+                    ("2024-11-03 01:30:00-04:00", 1.0),
+                    ("2024-11-03 01:10:00-05:00", 2.0),
+                ],
+            )
+        assert await test_device.value_from_sql(db_name, "AV") == 2.0
+        his = await test_device.his_from_sql(db_name, "AV")
+        assert his.tolist() == [1.0, 2.0]
+        async with aiosqlite.connect(f"{db_name}.db") as con:
+            last = await test_device._last_saved_timestamp(con, db_name)
+        test_device._sql_last_saved.pop(db_name, None)
+        assert last == pd.Timestamp("2024-11-03 06:10:00+00:00")
+
+
+@pytest.mark.asyncio
+async def test_legacy_history_duplicated_rows(tmp_path):
+    db_name = str(tmp_path / "duplicated")
+    # older saves appended the last saved row again
+    with sqlite3.connect(f"{db_name}.db") as con:
+        con.execute('CREATE TABLE history ("index" TIMESTAMP, "AV" REAL)')
+        con.executemany(
+            "INSERT INTO history VALUES (?, ?)",
+            [
+                ("2024-01-01 00:00:00+00:00", 1.0),
+                ("2024-01-01 00:00:10+00:00", 2.0),
+                ("2024-01-01 00:00:10+00:00", 2.0),
+            ],
+        )
+    async with aiosqlite.connect(f"{db_name}.db") as con:
+        history = await SQLHistory.load(con)
+    timestamp, value = history.last("AV")
+    assert value == 2.0
+    assert timestamp == pd.Timestamp("2024-01-01 00:00:10+00:00")
+    assert history.series("AV").tolist() == [1.0, 2.0]
+
+
+@pytest.mark.asyncio
+async def test_SaveToSQL_tall_layout(network_and_devices, tmp_path):
+    async for resources in network_and_devices:
+        loop, bacnet, device_app, device30_app, test_device, test_device_30 = resources
+        db_name = str(tmp_path / "tall")
+        test_device.properties.db_layout = "tall"
+        try:
+            for name in ("AV", "BO"):
+                await test_device[name].value
+            await test_device.save(filename=db_name)
+            await test_device.save(filename=db_name)
+            await test_device["AV"].value
+            await test_device.save(filename=db_name)
+        finally:
+            test_device.properties.db_layout = "wide"
+
+        with sqlite3.connect(f"{db_name}.db") as con:
+            (journal_mode,) = con.execute("PRAGMA journal_mode").fetchone()
+            names = [
+                row[0]
+                for row in con.execute("SELECT name FROM points ORDER BY point_id")
+            ]
+        assert journal_mode == "wal"
+        assert "AV" in names
+
+        saved = await test_device.points_from_sql(db_name)
+        assert "AV" in saved and "BO" in saved
+        assert set(saved) <= set(names)
+        his = await test_device.his_from_sql(db_name, "AV")
+        assert len(his) == len(test_device["AV"].history)
+        assert his.iloc[-1] == pytest.approx(test_device["AV"].lastValue)
+        assert await test_device.value_from_sql(db_name, "BO") in (0, 1)
+
+
+@pytest.mark.asyncio
+async def test_SaveToSQL_tall_two_devices(network_and_devices, tmp_path):
+    async for resources in network_and_devices:
+        loop, bacnet, device_app, device30_app, test_device, test_device_30 = resources
+        db_name = str(tmp_path / "shared")
+        devices = (test_device, test_device_30)
+        try:
+            for device in devices:
+                device.properties.db_layout = "tall"
+                device["ZN-T"].clear_history()
+            # device 30 read first, device saved first has newer samples
+            await test_device_30["ZN-T"].value
+            await asyncio.sleep(0.01)
+            await test_device["ZN-T"].value
+            await test_device.save(filename=db_name)
+            # restart : the marks are read from the file
+            for device in devices:
+                device._sql_last_saved.clear()
+            await test_device_30.save(filename=db_name)
+            await test_device["ZN-T"].value
+            test_device._sql_last_saved.clear()
+            await test_device.save(filename=db_name)
+        finally:
+            for device in devices:
+                device.properties.db_layout = "wide"
+
+        with sqlite3.connect(f"{db_name}.db") as con:
+            marks = dict(
+                con.execute(
+                    "SELECT name, value FROM metadata WHERE name LIKE 'last_ts%'"
+                )
+            )
+        for device in devices:
+            his = await device.his_from_sql(db_name, "ZN-T")
+            assert len(his) == len(device["ZN-T"].history) > 0
+        assert set(marks) == {
+            f"last_ts:{device.properties.device_id}" for device in devices
+        }
+
+
+@pytest.mark.asyncio
+async def test_offline_history(network_and_devices, tmp_path):
+    async for resources in network_and_devices:
+        loop, bacnet, device_app, device30_app, test_device, test_device_30 = resources
+        for layout in ("wide", "tall"):
+            db_name = str(tmp_path / layout)
+            test_device.properties.db_layout = layout
+            await test_device["AV"].value
+            await test_device["BO"].value
+            # a point without any sample in the backup
+            test_device["ZN-T"].clear_history()
+            await test_device.save(filename=db_name)
+            test_device.properties.db_layout = "wide"
+
+            assert not os.path.isfile(f"{db_name}.bin")
+            offline = Device(from_backup=f"{db_name}.db")
+            offline.properties.device_id = test_device.properties.device_id
+            await offline.new_state(DeviceFromDB)
+            assert isinstance(offline["AV"], NumericPointOffline)
+            assert offline["AV"].history is offline["AV"].history
+            assert len(offline["AV"].history) > 0
+            assert offline["AV"].lastValue == pytest.approx(test_device["AV"].lastValue)
+            assert offline["BO"].value in (0, 1)
+            assert offline["ZN-T"].lastValue is None
+            assert offline["ZN-T"].lastTimestamp is None
+            assert "ZN-T" in repr(offline["ZN-T"])
+            assert offline["AV"].properties.units_state == str(
+                test_device["AV"].properties.units_state
+            )
+
+
+@pytest.mark.asyncio
+async def test_save_in_background(network_and_devices, tmp_path):
+    async for resources in network_and_devices:
+        loop, bacnet, device_app, device30_app, test_device, test_device_30 = resources
+        db_name = str(tmp_path / "background")
+        await test_device["AV"].value
+        assert test_device.save_in_background(filename=db_name)
+        assert bacnet.persistence.queue_depth == 1
+        await bacnet.persistence.join()
+        metrics = bacnet.persistence.metrics
+        assert metrics["queue_depth"] == 0
+        assert metrics["saved"] == 1
+        assert metrics["last_latency"] >= metrics["last_write_duration"] > 0
+        assert os.path.isfile(f"{db_name}.db")
+        with sqlite3.connect(f"{db_name}.db") as con:
+            names = [row[0] for row in con.execute("SELECT name FROM point_properties")]
+        assert "AV" in names
+
+        # queue full : the save is refused, nothing is cleared
+        writer = PersistenceWriter(maxsize=1)
+        test_device.properties.clear_history_on_save = True
+        try:
+            assert writer.submit(test_device, filename=db_name)
+            await test_device["AV"].value
+            samples = len(test_device["AV"].history)
+            assert not writer.submit(test_device, filename=db_name)
+            assert len(test_device["AV"].history) == samples > 0
+            assert writer.metrics["rejected"] == 1
+        finally:
+            test_device.properties.clear_history_on_save = False
+        await writer.stop()
+        assert writer.metrics["saved"] == 1
+
+
+@pytest.mark.asyncio
+async def test_save_in_background_error(network_and_devices, tmp_path, monkeypatch):
+    async for resources in network_and_devices:
+        loop, bacnet, device_app, device30_app, test_device, test_device_30 = resources
+
+        async def fail(*args, **kwargs):
+            raise sqlite3.OperationalError("disk I/O error")
+
+        monkeypatch.setattr(test_device, "_append_history", fail)
+        writer = PersistenceWriter()
+        await test_device["AV"].value
+        assert writer.submit(test_device, filename=str(tmp_path / "failing"))
+        await writer.join()
+        await writer.stop()
+        assert writer.metrics["errors"] == 1
+        assert writer.metrics["saved"] == 0
+
+
+class Snapshots:
+    """
+    Device giving snapshots taken ages seconds ago
+    """
+
+    def __init__(self, *ages):
+        self.ages = list(ages)
+        self.properties = SimpleNamespace(name="snapshots")
+
+    def _save_snapshot(self, **kwargs):
+        age = self.ages.pop(0)
+        return SimpleNamespace(created=time.monotonic() - age, db_name="snapshots")
+
+    async def _write_snapshot(self, snapshot, executor=None):
+        return True
+
+
+@pytest.mark.asyncio
+async def test_save_in_background_latency():
+    writer = PersistenceWriter()
+    device = Snapshots(3, 1, 1)
+    for _ in range(3):
+        assert writer.submit(device)
+    await writer.stop()
+    metrics = writer.metrics
+    assert metrics["saved"] == 3
+    assert metrics["max_latency"] == pytest.approx(3, abs=0.1)
+    # mean of the three writes
+    assert metrics["average_latency"] == pytest.approx(5 / 3, abs=0.1)
+
+
+def test_histories_to_df_state_codes():
+    index = pd.date_range("2024-01-01", periods=6, freq="500ms", tz="UTC")
+    codes = pd.Series([1, 1, 2, None, 3, 3], index=index)
+    states = {1: "off", 2: "on", 3: "auto"}
+    df = histories_to_df([("MSV", "multiStateValue", codes, states)])
+    assert list(df["MSV"]) == [1, 2, 3]
+    assert list(df["MSV_str"]) == ["off", "on", "auto"]
+    assert df["MSV_str"].dtype == "category"
+
+    df = histories_to_df([("MSV", "multiStateValue", codes, states)], False)
+    assert len(df) == 6
+    assert df["MSV_str"].isna().sum() == 1
+
+
+@pytest.mark.asyncio
+async def test_export_parquet_and_arrow(network_and_devices, tmp_path):
+    pytest.importorskip("pyarrow")
+    from BAC0.db.arrow import device_folder, read_export
+
+    async for resources in network_and_devices:
+        loop, bacnet, device_app, device30_app, test_device, test_device_30 = resources
+        device_id = test_device.properties.device_id
+        for export in ("parquet", "arrow"):
+            root = str(tmp_path / export)
+            await test_device["AV"].value
+            await test_device["BO"].value
+            await test_device.save(filename=root, export=export)
+            await test_device.save(filename=root, export=export)
+            test_device["AV"]._cache["_previous_read"] = (None, None)
+            await test_device["AV"].value
+            await test_device.save(filename=root, export=export)
+
+            folder = device_folder(root, device_id)
+            table = read_export(folder)
+            assert table.schema.field("point").type.value_type == "string"
+            df = table.to_pandas()
+            av = df[df["point"] == "AV"]
+            assert av["ts"].is_unique
+            assert len(av) == len(test_device["AV"].history)
+            assert set(df[df["point"] == "BO"]["string_value"]) <= {
+                "active",
+                "inactive",
+            }
+
+            offline = Device(from_backup=folder)
+            await offline.new_state(DeviceFromDB)
+            assert offline.properties.device_id == device_id
+            assert offline["AV"].lastValue == pytest.approx(test_device["AV"].lastValue)
+            assert offline["BO"].value in (0, 1)
+            assert offline["ZN-T"].lastValue is None
+            assert offline["ZN-T"].lastTimestamp is None
+            assert "ZN-T" in repr(offline["ZN-T"])
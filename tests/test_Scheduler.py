@@ -0,0 +1,85 @@
+#!/usr/bin/env python
+# -*- coding utf-8 -*-
+import asyncio
+
+from BAC0.tasks.Scheduler import Scheduler
+from BAC0.tasks.TaskManager import Task, stopAllTasks
+
+"""
+Test the scheduler running the recurring tasks
+"""
+
+
+class Counter(Task):
+    def __init__(self, delay, duration=0.0, name="counter"):
+        Task.__init__(self, name=name, delay=5)
+        # shorter than what Task allows, to keep the test fast
+        self.delay = delay
+        self.duration = duration
+        self.runs = []
+        self.active = 0
+        self.max_active = 0
+
+    async def task(self):
+        loop = asyncio.get_running_loop()
+        self.runs.append(loop.time())
+        self.active += 1
+        self.max_active = max(self.max_active, self.active)
+        await asyncio.sleep(self.duration)
+        self.active -= 1
+
+
+def test_scheduler_fixed_rate_and_stop():
+    async def main():
+        fast = Counter(0.05)
+        slow = Counter(0.05, duration=0.12, name="slow")
+        fast.start()
+        slow.start()
+        assert fast.id in Task.tasks and fast.id in Task.scheduler
+        await asyncio.sleep(0.52)
+        assert fast.stop() is True
+        assert fast.stop() is None
+        assert fast.id not in Task.scheduler
+        assert fast.done
+        runs = len(fast.runs)
+        await asyncio.sleep(0.15)
+        assert len(fast.runs) == runs
+        await stopAllTasks()
+        # the scheduler loop and the running bodies are over
+        assert asyncio.all_tasks() == {asyncio.current_task()}
+        return fast, slow
+
+    fast, slow = asyncio.run(main())
+    # fixed rate : planned times are start + n * delay, no drift
+    assert 10 <= len(fast.runs) <= 12
+    start = fast.runs[0]
+    for n, run in enumerate(fast.runs):
+        assert abs(run - (start + n * 0.05)) < 0.04
+    # a slow body is never run twice at the same time, late runs are skipped
+    assert slow.max_active == 1
+    assert 3 <= len(slow.runs) <= 5
+    assert Task.scheduler.skipped > 0
+    assert Task.tasks == {}
+
+
+def test_scheduler_concurrency_cap():
+    scheduler = Scheduler(max_concurrency=2)
+
+    async def main():
+        tasks = [Counter(0.05, duration=0.1, name=f"c{i}") for i in range(6)]
+        active = []
+        for task in tasks:
+            scheduler.add(task)
+        for _ in range(10):
+            await asyncio.sleep(0.03)
+            active.append(scheduler.running)
+        for task in tasks:
+            assert scheduler.cancel(task.id)
+        assert not scheduler.cancel(tasks[0].id)
+        assert len(scheduler) == 0
+        await scheduler.stop()
+        return tasks, active
+
+    tasks, active = asyncio.run(main())
+    assert max(active) == 2
+    assert all(task.runs for task in tasks)
@@ -0,0 +1,151 @@
+#!/usr/bin/env python
+# -*- coding utf-8 -*-
+import asyncio
+import csv
+import glob
+import sqlite3
+import time
+
+import pytest
+
+from BAC0.core.io.IOExceptions import WrongParameter
+from BAC0.db.sinks import (
+    FileSink,
+    MemorySink,
+    SinkFanOut,
+    SQLiteSink,
+    sink_from_params,
+)
+
+"""
+Test the time-series sinks
+"""
+
+S = 1_000_000_000
+HOUR = 3600 * S
+
+
+def test_sink_fan_out_with_downsampling_and_filter(fake_points):
+    temp, mode = fake_points
+    fast = MemorySink()
+    slow = MemorySink(interval=60, accept=lambda point: point is temp)
+    sink = sink_from_params([fast, slow])
+    assert isinstance(sink, SinkFanOut)
+    for second in range(0, 150, 10):
+        sink.add_sample(temp, float(second), second * S)
+        sink.add_sample(mode, 1, second * S)
+    assert len(fast.samples) == 30
+    assert [ts // S for _, _, ts in slow.samples] == [0, 60, 120]
+
+    assert asyncio.run(sink.flush()) is True
+    assert fast.flushes == slow.flushes == 1
+    assert sink_from_params([fast]) is fast
+    with pytest.raises(WrongParameter):
+        sink_from_params({"name": "unknown"})
+
+
+def test_sqlite_sink(tmp_path, fake_points):
+    temp, mode = fake_points
+    filename = str(tmp_path / "samples.db")
+    sink = sink_from_params({"name": "sqlite", "filename": filename})
+    assert isinstance(sink, SQLiteSink)
+    sink.add_sample(temp, 21.5, 1 * S)
+    sink.add_sample(mode, 2, 1 * S)
+    asyncio.run(sink.flush())
+    sink.add_sample(temp, 22.0, 2 * S)
+    asyncio.run(sink.close())
+
+    with sqlite3.connect(filename) as con:
+        rows = con.execute(
+            "SELECT p.name, h.ts, h.value, h.string_value "
+            "FROM point_history h JOIN points p USING (point_id) ORDER BY h.ts, p.name"
+        ).fetchall()
+    assert rows == [
+        ("Mode", 1 * S, 2, "On"),
+        ("Temp", 1 * S, 21.5, "21.500 degrees-celsius"),
+        ("Temp", 2 * S, 22.0, "22.000 degrees-celsius"),
+    ]
+
+
+def test_csv_file_sink_rotation(tmp_path, fake_points):
+    temp, _ = fake_points
+    sink = FileSink(folder=str(tmp_path), fmt="csv", rotation=3600, keep=2)
+    for hour in range(3):
+        sink.add_sample(temp, float(hour), hour * HOUR)
+        sink.add_sample(temp, float(hour), hour * HOUR + S)
+        asyncio.run(sink.flush())
+
+    files = sorted(glob.glob(str(tmp_path / "samples-*.csv")))
+    assert [f.rsplit("-", 1)[-1] for f in files] == [
+        "19700101T010000.csv",
+        "19700101T020000.csv",
+    ]
+    with open(files[-1]) as file:
+        rows = list(csv.reader(file))
+    assert rows[0] == ["timestamp", "point", "value", "string_value"]
+    assert len(rows) == 3
+    assert rows[1][1:] == ["5/Temp", "2.0", "2.000 degrees-celsius"]
+
+
+def test_parquet_file_sink(tmp_path, fake_points):
+    pq = pytest.importorskip("pyarrow.parquet")
+    temp, mode = fake_points
+    sink = sink_from_params({"name": "parquet", "folder": str(tmp_path)})
+    sink.add_sample(temp, 21.5, 1 * S)
+    sink.add_sample(mode, 1, 2 * S)
+    asyncio.run(sink.flush())
+    # period is over, one file
+    (filename,) = glob.glob(str(tmp_path / "samples-*.parquet"))
+    table = pq.read_table(filename)
+    assert table.column("value").to_pylist() == [21.5, 1.0]
+    assert table.column("string_value").to_pylist() == [
+        "21.500 degrees-celsius",
+        "Off",
+    ]
+
+
+def test_sinks_bad_sample(tmp_path, fake_points):
+    temp, mode = fake_points
+    filename = str(tmp_path / "samples.db")
+    sink = SinkFanOut([SQLiteSink(filename), FileSink(folder=str(tmp_path))])
+    sink.add_sample(temp, 21.5, 1 * S)
+    sink.add_sample(temp, "not a number", 2 * S)
+    sink.add_sample(mode, "Off", 2 * S)
+    sink.add_sample(temp, 22.0, 3 * S)
+    # dropped before they are queued
+    assert all(len(each._rows) == 2 for each in sink.sinks)
+    assert asyncio.run(sink.flush()) is True
+    assert all(not each._rows for each in sink.sinks)
+    sink.add_sample(temp, 22.5, 4 * S)
+    assert asyncio.run(sink.flush()) is True
+
+    with sqlite3.connect(filename) as con:
+        stamps = [row[0] for row in con.execute("SELECT ts FROM point_history")]
+    assert sorted(stamps) == [1 * S, 3 * S, 4 * S]
+    (csv_file,) = glob.glob(str(tmp_path / "samples-*.csv"))
+    with open(csv_file) as file:
+        assert len(list(csv.reader(file))) == 4
+
+
+def test_parquet_file_sink_error(tmp_path, monkeypatch, fake_points):
+    pytest.importorskip("pyarrow.parquet")
+    from BAC0.db import arrow
+
+    temp, _ = fake_points
+    sink = FileSink(folder=str(tmp_path), fmt="parquet")
+    now = time.time_ns()
+    sink.add_sample(temp, 21.5, 1 * S)
+    sink.add_sample(temp, 22.0, now)
+
+    def fail(*args):
+        raise OSError("disk full")
+
+    monkeypatch.setattr(arrow, "_write_table", fail)
+    for _ in range(2):
+        assert asyncio.run(sink.flush()) is False
+        # each sample is kept once
+        assert sorted(row[2] for row in sink._rows) == [1 * S, now]
+    monkeypatch.undo()
+    assert asyncio.run(sink.flush()) is True
+    assert [row[2] for row in sink._rows] == [now]
+    assert len(glob.glob(str(tmp_path / "samples-*.parquet"))) == 1